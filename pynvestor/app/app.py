@@ -1,14 +1,20 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
 from pynvestor.source.portfolio import Portfolio
 from pynvestor.source.risk import PortfolioRiskManager
 from pynvestor.source.screener import Screener
 from pynvestor.source.optimizer import Optimizer
+from pynvestor.source.what_if import WhatIfSimulator
+from pynvestor.source.live import LiveValuationService
+from pynvestor.source.covariance import load_covariance_source
+from pynvestor.source.var_backtest import ValueAtRiskBacktest
 from pynvestor.source.chart import StockChart, PortfolioChart, ValueAtRiskChart, OptimizerChart
 from pynvestor.source import euronext
+from pynvestor import logger
 
 import numpy as np
 import datetime as dt
 import json
+import queue
 
 # TODO: find a way to format automatically performances
 # TODO: put frames to regroup elements (market news, indices levels, ...)
@@ -36,6 +42,7 @@ def create_app():
 
 app = create_app()
 app.json_encoder = JsonEncoder
+live_valuation = LiveValuationService(interval=5.0)
 
 
 @app.route('/')
@@ -52,12 +59,13 @@ def index():
 @app.route('/portfolio')
 def portfolio():
     ptf_date = request.args.get('ptf_date')
+    account_id = request.args.get('account_id')
     if ptf_date is None:
         ptf_date = 'today'
-        ptf = Portfolio()
+        ptf = Portfolio.cached(account_id=account_id)
     else:
         ptf_date = dt.date.fromisoformat(ptf_date)
-        ptf = Portfolio(dt.datetime(ptf_date.year, ptf_date.month, ptf_date.day))
+        ptf = Portfolio.cached(dt.datetime(ptf_date.year, ptf_date.month, ptf_date.day), account_id=account_id)
     df_ptf = ptf.to_df()
     df_ptf.index.name = 'isin'
     df_ptf.reset_index(inplace=True)
@@ -71,17 +79,75 @@ def portfolio():
                            ptf_chart_data=json.dumps(ptf_chart.chart_data, cls=JsonEncoder))
 
 
+@app.route('/portfolio_stream')
+def portfolio_stream():
+    account_id = request.args.get('account_id')
+    subscription = live_valuation.subscribe(account_id)
+
+    def events():
+        try:
+            yield f"data: {json.dumps(live_valuation.get_valuation(account_id).state(), cls=JsonEncoder)}\n\n"
+            while True:
+                try:
+                    delta = subscription.get(timeout=15)
+                    yield f"data: {json.dumps(delta, cls=JsonEncoder)}\n\n"
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            live_valuation.unsubscribe(account_id, subscription)
+
+    return Response(events(), mimetype='text/event-stream')
+
+
+@app.route('/portfolios')
+def portfolios_valuation():
+    account_ids = request.args.getlist('account_id')
+    ptf_date = request.args.get('ptf_date')
+    if ptf_date is not None:
+        ptf_date = dt.date.fromisoformat(ptf_date)
+        ptf_date = dt.datetime(ptf_date.year, ptf_date.month, ptf_date.day)
+    portfolios = Portfolio.value_portfolios(account_ids, ptf_date)
+    result = [{'account_id': account_id,
+               'market_value': ptf.portfolio_market_value,
+               'cash': ptf.cash,
+               'cash_weight': ptf.cash_weight,
+               'perf': ptf.portfolio_perf,
+               'weights': ptf.stocks_weights} for account_id, ptf in portfolios.items()]
+    return json.dumps(result, cls=JsonEncoder)
+
+
 @app.route('/risk')
 def risk_management():
-    risk_manager = PortfolioRiskManager(0.01)
+    account_id = request.args.get('account_id')
+    var_method = request.args.get('var_method', 'historical')
+    covariance_source = load_covariance_source(request.args.get('covariance', 'ewma'))
+    risk_manager = PortfolioRiskManager(0.01, snapshot=Portfolio.cached(account_id=account_id), var_method=var_method,
+                                        covariance_source=covariance_source)
     var_chart = ValueAtRiskChart(risk_manager.simulated_losses, risk_manager.portfolio_values_at_risk,
                                  risk_manager.portfolio_value_at_risk)
+    # value at risk backtested on the realized net asset values, or on the daily values of the current holdings
+    # when the net asset values history is too short
+    var_backtest = ValueAtRiskBacktest(risk_manager.portfolio_navs, percentile=risk_manager.percentile)
+    var_backtest_values = 'net asset values'
+    if not var_backtest.sufficient_history:
+        logger.log.warning('insufficient net asset values history, backtesting the value at risk on the current '
+                           'holdings values')
+        holdings_values = risk_manager.prices_panel.ffill().dot(risk_manager.holdings.quantity)
+        var_backtest = ValueAtRiskBacktest(holdings_values, percentile=risk_manager.percentile)
+        var_backtest_values = 'current holdings values'
     return render_template('risk_management.html',
-                           names=list(risk_manager.stocks_names.values()),
+                           names=list(risk_manager.holdings.names),
                            correlation_matrix=risk_manager.correlation_matrix,
                            ptf_vol=round(risk_manager.annualized_portfolio_volatility, 4),
                            ptf_sharpe_ratio=round(risk_manager.portfolio_sharpe_ratio, 2),
                            ptf_value_at_risk=round(risk_manager.portfolio_value_at_risk, 2),
+                           ptf_expected_shortfall=round(risk_manager.portfolio_expected_shortfall, 2),
+                           risk_decomposition=risk_manager.risk_decomposition.to_dict(orient='records'),
+                           kupiec_test=var_backtest.kupiec_test,
+                           christoffersen_test=var_backtest.christoffersen_test,
+                           var_backtest_sufficient_history=var_backtest.sufficient_history,
+                           var_backtest_values=var_backtest_values,
+                           var_method=risk_manager.var_method.replace('_', ' '),
                            categories=json.dumps(var_chart.categories, cls=JsonEncoder),
                            var_position=var_chart.var_position,
                            end_position=var_chart.end_position,
@@ -91,38 +157,36 @@ def risk_management():
 @app.route('/optimizer')
 def optimizer():
     risk_free_rate = 0.01
-    optimizer = Optimizer(risk_free_rate)
-    risky_assets_weight = 1 - optimizer.cash_weight
-    expected_returns = optimizer.mean_returns
-
-    # Global minimum variance portfolio
-    gmv_weigths, gmv_annualized_variance, gmv_expected_return = optimizer.minimum_variance_optimization()
+    account_id = request.args.get('account_id')
+    covariance_source = load_covariance_source(request.args.get('covariance', 'ewma'))
+    optimizer = Optimizer(risk_free_rate, snapshot=Portfolio.cached(account_id=account_id),
+                          covariance_source=covariance_source)
+
+    # Global minimum variance, tangency, risk parity and maximum diversification portfolios in one batch
+    portfolios = optimizer.optimize_portfolios()
+    gmv_weigths, gmv_annualized_variance, gmv_expected_return = portfolios['minimum_variance']
     gmv_annualized_volatility = np.sqrt(gmv_annualized_variance)
 
     # Current portfolio optimization
     weights_opti, var_opti, ptf_return_opti = optimizer.portfolio_optimization()
     annualized_volatility_opti = np.sqrt(var_opti)
 
-    # Efficient portfolio with a return corresponding to the highest single stock return
-    max_return_stock = max(expected_returns) * risky_assets_weight
-    max_stock_efficient_weights, max_stock_efficient_var, max_stock_efficient_return = \
-        optimizer.minimum_variance_optimization(target_return=max_return_stock)
-
-    # Optimizing for 100 return points between the global min var portfolio and the max return stock efficient portfolio
-    returns_array = np.linspace(gmv_expected_return, max_stock_efficient_return, 100)
-    efficient_portfolios = [optimizer.minimum_variance_optimization(target_return=r) for r in returns_array]
-
-    efficient_weights, efficient_var, efficient_returns = list(zip(*efficient_portfolios))
+    # Efficient frontier between the global min var portfolio and the max return stock efficient portfolio, the
+    # resampled frontier is solved in a process pool once per portfolio snapshot and then read from the cache
+    if request.args.get('frontier') == 'resampled':
+        efficient_weights, efficient_var, efficient_returns = \
+            optimizer.resampled_efficient_frontier(n_samples=500, seed=0, processes=4)
+    else:
+        efficient_weights, efficient_var, efficient_returns = optimizer.efficient_frontier(n_points=100)
     gmv_portfolio = {'weights': gmv_weigths,
                      'vol': gmv_annualized_volatility,
                      'expected_return': gmv_expected_return,
                      'name': 'Global Minimum Variance',
                      'color': 'green',
                      'marker': {'radius': 5}}
-    current_portfolio = {'weights': list(optimizer.stocks_weights.values()),
+    current_portfolio = {'weights': optimizer.holdings.weight,
                          'vol': optimizer.annualized_portfolio_volatility,
-                         'expected_return': np.dot(np.array(list(optimizer.stocks_weights.values())),
-                                                   optimizer.mean_returns),
+                         'expected_return': np.dot(optimizer.holdings.weight, optimizer.mean_returns),
                          'name': 'Current Portfolio',
                          'color': 'red',
                          'marker': {'radius': 5}}
@@ -132,7 +196,17 @@ def optimizer():
                            'name': 'Portfolio Optimized',
                            'color': 'green',
                            'marker': {'radius': 5}}
-    scatter_points = [gmv_portfolio, current_portfolio, portfolio_optimized]
+    other_portfolios = [{'weights': weights,
+                         'vol': np.sqrt(variance),
+                         'expected_return': expected_return,
+                         'name': name,
+                         'color': color,
+                         'marker': {'radius': 5}}
+                        for (weights, variance, expected_return), name, color in
+                        [(portfolios['max_sharpe'], 'Maximum Sharpe Ratio', 'orange'),
+                         (portfolios['risk_parity'], 'Risk Parity', 'purple'),
+                         (portfolios['max_diversification'], 'Maximum Diversification', 'blue')]]
+    scatter_points = [gmv_portfolio, current_portfolio, portfolio_optimized] + other_portfolios
     optimizer_chart = OptimizerChart(efficient_weights=efficient_weights,
                                      vol_data=list(np.sqrt(efficient_var)),
                                      expected_return_data=efficient_returns,
@@ -149,7 +223,7 @@ def optimizer():
 @app.route('/optimizer_portfolio_weights', methods=['POST'])
 def show_portfolio_weights():
     weights = request.json.get('weights')
-    ptf = Portfolio()
+    ptf = Portfolio.cached(account_id=request.json.get('account_id'))
     current_portfolio_weights = ptf.stocks_weights
     selected_portfolio_weights = dict(zip(ptf.stocks_weights.keys(), weights))
     column_definition = [{'field': 'isin'},
@@ -169,6 +243,18 @@ def show_portfolio_weights():
     return json.dumps(aggrid_table, cls=JsonEncoder)
 
 
+@app.route('/optimizer_what_if', methods=['POST'])
+def score_what_if_trades():
+    simulator = WhatIfSimulator.cached(account_id=request.json.get('account_id'), risk_free_rate=0.01,
+                                       covariance=request.json.get('covariance', 'ewma'))
+    candidates = request.json.get('candidates')
+    try:
+        scores = simulator.score_many(candidates)
+    except KeyError as key_error:
+        return Response(json.dumps({'error': str(key_error)}), status=400, mimetype='application/json')
+    return json.dumps(scores, cls=JsonEncoder)
+
+
 @app.route('/screener')
 def screener():
     return render_template('screener.html')
@@ -178,8 +264,9 @@ def screener():
 def run_screener():
     screening_data = request.json
     period = screening_data['period']
-    fields_filters = screening_data['fields']
-    equity_screener = Screener(fields_filters, period=period)
+    # a screen expression, e.g. "roe > 0.1 and percentile(operating_margin, sector) > 0.8", or limits by field
+    screen_filters = screening_data.get('expression') or screening_data['fields']
+    equity_screener = Screener(screen_filters, period=period)
     df_screener_result = equity_screener.run()
     df_screener_result['date'] = df_screener_result['date'].dt.date
     columns_definition = [{'field': col} if col != 'isin' else {'field': col, 'cellRenderer': 'isinCellRenderer'}
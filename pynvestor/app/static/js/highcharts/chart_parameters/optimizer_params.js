@@ -15,7 +15,8 @@ export function getParams(title, efficientFrontierData, scatterData) {
                             click: function() {
                                 $.ajax({
                                     data: JSON.stringify({
-                                        weights: this.weights
+                                        weights: this.weights,
+                                        account_id: new URLSearchParams(window.location.search).get('account_id')
                                     }),
                                     type: 'POST',
                                     url: '/optimizer_portfolio_weights',
@@ -0,0 +1,36 @@
+import numpy as np
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class PortfolioConstraints:
+    min_weight: float = 0.0
+    max_weight: float = 1.0
+    cash_weight: float = None  # weight kept in cash, the current cash weight of the portfolio if None
+    sectors: Dict[str, str] = field(default_factory=dict)  # sector of each isin
+    sector_caps: Dict[str, float] = field(default_factory=dict)  # maximum weight of each sector
+
+    @property
+    def is_long_only(self) -> bool:
+        return self.min_weight == 0.0 and self.max_weight >= 1.0 and not self.sector_caps
+
+    def get_bounds(self, n_assets: int) -> tuple:
+        return tuple((self.min_weight, self.max_weight) for _ in range(n_assets))
+
+    def get_linear_constraints(self, isins: List[str], budget: float) -> List[dict]:
+        """
+        scipy constraints of the weights, with their jacobians
+        :param isins: isins of the weights
+        :param budget: sum of the weights
+        :return: list of constraints
+        """
+        budget_jacobian = np.ones(len(isins))
+        constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - budget, 'jac': lambda w: budget_jacobian}]
+        for sector, cap in self.sector_caps.items():
+            sector_jacobian = -np.array([self.sectors.get(isin) == sector for isin in isins], dtype=np.float64)
+            constraints.append({'type': 'ineq',
+                                'fun': lambda w, jac=sector_jacobian, cap=cap: cap + jac.dot(w),
+                                'jac': lambda w, jac=sector_jacobian: jac})
+        return constraints
@@ -0,0 +1,90 @@
+import numpy as np
+
+from pandas import DataFrame
+from typing import Dict, List
+
+
+def _column(position: int):
+    def getter(self) -> np.ndarray:
+        return self._data[position]
+
+    def setter(self, values):
+        self._data[position] = values
+
+    return property(getter, setter)
+
+
+class Holdings:
+    """
+    Struct-of-arrays table of the equity lines of a portfolio: an isin index and one float64 column per field.
+    Columns are rows of a single C-contiguous 2D array, so that every column is exposed as a view without copy
+    """
+    columns = ('quantity', 'price', 'previous_price', 'open_price', 'perf_since_open', 'perf_since_last_close',
+               'market_value', 'previous_market_value', 'weight', 'pnl')
+
+    quantity = _column(0)
+    price = _column(1)
+    previous_price = _column(2)
+    open_price = _column(3)
+    perf_since_open = _column(4)
+    perf_since_last_close = _column(5)
+    market_value = _column(6)
+    previous_market_value = _column(7)
+    weight = _column(8)
+    pnl = _column(9)
+
+    def __init__(self, isins: List[str], quantities=None, names: List[str] = None):
+        """
+        :param isins: isins of the lines, define the order of the columns
+        :param quantities: quantities of the lines
+        :param names: names of the lines
+        """
+        self._isins = np.array(isins, dtype=object)
+        self._index = {isin: position for position, isin in enumerate(isins)}
+        self._data = np.full((len(self.columns), len(isins)), np.nan, dtype=np.float64)
+        self.names = np.array(names if names is not None else [None] * len(isins), dtype=object)
+        if quantities is not None:
+            self.quantity = quantities
+
+    def __len__(self):
+        return len(self._isins)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} | {len(self)} lines'
+
+    def __copy__(self):
+        holdings = Holdings.__new__(Holdings)
+        holdings._isins = self._isins
+        holdings._index = self._index
+        holdings._data = self._data.copy()
+        holdings.names = self.names.copy()
+        return holdings
+
+    @property
+    def isins(self) -> np.ndarray:
+        return self._isins
+
+    def loc(self, isin: str) -> int:
+        """
+        position of an isin in the columns
+        :param isin: str
+        :return: integer position
+        """
+        return self._index[isin]
+
+    def to_dict(self, column: str) -> Dict[str, float]:
+        """
+        get a column as a dictionary keyed by isin
+        :param column: name of the column
+        :return: dictionary
+        """
+        return dict(zip(self._isins.tolist(), getattr(self, column).tolist()))
+
+    def to_df(self) -> DataFrame:
+        """
+        dataframe representation of the table indexed by isin
+        :return: dataframe
+        """
+        df = DataFrame(self._data.T, index=self._isins, columns=self.columns)
+        df.insert(0, 'name', self.names)
+        return df
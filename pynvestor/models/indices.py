@@ -0,0 +1 @@
+CAC_40_ISIN = 'FR0003500008'  # reference index of the stress tests and of the market metrics
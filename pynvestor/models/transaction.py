@@ -5,6 +5,8 @@ from marshmallow import Schema, fields
 from marshmallow_enum import EnumField
 from enum import Enum
 
+TRANSACTION_TAX_RATE = 0.003  # French financial transaction tax, paid on buys only
+
 
 class TransactionType(Enum):
     BUY = 'BUY'
@@ -29,6 +31,7 @@ class Transaction:
     transaction_tax: float = None
     net_cashflow: float = None
     notes: str = None
+    account_id: str = None
 
     def _get_name(self):
         return euronext.get_instrument_details(self.isin, self.mic)['instr']['longNm']
@@ -43,7 +46,8 @@ class Transaction:
 
 class Buy(Transaction):
     def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, quantity: float, price: float, fee: float,
-                 notes: str = None, has_transaction_tax: bool = True):
+                 notes: str = None, has_transaction_tax: bool = True, account_id: str = None):
+        self.account_id = account_id
         self.transaction_type = TransactionType.BUY
         self.transaction_date = transaction_date
         self.isin = isin.strip()
@@ -60,7 +64,7 @@ class Buy(Transaction):
 
     def _get_transaction_tax(self):
         if self._has_transaction_tax is True:
-            transaction_tax = 0.003 * self.gross_amount
+            transaction_tax = TRANSACTION_TAX_RATE * self.gross_amount
         else:
             transaction_tax = 0.0
 
@@ -73,8 +77,9 @@ class Buy(Transaction):
 
 class Sell(Transaction):
     def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, quantity: float, price: float, fee: float,
-                 notes: str = None):
+                 notes: str = None, account_id: str = None):
         assert quantity < 0, "quantity must be negative"
+        self.account_id = account_id
         self.transaction_type = TransactionType.SELL
         self.transaction_date = transaction_date
         self.isin = isin.strip()
@@ -93,7 +98,8 @@ class Sell(Transaction):
 
 
 class Inflow(Transaction):
-    def __init__(self, transaction_date: dt.datetime, amount: float):
+    def __init__(self, transaction_date: dt.datetime, amount: float, account_id: str = None):
+        self.account_id = account_id
         self.transaction_date = transaction_date
         self.transaction_type = TransactionType.INFLOW
         self.name = 'Bank'
@@ -101,7 +107,9 @@ class Inflow(Transaction):
 
 
 class StockDividend(Transaction):
-    def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, net_amount, notes: str = None):
+    def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, net_amount, notes: str = None,
+                 account_id: str = None):
+        self.account_id = account_id
         self.transaction_type = TransactionType.STOCK_DIVIDEND
         self.transaction_date = transaction_date
         self.isin = isin.strip()
@@ -112,7 +120,9 @@ class StockDividend(Transaction):
 
 
 class StockSplit(Transaction):
-    def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, new_quantity, notes: str = None):
+    def __init__(self, transaction_date: dt.datetime, isin: str, mic: str, new_quantity, notes: str = None,
+                 account_id: str = None):
+        self.account_id = account_id
         self.transaction_type = TransactionType.STOCK_DIVIDEND
         self.transaction_date = transaction_date
         self.isin = isin.strip()
@@ -136,3 +146,4 @@ class TransactionSchema(Schema):
     transaction_tax = fields.Float()
     net_cashflow = fields.Float()
     notes = fields.Str()
+    account_id = fields.Str()
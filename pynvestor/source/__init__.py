@@ -1,5 +1,6 @@
 import json
 
+from pynvestor.source.cache import SnapshotCache
 from pynvestor.source.data_providers import EuronextClient, ReutersClient, YahooClient
 from pynvestor.source.mongo_connector import MongoConnector
 
@@ -15,3 +16,4 @@ reuters = ReutersClient()
 yahoo = YahooClient()
 env = set_env()
 mongo = MongoConnector(env)
+snapshot_cache = SnapshotCache(live_ttl=60.0)
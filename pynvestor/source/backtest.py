@@ -0,0 +1,205 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Union
+
+from pynvestor import logger
+from pynvestor.models.transaction import TRANSACTION_TAX_RATE
+from pynvestor.source.helpers import Helpers
+
+
+class PortfolioBacktest:
+    """
+    Simulate strategies rebalancing to target weights (e.g. WalkForwardOptimizer output) on the daily prices of
+    quotes.equities. Every strategy is a row of strategy-by-isin arrays: the trades, costs and cash of all the
+    strategies are computed together at every rebalancing date, and the net asset values between two rebalancing
+    dates are one matrix product of the holdings with the prices. Buys pay the transaction tax and sells do not, as
+    in models.transaction, and every trade pays the fee
+    """
+    _cost_iterations = 4
+
+    def __init__(self, target_weights: Union[pd.DataFrame, Dict[str, pd.DataFrame]], end_date: dt.datetime = None,
+                 initial_capital: float = 100000.0, fee: float = 0.0, fee_rate: float = 0.0,
+                 transaction_tax_rate: float = TRANSACTION_TAX_RATE, risk_free_rate: float = 0.01,
+                 prices_panel: pd.DataFrame = None, helpers: Helpers = None):
+        """
+        :param target_weights: dataframe of target weights indexed by rebalancing date with one column per isin, or
+        dataframes keyed by strategy name. A row of NaN skips the rebalancing, the weights left are kept in cash
+        :param end_date: last date of the simulation, today if None
+        :param initial_capital: cash of every strategy before the first rebalancing
+        :param fee: fixed fee of every trade
+        :param fee_rate: fee of every trade in proportion of its gross amount
+        :param transaction_tax_rate: tax paid on the gross amount of the buys
+        :param risk_free_rate: annual risk-free rate of the Sharpe ratios
+        :param prices_panel: daily prices with one column per isin, read from quotes.equities if None
+        :param helpers: Helpers object, created if None
+        """
+        if isinstance(target_weights, pd.DataFrame):
+            target_weights = {'strategy': target_weights}
+        self._strategies = list(target_weights)
+        self._initial_capital = initial_capital
+        self._fee = fee
+        self._fee_rate = fee_rate
+        self._transaction_tax_rate = transaction_tax_rate
+        self._risk_free_rate = risk_free_rate
+
+        self._isins = list(dict.fromkeys(isin for weights in target_weights.values() for isin in weights.columns))
+        rebalance_dates = pd.DatetimeIndex(sorted(set().union(*(weights.index for weights in
+                                                                target_weights.values()))))
+        if prices_panel is None:
+            helpers = helpers or Helpers()
+            prices_panel = helpers.get_prices_panel(self._isins, start_date=rebalance_dates[0].to_pydatetime(),
+                                                    end_date=end_date)
+        prices_panel = prices_panel.reindex(columns=self._isins).sort_index().ffill()
+        self._prices_panel = prices_panel[prices_panel.index >= rebalance_dates[0]]
+
+        # a rebalancing date without quote is traded on the next trading date
+        rebalance_locs = self._prices_panel.index.searchsorted(rebalance_dates)
+        valid_dates = rebalance_locs < len(self._prices_panel)
+        if not valid_dates.all():
+            logger.log.warning(f'{rebalance_dates[~valid_dates].tolist()}: rebalancing dates after the last price, '
+                               f'they are not simulated')
+        self._rebalance_locs = np.unique(rebalance_locs[valid_dates])
+        rebalance_dates = rebalance_dates[valid_dates]
+
+        # strategies-by-dates-by-isins array, the last target of the dates traded on the same trading date is kept
+        self._target_weights = np.full((len(self._strategies), len(self._rebalance_locs), len(self._isins)), np.nan)
+        for i, weights in enumerate(target_weights.values()):
+            weights = weights.reindex(index=rebalance_dates, columns=self._isins)
+            weights = weights.groupby(rebalance_locs[valid_dates]).last()
+            self._target_weights[i] = weights.reindex(self._rebalance_locs).values
+
+        self._simulate()
+        self._compute_statistics()
+
+    def _compute_trades(self, target_weights: np.ndarray, quantities: np.ndarray, prices: np.ndarray,
+                        inverse_prices: np.ndarray, capital: np.ndarray) -> tuple:
+        """
+        Quantities reaching the target weights of a capital, and the costs of the trades
+        :param target_weights: strategies-by-isins weights
+        :param quantities: strategies-by-isins quantities held before the trades
+        :param prices: price of every isin, 0 if missing
+        :param inverse_prices: inverse of the prices, 0 if missing
+        :param capital: amount invested by every strategy
+        :return: target quantities, gross amounts of the trades and their costs
+        """
+        target_quantities = target_weights * capital[:, None] * inverse_prices
+        trades_amounts = (target_quantities - quantities) * prices
+        absolute_amounts = np.abs(trades_amounts)
+        costs = (self._transaction_tax_rate * np.clip(trades_amounts, 0.0, None).sum(axis=1)
+                 + self._fee_rate * absolute_amounts.sum(axis=1)
+                 + self._fee * (absolute_amounts > 1e-8).sum(axis=1))
+        return target_quantities, trades_amounts, costs
+
+    def _simulate(self):
+        """
+        Holdings, cash, turnover, costs and net asset values of all the strategies. The costs of a rebalancing are
+        paid from the net asset value before the target weights are applied, so that a fully invested strategy does
+        not borrow
+        :return:
+        """
+        prices = self._prices_panel.values
+        n_strategies, n_rebalances, n_isins = self._target_weights.shape
+        quantities = np.zeros((n_strategies, n_isins))
+        cash = np.full(n_strategies, self._initial_capital)
+        navs = np.full((n_strategies, len(prices)), self._initial_capital)
+        holdings = np.zeros((n_strategies, n_rebalances, n_isins))
+        turnover = np.full((n_strategies, n_rebalances), np.nan)
+        costs = np.zeros((n_strategies, n_rebalances))
+
+        for i, loc in enumerate(self._rebalance_locs):
+            rebalance_prices = prices[loc]
+            target_weights = self._target_weights[:, i]
+            rebalanced = ~np.isnan(target_weights).all(axis=1)
+
+            # an isin without price yet cannot be bought, its weight stays in cash
+            missing_prices = np.isnan(rebalance_prices)
+            if missing_prices.any() and (np.nan_to_num(target_weights[:, missing_prices]) != 0).any():
+                missing_isins = [isin for isin, missing in zip(self._isins, missing_prices) if missing]
+                logger.log.warning(f'{self._prices_panel.index[loc]}: no price for {missing_isins}, '
+                                   f'their target weights are kept in cash')
+            target_weights = np.where(missing_prices, 0.0, np.nan_to_num(target_weights))
+            inverse_prices = np.where(missing_prices, 0.0, 1 / np.where(missing_prices, 1.0, rebalance_prices))
+            rebalance_prices = np.nan_to_num(rebalance_prices)
+
+            # the costs depend on the amount invested net of the costs, a few fixed-point iterations converge since
+            # the costs are a small fraction of the trades
+            nav = cash + quantities.dot(rebalance_prices)
+            rebalance_costs = np.zeros(n_strategies)
+            for _ in range(self._cost_iterations):
+                target_quantities, trades_amounts, rebalance_costs = self._compute_trades(
+                    target_weights, quantities, rebalance_prices, inverse_prices, nav - rebalance_costs)
+
+            quantities = np.where(rebalanced[:, None], target_quantities, quantities)
+            cash = np.where(rebalanced, cash - trades_amounts.sum(axis=1) - rebalance_costs, cash)
+            holdings[:, i] = quantities
+            turnover[:, i] = np.where(rebalanced, np.abs(trades_amounts).sum(axis=1) / (2 * nav), np.nan)
+            costs[:, i] = np.where(rebalanced, rebalance_costs, 0.0)
+
+            next_loc = self._rebalance_locs[i + 1] if i + 1 < n_rebalances else len(prices)
+            navs[:, loc:next_loc] = cash[:, None] + quantities.dot(np.nan_to_num(prices[loc:next_loc]).T)
+
+        dates = self._prices_panel.index
+        rebalance_dates = dates[self._rebalance_locs]
+        self._navs = pd.DataFrame(navs.T, index=dates, columns=self._strategies)
+        self._holdings = {strategy: pd.DataFrame(holdings[i], index=rebalance_dates, columns=self._isins)
+                          for i, strategy in enumerate(self._strategies)}
+        self._turnover = pd.DataFrame(turnover.T, index=rebalance_dates, columns=self._strategies)
+        self._costs = pd.DataFrame(costs.T, index=rebalance_dates, columns=self._strategies)
+        return True
+
+    def _compute_statistics(self):
+        """
+        Performance statistics of every strategy
+        :return:
+        """
+        navs = self._navs.values
+        returns = navs[1:] / navs[:-1] - 1
+        n_years = max(len(returns), 1) / 252
+
+        total_return = navs[-1] / navs[0] - 1
+        annualized_return = (1 + total_return) ** (1 / n_years) - 1
+        annualized_volatility = returns.std(axis=0, ddof=1) * np.sqrt(252) if len(returns) > 1 else np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe_ratio = Helpers.compute_sharpe_ratio(annualized_return, annualized_volatility,
+                                                        self._risk_free_rate)
+        max_drawdown = (navs / np.maximum.accumulate(navs, axis=0) - 1).min(axis=0)
+
+        self._statistics = pd.DataFrame({'total_return': total_return,
+                                         'annualized_return': annualized_return,
+                                         'annualized_volatility': annualized_volatility,
+                                         'sharpe_ratio': sharpe_ratio,
+                                         'max_drawdown': max_drawdown,
+                                         'mean_turnover': self._turnover.mean(axis=0).values,
+                                         'total_costs': self._costs.values.sum(axis=0)},
+                                        index=self._strategies)
+        return True
+
+    @property
+    def strategies(self):
+        return self._strategies
+
+    @property
+    def prices_panel(self):
+        return self._prices_panel
+
+    @property
+    def navs(self):
+        return self._navs
+
+    @property
+    def holdings(self):
+        return self._holdings
+
+    @property
+    def turnover(self):
+        return self._turnover
+
+    @property
+    def costs(self):
+        return self._costs
+
+    @property
+    def statistics(self):
+        return self._statistics
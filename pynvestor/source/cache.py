@@ -0,0 +1,102 @@
+import datetime as dt
+import threading
+import time
+
+from collections import defaultdict
+from typing import Callable, Hashable, Iterable
+
+
+class SnapshotCache:
+    """
+    Process-wide cache of loaded portfolio snapshots keyed by account id and portfolio date.
+    Live snapshots (no date or today's date) expire after a time to live, snapshots of past dates are kept until
+    they are explicitly invalidated
+    """
+    def __init__(self, live_ttl: float = 60.0, n_key_locks: int = 64):
+        """
+        :param live_ttl: time to live in seconds of the live snapshots
+        :param n_key_locks: number of locks serializing the loads, the keys are striped over a fixed pool so that no
+        lock is kept per key ever requested
+        """
+        self._live_ttl = live_ttl
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._key_locks = [threading.RLock() for _ in range(n_key_locks)]
+        self._global_version = 0
+        self._accounts_versions = defaultdict(int)
+
+    @staticmethod
+    def _is_live(portfolio_date: dt.datetime = None) -> bool:
+        return portfolio_date is None or portfolio_date.date() >= dt.date.today()
+
+    def _get_valid(self, key: Hashable, portfolio_date: dt.datetime = None):
+        entry = self._snapshots.get(key)
+        if entry is None:
+            return None
+        snapshot, loaded_at = entry
+        if self._is_live(portfolio_date) and time.monotonic() - loaded_at > self._live_ttl:
+            del self._snapshots[key]
+            return None
+        return snapshot
+
+    def get(self, portfolio_date: dt.datetime, loader: Callable, account_id: str = None):
+        """
+        get the snapshot of an account at a date from the cache, load and store it if missing or expired
+        :param portfolio_date: datetime, None for the live portfolio
+        :param loader: callable taking the portfolio date and the account id and returning the snapshot
+        :param account_id: id of the account
+        :return: cached snapshot
+        """
+        key = (account_id, portfolio_date)
+        with self._lock:
+            snapshot = self._get_valid(key, portfolio_date)
+            if snapshot is not None:
+                return snapshot
+        key_lock = self._key_locks[hash(key) % len(self._key_locks)]
+
+        # Only one thread loads a given date, the others wait for it and reuse its snapshot
+        with key_lock:
+            with self._lock:
+                snapshot = self._get_valid(key, portfolio_date)
+            if snapshot is None:
+                snapshot = loader(portfolio_date, account_id)
+                with self._lock:
+                    self._snapshots[key] = (snapshot, time.monotonic())
+        return snapshot
+
+    def invalidate(self, from_date: dt.datetime = None, account_ids: Iterable[str] = None) -> bool:
+        """
+        drop cached snapshots impacted by a change in the database
+        :param from_date: drop the live snapshots and the snapshots dated on or after this date,
+        all dates if None
+        :param account_ids: accounts whose snapshots are dropped, all accounts if None
+        :return: True
+        """
+        account_ids = set(account_ids) if account_ids is not None else None
+        with self._lock:
+            if account_ids is None:
+                self._global_version += 1
+            else:
+                for account_id in account_ids:
+                    self._accounts_versions[account_id] += 1
+            for account_id, portfolio_date in list(self._snapshots):
+                if account_ids is not None and account_id not in account_ids:
+                    continue
+                if from_date is None or portfolio_date is None or portfolio_date >= from_date:
+                    del self._snapshots[(account_id, portfolio_date)]
+        return True
+
+    def version(self, account_id: str = None) -> tuple:
+        """
+        version of the data of an account, changes every time its snapshots are invalidated
+        :param account_id: id of the account
+        :return: tuple
+        """
+        with self._lock:
+            return self._global_version, self._accounts_versions[account_id]
+
+    def clear(self) -> bool:
+        return self.invalidate()
+
+    def __len__(self):
+        return len(self._snapshots)
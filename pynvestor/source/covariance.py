@@ -0,0 +1,657 @@
+import abc
+import datetime as dt
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from pynvestor import logger
+
+current_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+risk_directory = os.path.join(current_directory, "static", "risk")
+
+
+def _get_temporary_path(file_path: str) -> str:
+    """
+    create an empty temporary file in the directory of a file, on the same file system so that it can replace it
+    :param file_path: path of the file to replace
+    :return: path of the temporary file
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(suffix=os.path.splitext(file_path)[1],
+                                                       dir=os.path.dirname(file_path))
+    os.close(file_descriptor)
+    return temporary_path
+
+
+def _save_array(file_path: str, array: np.ndarray) -> bool:
+    """
+    write a .npy file in a temporary file renamed over it: the processes memory-mapping the previous file keep
+    reading it instead of a partially written one
+    :param file_path: path of the .npy file
+    :param array: array to save
+    :return: True
+    """
+    temporary_path = _get_temporary_path(file_path)
+    try:
+        np.save(temporary_path, array)
+        os.replace(temporary_path, file_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return True
+
+
+def _save_metadata(file_path: str, metadata: dict) -> bool:
+    """
+    write a json file in a temporary file renamed over it
+    :param file_path: path of the json file
+    :param metadata: dictionary to save
+    :return: True
+    """
+    temporary_path = _get_temporary_path(file_path)
+    try:
+        with open(temporary_path, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(temporary_path, file_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return True
+
+
+class CovarianceSource:
+    """
+    Precomputed daily covariance of a universe of instruments, usable by PortfolioRiskManager and Optimizer
+    instead of the sample covariance of the portfolio holdings. Subclasses index their isins in self._index
+    """
+    name = None
+
+    def _locs(self, isins: List[str]) -> np.ndarray:
+        """
+        locations of some instruments in the universe
+        :param isins: list of isins
+        :return: array of int
+        """
+        missing_isins = [isin for isin in isins if isin not in self._index]
+        if missing_isins:
+            raise KeyError(f'{missing_isins} not in the {self.name} covariance universe')
+        return np.array([self._index[isin] for isin in isins], dtype=int)
+
+    @abc.abstractmethod
+    def get_covariance(self, isins: List[str]) -> np.ndarray:
+        """
+        daily covariance matrix of some instruments of the universe
+        :param isins: list of isins, define the order of the rows and columns
+        :return: 2D array
+        """
+        pass
+
+
+class CovarianceState(CovarianceSource):
+    """
+    Covariance of the universe kept up to date with one new vector of daily returns per trading day and persisted
+    as numpy files, read back memory-mapped so that slicing a portfolio out of it does not load the whole matrix
+    """
+    _arrays = ()
+
+    def __init__(self, isins: List[str]):
+        self._isins = list(isins)
+        self._index = {isin: loc for loc, isin in enumerate(self._isins)}
+        self.last_date = None
+
+    @property
+    def isins(self):
+        return self._isins
+
+    @abc.abstractmethod
+    def update(self, returns: np.ndarray, returns_date: dt.datetime) -> bool:
+        """
+        add the returns of a new trading day
+        :param returns: returns of the universe isins in their order, NaN for missing quotes
+        :param returns_date: date of the returns
+        :return: True
+        """
+        pass
+
+    @abc.abstractmethod
+    def _get_parameters(self) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def _resize(self, n_isins: int) -> bool:
+        pass
+
+    def update_from_returns(self, returns_panel: pd.DataFrame) -> bool:
+        """
+        add the returns of the dates after the last update
+        :param returns_panel: dataframe of daily returns indexed by date with one column per isin
+        :return: True
+        """
+        returns_panel = returns_panel.reindex(columns=self._isins).sort_index()
+        if self.last_date is not None:
+            returns_panel = returns_panel[returns_panel.index > self.last_date]
+        for returns_date, returns in zip(returns_panel.index, returns_panel.values):
+            self.update(returns, returns_date.to_pydatetime())
+        return True
+
+    def reindex(self, isins: List[str]) -> bool:
+        """
+        add new isins to the universe, their statistics start from the next update
+        :param isins: isins of the universe
+        :return: True
+        """
+        new_isins = [isin for isin in isins if isin not in self._index]
+        if new_isins:
+            self._isins += new_isins
+            self._index = {isin: loc for loc, isin in enumerate(self._isins)}
+            self._resize(len(self._isins))
+        return True
+
+    def save(self, directory: str = None) -> bool:
+        """
+        persist the state in a directory
+        :param directory: risk directory by default
+        :return: True
+        """
+        path = os.path.join(directory or risk_directory, self.name)
+        os.makedirs(path, exist_ok=True)
+        # the universe only grows at its end, the arrays are replaced before the metadata so that a reader always
+        # finds the isins of its metadata at the same locations
+        for array_name in self._arrays:
+            _save_array(os.path.join(path, f'{array_name}.npy'), getattr(self, f'_{array_name}'))
+        metadata = {'isins': self._isins,
+                    'last_date': self.last_date.isoformat() if self.last_date is not None else None,
+                    'parameters': self._get_parameters()}
+        _save_metadata(os.path.join(path, 'metadata.json'), metadata)
+        return True
+
+    @classmethod
+    def load(cls, directory: str = None, mmap_mode: str = None) -> 'CovarianceState':
+        """
+        load a persisted state
+        :param directory: risk directory by default
+        :param mmap_mode: "r" to read the arrays memory-mapped, None to load them for updates
+        :return: CovarianceState object
+        """
+        path = os.path.join(directory or risk_directory, cls.name)
+        with open(os.path.join(path, 'metadata.json'), 'r') as f:
+            metadata = json.load(f)
+        state = cls(metadata['isins'], **metadata['parameters'])
+        for array_name in cls._arrays:
+            setattr(state, f'_{array_name}', np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode=mmap_mode))
+        if metadata['last_date'] is not None:
+            state.last_date = dt.datetime.fromisoformat(metadata['last_date'])
+        return state
+
+
+class EwmaCovariance(CovarianceState):
+    """
+    RiskMetrics exponentially weighted covariance with zero mean returns. Decayed sums of the cross products and of
+    the weights of the pairs observed together are kept, so that missing quotes and new isins are handled
+    """
+    name = 'ewma'
+    _arrays = ('cross_products', 'weights')
+
+    def __init__(self, isins: List[str], decay: float = 0.94):
+        super().__init__(isins)
+        self._decay = decay
+        self._cross_products = np.zeros((len(self._isins), len(self._isins)))
+        self._weights = np.zeros((len(self._isins), len(self._isins)))
+
+    def _get_parameters(self) -> dict:
+        return {'decay': self._decay}
+
+    def _resize(self, n_isins: int) -> bool:
+        n_previous = len(self._cross_products)
+        self._cross_products = np.pad(self._cross_products, (0, n_isins - n_previous))
+        self._weights = np.pad(self._weights, (0, n_isins - n_previous))
+        return True
+
+    def update(self, returns: np.ndarray, returns_date: dt.datetime) -> bool:
+        observed = ~np.isnan(returns)
+        returns = np.where(observed, returns, 0.0)
+        self._cross_products *= self._decay
+        self._cross_products += (1 - self._decay) * np.outer(returns, returns)
+        self._weights *= self._decay
+        self._weights += (1 - self._decay) * np.outer(observed, observed)
+        self.last_date = returns_date
+        return True
+
+    def get_covariance(self, isins: List[str]) -> np.ndarray:
+        locs = self._locs(isins)
+        block = np.ix_(locs, locs)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.asarray(self._cross_products[block]) / np.asarray(self._weights[block])
+
+
+class RollingCovariance(CovarianceState):
+    """
+    Sample covariance over a rolling window of trading days on pairwise-complete observations. The sums of the
+    window are updated by adding the new returns and removing the returns leaving the window
+    """
+    name = 'rolling'
+    _arrays = ('window_returns', 'sums', 'cross_products', 'counts')
+
+    def __init__(self, isins: List[str], window: int = 500, position: int = 0):
+        super().__init__(isins)
+        n_isins = len(self._isins)
+        self._window = window
+        self._position = position
+        self._window_returns = np.full((window, n_isins), np.nan)
+        self._sums = np.zeros((n_isins, n_isins))  # sum of the returns of i observed together with j
+        self._cross_products = np.zeros((n_isins, n_isins))
+        self._counts = np.zeros((n_isins, n_isins))
+
+    def _get_parameters(self) -> dict:
+        return {'window': self._window, 'position': self._position}
+
+    def _resize(self, n_isins: int) -> bool:
+        n_previous = len(self._sums)
+        self._window_returns = np.pad(self._window_returns, ((0, 0), (0, n_isins - n_previous)),
+                                      constant_values=np.nan)
+        self._sums = np.pad(self._sums, (0, n_isins - n_previous))
+        self._cross_products = np.pad(self._cross_products, (0, n_isins - n_previous))
+        self._counts = np.pad(self._counts, (0, n_isins - n_previous))
+        return True
+
+    def _add(self, returns: np.ndarray, sign: float) -> bool:
+        observed = ~np.isnan(returns)
+        returns = np.where(observed, returns, 0.0)
+        self._sums += sign * np.outer(returns, observed)
+        self._cross_products += sign * np.outer(returns, returns)
+        self._counts += sign * np.outer(observed, observed)
+        return True
+
+    def update(self, returns: np.ndarray, returns_date: dt.datetime) -> bool:
+        self._add(self._window_returns[self._position], -1.0)  # NaN rows of the initial window remove nothing
+        self._add(returns, 1.0)
+        self._window_returns[self._position] = returns
+        self._position = (self._position + 1) % self._window
+        self.last_date = returns_date
+        return True
+
+    def get_mean_returns(self, isins: List[str]) -> np.ndarray:
+        """
+        mean daily returns of some instruments over the window
+        :param isins: list of isins
+        :return: array
+        """
+        locs = self._locs(isins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self._sums)[locs] / np.diag(self._counts)[locs]
+
+    def get_counts(self, isins: List[str]) -> np.ndarray:
+        """
+        number of returns of some instruments in the window
+        :param isins: list of isins
+        :return: array
+        """
+        return np.diag(self._counts)[self._locs(isins)]
+
+    def get_covariance(self, isins: List[str]) -> np.ndarray:
+        locs = self._locs(isins)
+        block = np.ix_(locs, locs)
+        sums = np.asarray(self._sums[block])
+        counts = np.asarray(self._counts[block])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.asarray(self._cross_products[block]) - sums * sums.T / counts) / (counts - 1)
+
+
+def _compute_covariance_block(returns_path: str, covariance_path: str, rows: slice, columns: slice,
+                              min_periods: int) -> tuple:
+    """
+    compute one block of the pairwise-complete covariance matrix and write it and its transpose in the shared
+    memory-mapped matrix, only the two column blocks of the returns are read
+    :param returns_path: .npy file of the demeaned returns, NaN for missing quotes
+    :param covariance_path: .npy file of the covariance matrix
+    :param rows: columns of the returns of the first block
+    :param columns: columns of the returns of the second block
+    :param min_periods: minimum number of common observations, covariances of pairs with fewer observations are 0
+    :return: sums of the estimated variances and of the squares of the off-diagonal covariances of the block,
+    used for the shrinkage intensity
+    """
+    returns = np.load(returns_path, mmap_mode='r')
+    rows_returns = np.array(returns[:, rows])
+    columns_returns = np.array(returns[:, columns])
+    rows_observed = (~np.isnan(rows_returns)).astype(np.float64)
+    columns_observed = (~np.isnan(columns_returns)).astype(np.float64)
+    rows_returns = np.nan_to_num(rows_returns)
+    columns_returns = np.nan_to_num(columns_returns)
+
+    counts = rows_observed.T.dot(columns_observed)
+    rows_sums = rows_returns.T.dot(columns_observed)
+    columns_sums = rows_observed.T.dot(columns_returns)
+    cross_products = rows_returns.T.dot(columns_returns)
+    squared_cross_products = (rows_returns ** 2).T.dot(columns_returns ** 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = (cross_products - rows_sums * columns_sums / counts) / (counts - 1)
+        # variance of the sample covariance of each pair, estimated on the demeaned returns
+        estimates_variance = (squared_cross_products / counts - (cross_products / counts) ** 2) / counts
+
+    off_diagonal = np.ones(covariance.shape, dtype=bool)
+    if rows == columns:
+        np.fill_diagonal(off_diagonal, False)
+    too_short = counts < min_periods
+    covariance[too_short & off_diagonal] = 0.0
+    covariance[too_short & ~off_diagonal] = np.nan
+    valid = off_diagonal & ~too_short
+
+    covariance_matrix = np.load(covariance_path, mmap_mode='r+')
+    covariance_matrix[rows, columns] = covariance
+    covariance_matrix[columns, rows] = covariance.T
+    covariance_matrix.flush()
+    return estimates_variance[valid].sum(), (covariance[valid] ** 2).sum()
+
+
+class UniverseCovariance(CovarianceSource):
+    """
+    Covariance matrix of the whole universe computed by blocks of columns on pairwise-complete observations, with an
+    optional Ledoit-Wolf shrinkage toward the diagonal of the variances. The matrix is a memory-mapped .npy file with
+    an isins sidecar, shared by every process reading it
+    """
+    name = 'universe'
+
+    def __init__(self, isins: List[str], covariance_matrix: np.ndarray, shrinkage: float = 0.0,
+                 last_date: dt.datetime = None):
+        """
+        :param isins: isins of the rows and columns of the matrix
+        :param covariance_matrix: daily covariance matrix, usually memory-mapped
+        :param shrinkage: shrinkage intensity applied to the matrix
+        :param last_date: date of the last returns
+        """
+        self._isins = list(isins)
+        self._index = {isin: loc for loc, isin in enumerate(self._isins)}
+        self._covariance_matrix = covariance_matrix
+        self.shrinkage = shrinkage
+        self.last_date = last_date
+
+    @property
+    def isins(self):
+        return self._isins
+
+    @property
+    def covariance_matrix(self):
+        return self._covariance_matrix
+
+    @classmethod
+    def compute(cls, returns_panel: pd.DataFrame, directory: str = None, block_size: int = 250,
+                shrinkage: bool = True, min_periods: int = 20, processes: int = None) -> 'UniverseCovariance':
+        """
+        compute the covariance matrix of all the columns of a returns panel and persist it
+        :param returns_panel: dataframe of daily returns indexed by date with one column per isin, NaN for missing
+        quotes
+        :param directory: risk directory by default
+        :param block_size: number of columns per block, the memory used by a block grows with its square
+        :param shrinkage: shrink the covariances toward 0 with the Ledoit-Wolf intensity
+        :param min_periods: minimum number of common observations of a pair
+        :param processes: number of worker processes computing the blocks, blocks are computed in this process if
+        None
+        :return: UniverseCovariance object reading the persisted matrix
+        """
+        path = os.path.join(directory or risk_directory, cls.name)
+        os.makedirs(path, exist_ok=True)
+        isins = returns_panel.columns.tolist()
+        n_isins = len(isins)
+
+        # The covariance is invariant by translation, returns are demeaned once to keep the products small
+        demeaned_returns = returns_panel.values - np.nanmean(returns_panel.values, axis=0)
+
+        # the matrix is built in a temporary file replacing the persisted one once complete, the processes
+        # memory-mapping the previous matrix keep reading it
+        with tempfile.TemporaryDirectory(dir=path) as temporary_directory:
+            returns_path = os.path.join(temporary_directory, 'returns.npy')
+            np.save(returns_path, demeaned_returns)
+            covariance_path = os.path.join(temporary_directory, 'covariance.npy')
+            np.lib.format.open_memmap(covariance_path, mode='w+', dtype=np.float64, shape=(n_isins, n_isins)).flush()
+
+            blocks = [slice(start, min(start + block_size, n_isins)) for start in range(0, n_isins, block_size)]
+            blocks_args = [[returns_path, covariance_path, rows, columns, min_periods]
+                           for i, rows in enumerate(blocks) for columns in blocks[i:]]
+            if processes is None:
+                blocks_sums = [_compute_covariance_block(*args) for args in blocks_args]
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    blocks_sums = list(executor.map(_compute_covariance_block, *zip(*blocks_args)))
+
+            shrinkage_intensity = 0.0
+            if shrinkage:
+                estimates_variance, squared_covariances = np.sum(blocks_sums, axis=0)
+                if squared_covariances > 0:
+                    shrinkage_intensity = float(np.clip(estimates_variance / squared_covariances, 0.0, 1.0))
+
+                covariance_matrix = np.load(covariance_path, mmap_mode='r+')
+                for rows in blocks:
+                    variances = np.diag(covariance_matrix[rows, rows]).copy()
+                    covariance_matrix[rows] *= 1 - shrinkage_intensity
+                    covariance_matrix[rows, rows][np.diag_indices(len(variances))] = variances
+                covariance_matrix.flush()
+                del covariance_matrix
+
+            os.replace(covariance_path, os.path.join(path, 'covariance.npy'))
+
+        last_date = returns_panel.index[-1].to_pydatetime() if len(returns_panel) else None
+        metadata = {'isins': isins, 'shrinkage': shrinkage_intensity,
+                    'last_date': last_date.isoformat() if last_date is not None else None}
+        _save_metadata(os.path.join(path, 'metadata.json'), metadata)
+        return cls.load(directory, mmap_mode='r')
+
+    @classmethod
+    def load(cls, directory: str = None, mmap_mode: str = 'r') -> 'UniverseCovariance':
+        """
+        load the persisted matrix
+        :param directory: risk directory by default
+        :param mmap_mode: memory-map mode of the matrix
+        :return: UniverseCovariance object
+        """
+        path = os.path.join(directory or risk_directory, cls.name)
+        with open(os.path.join(path, 'metadata.json'), 'r') as f:
+            metadata = json.load(f)
+        covariance_matrix = np.load(os.path.join(path, 'covariance.npy'), mmap_mode=mmap_mode)
+        last_date = dt.datetime.fromisoformat(metadata['last_date']) if metadata['last_date'] else None
+        return cls(metadata['isins'], covariance_matrix, metadata['shrinkage'], last_date)
+
+    def get_covariance(self, isins: List[str]) -> np.ndarray:
+        locs = self._locs(isins)
+        return np.asarray(self._covariance_matrix[np.ix_(locs, locs)])
+
+    def get_correlation(self, isins: List[str]) -> np.ndarray:
+        """
+        correlation matrix of some instruments of the universe
+        :param isins: list of isins
+        :return: 2D array
+        """
+        covariance = self.get_covariance(isins)
+        std = np.sqrt(np.diag(covariance))
+        return covariance / np.outer(std, std)
+
+
+class FactorRiskModel(CovarianceSource):
+    """
+    Statistical factor risk model: returns = loadings x factor returns + specific returns. Factors are optional
+    sector factors (mean return of the stocks of each sector) and the principal components of the returns left.
+    Only the N x K loadings, the K x K factor covariance and the N specific variances are stored, portfolio risk is
+    computed from them without the N x N covariance matrix
+    """
+    name = 'factor'
+
+    def __init__(self, isins: List[str], factors: List[str], loadings: np.ndarray, factor_covariance: np.ndarray,
+                 specific_variances: np.ndarray, last_date: dt.datetime = None):
+        """
+        :param isins: isins of the universe
+        :param factors: names of the factors
+        :param loadings: N x K exposures of the isins to the factors
+        :param factor_covariance: K x K daily covariance of the factor returns
+        :param specific_variances: daily variances of the specific returns
+        :param last_date: date of the last returns
+        """
+        self._isins = list(isins)
+        self._index = {isin: loc for loc, isin in enumerate(self._isins)}
+        self._factors = list(factors)
+        self._loadings = loadings
+        self._factor_covariance = factor_covariance
+        self._specific_variances = specific_variances
+        self.last_date = last_date
+
+    @classmethod
+    def fit(cls, returns_panel: pd.DataFrame, n_factors: int = 10, sectors: dict = None) -> 'FactorRiskModel':
+        """
+        estimate the model from a returns panel
+        :param returns_panel: dataframe of daily returns indexed by date with one column per isin, NaN for missing
+        quotes
+        :param n_factors: number of statistical factors
+        :param sectors: sector of each isin, no sector factor if None
+        :return: FactorRiskModel object
+        """
+        isins = returns_panel.columns.tolist()
+        observed = returns_panel.notna().values
+        residuals = np.nan_to_num(returns_panel.values - np.nanmean(returns_panel.values, axis=0))
+        loadings = []
+        factors_returns = []
+        factors = []
+
+        if sectors:
+            sectors_names = sorted({sector for sector in sectors.values() if sector is not None})
+            sectors_loadings = np.array([[sectors.get(isin) == sector for sector in sectors_names]
+                                         for isin in isins], dtype=np.float64).reshape(len(isins), -1)
+            # sector factor returns are the mean returns of the stocks of the sector quoted each day
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sectors_returns = np.nan_to_num(residuals.dot(sectors_loadings) / observed.dot(sectors_loadings))
+            residuals -= sectors_returns.dot(sectors_loadings.T) * observed
+            loadings.append(sectors_loadings)
+            factors_returns.append(sectors_returns)
+            factors += sectors_names
+
+        n_factors = min(n_factors, *residuals.shape)
+        _, _, right_singular_vectors = np.linalg.svd(residuals, full_matrices=False)
+        components = right_singular_vectors[:n_factors].T
+        components_returns = residuals.dot(components)
+        residuals -= components_returns.dot(components.T) * observed
+        loadings.append(components)
+        factors_returns.append(components_returns)
+        factors += [f'PC{i + 1}' for i in range(n_factors)]
+
+        factors_returns = np.hstack(factors_returns)
+        factor_covariance = np.atleast_2d(np.cov(factors_returns, rowvar=False))
+        specific_variances = (residuals ** 2).sum(axis=0) / np.maximum(observed.sum(axis=0) - 1, 1)
+        last_date = returns_panel.index[-1].to_pydatetime() if len(returns_panel) else None
+        return cls(isins, factors, np.hstack(loadings), factor_covariance, specific_variances, last_date)
+
+    def save(self, directory: str = None) -> bool:
+        """
+        persist the model in a single compressed file
+        :param directory: risk directory by default
+        :return: True
+        """
+        directory = directory or risk_directory
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(os.path.join(directory, f'{self.name}.npz'), isins=np.array(self._isins),
+                            factors=np.array(self._factors), loadings=self._loadings,
+                            factor_covariance=self._factor_covariance, specific_variances=self._specific_variances,
+                            last_date=np.array(self.last_date.isoformat() if self.last_date is not None else ''))
+        return True
+
+    @classmethod
+    def load(cls, directory: str = None, mmap_mode: str = None) -> 'FactorRiskModel':
+        """
+        load a persisted model, it is small enough to always be read in memory
+        :param directory: risk directory by default
+        :param mmap_mode: ignored
+        :return: FactorRiskModel object
+        """
+        with np.load(os.path.join(directory or risk_directory, f'{cls.name}.npz')) as model:
+            last_date = dt.datetime.fromisoformat(str(model['last_date'])) if str(model['last_date']) else None
+            return cls(model['isins'].tolist(), model['factors'].tolist(), model['loadings'],
+                       model['factor_covariance'], model['specific_variances'], last_date)
+
+    @property
+    def isins(self):
+        return self._isins
+
+    @property
+    def factors(self):
+        return self._factors
+
+    @property
+    def loadings(self):
+        return self._loadings
+
+    @property
+    def factor_covariance(self):
+        return self._factor_covariance
+
+    @property
+    def specific_variances(self):
+        return self._specific_variances
+
+    def get_covariance(self, isins: List[str]) -> np.ndarray:
+        locs = self._locs(isins)
+        loadings = self._loadings[locs]
+        return loadings.dot(self._factor_covariance).dot(loadings.T) + np.diag(self._specific_variances[locs])
+
+    def factor_exposures(self, weights: np.ndarray, isins: List[str]) -> np.ndarray:
+        """
+        exposures of a portfolio to the factors
+        :param weights: weights of the isins
+        :param isins: list of isins
+        :return: array of exposures in the order of the factors
+        """
+        return self._loadings[self._locs(isins)].T.dot(weights)
+
+    def portfolio_variance(self, weights: np.ndarray, isins: List[str]) -> float:
+        """
+        daily variance of a portfolio, in O(N.K)
+        :param weights: weights of the isins
+        :param isins: list of isins
+        :return: float
+        """
+        exposures = self.factor_exposures(weights, isins)
+        return exposures.dot(self._factor_covariance).dot(exposures) + \
+            np.dot(weights ** 2, self._specific_variances[self._locs(isins)])
+
+    def marginal_risk(self, weights: np.ndarray, isins: List[str]) -> np.ndarray:
+        """
+        derivatives of the daily volatility of a portfolio with respect to the weights
+        :param weights: weights of the isins
+        :param isins: list of isins
+        :return: array
+        """
+        locs = self._locs(isins)
+        exposures = self._loadings[locs].T.dot(weights)
+        covariance_weights = self._loadings[locs].dot(self._factor_covariance.dot(exposures)) + \
+            self._specific_variances[locs] * weights
+        return covariance_weights / np.sqrt(np.dot(weights, covariance_weights))
+
+    def component_risk(self, weights: np.ndarray, isins: List[str]) -> np.ndarray:
+        """
+        contributions of the isins to the daily volatility of a portfolio, they sum to the volatility
+        :param weights: weights of the isins
+        :param isins: list of isins
+        :return: array
+        """
+        return weights * self.marginal_risk(weights, isins)
+
+
+covariance_states = {state_class.name: state_class for state_class in (EwmaCovariance, RollingCovariance)}
+covariance_sources = {**covariance_states, UniverseCovariance.name: UniverseCovariance,
+                      FactorRiskModel.name: FactorRiskModel}
+
+
+def load_covariance_source(name: str = 'ewma', directory: str = None) -> CovarianceSource:
+    """
+    read a persisted covariance memory-mapped
+    :param name: "ewma", "rolling", "universe", "factor" or "sample"
+    :param directory: risk directory by default
+    :return: CovarianceSource object, None for the sample covariance or if the state was never computed
+    """
+    if name == 'sample':
+        return None
+    try:
+        return covariance_sources[name].load(directory, mmap_mode='r')
+    except FileNotFoundError:
+        logger.log.warning(f'{name} covariance not found, falling back to the sample covariance')
+        return None
@@ -47,8 +47,10 @@ plt.scatter([gmv_annualized_volatility] + [np.sqrt(e[1]) for e in efficient_port
 returns_array = np.linspace(gmv_expected_return, efficient_return, 100)
 efficient_portfolios = [optimizer.minimum_variance_optimization(target_return=r) for r in returns_array]
 plt.plot([np.sqrt(ptf[1]) for ptf in efficient_portfolios], [ptf[2] for ptf in efficient_portfolios])
-plt.show()
 
-# TODO: tangency portfolio with risk-free asset
+# Tangency portfolio with risk-free asset
+tangency_weights, tangency_var, tangency_return = optimizer.optimize_portfolios(['max_sharpe'])['max_sharpe']
+plt.scatter([np.sqrt(tangency_var)], [tangency_return])
+plt.show()
 
 pass
\ No newline at end of file
@@ -39,6 +39,86 @@ class Helpers:
         quotes_series.index = quotes_series.index.normalize()
         return quotes_series
 
+    def get_prices_panel(self, isins: list,
+                         start_date: dt.datetime = None,
+                         end_date: dt.datetime = None,
+                         window: int = None,
+                         field: str = 'price') -> pd.DataFrame:
+        """
+        get date-aligned quotes of several instruments in one query
+        :param isins: list of isins, define the order of the columns
+        :param start_date: first date, estimated from the window if None
+        :param end_date: last date excluded, today if None
+        :param window: number of most recent dates to keep
+        :param field: quote field, "price" or "volume"
+        :return: dataframe of quotes indexed by date with one column per isin, NaN when there is no quote
+        """
+        end_date = dt.datetime.today() if end_date is None else end_date
+        if start_date is None:
+            # calendar days covering the window of trading days, with a margin for holidays
+            start_date = end_date - dt.timedelta(days=int(window * 7 / 5) + 15) if window else dt.datetime(2000, 1, 1)
+
+        query_filter = {'isin': {'$in': list(isins)}, 'time': {'$gte': start_date, '$lt': end_date}}
+        query_result = self._mongo.find_documents(database_name='quotes', collection_name='equities',
+                                                  projection={'_id': 0, 'isin': 1, 'time': 1, field: 1},
+                                                  **query_filter)
+        quotes = pd.DataFrame(list(query_result), columns=['isin', 'time', field])
+        quotes['time'] = pd.to_datetime(quotes['time']).dt.normalize()
+        panel = quotes.pivot_table(index='time', columns='isin', values=field, aggfunc='last')
+        panel = panel.reindex(columns=list(isins)).sort_index()
+        if window is not None:
+            panel = panel.iloc[-window:]
+        return panel
+
+    def get_last_prices(self, isins: list,
+                        as_of_date: dt.datetime = None,
+                        field: str = 'price',
+                        lookback_days: int = 30) -> pd.Series:
+        """
+        get the last quote on or before a date of several instruments in one aggregation. Only the quotes of the
+        lookback period are matched, so that the sort reads a few documents per isin instead of their whole history
+        :param isins: list of isins, define the order of the result
+        :param as_of_date: quotes of this day are included, today if None
+        :param field: quote field, "price" or "volume"
+        :param lookback_days: number of days before the date where the last quote is searched
+        :return: series of quotes indexed by isin, NaN when there is no quote in the lookback period
+        """
+        as_of_date = dt.datetime.today() if as_of_date is None else as_of_date
+        end_date = dt.datetime(as_of_date.year, as_of_date.month, as_of_date.day) + dt.timedelta(days=1)
+        match = {'isin': {'$in': list(isins)},
+                 'time': {'$gte': end_date - dt.timedelta(days=lookback_days + 1), '$lt': end_date}}
+        pipeline = [{'$match': match},
+                    {'$sort': {'isin': 1, 'time': 1}},
+                    {'$group': {'_id': '$isin', field: {'$last': f'${field}'}}}]
+        query_result = self._mongo.aggregate_documents('quotes', 'equities', pipeline)
+        quotes = pd.DataFrame(list(query_result), columns=['_id', field]).set_index('_id')[field]
+        quotes = quotes.reindex(list(isins)).astype(np.float64)
+
+        missing_isins = quotes.index[quotes.isna()].tolist()
+        if missing_isins:
+            logger.log.warning(f'Could not find price in mongo for {missing_isins} in the {lookback_days} days '
+                               f'before {as_of_date}')
+        return quotes
+
+    @staticmethod
+    def align_prices(prices_panel: pd.DataFrame, missing_data: str = 'ffill') -> pd.DataFrame:
+        """
+        apply a missing data policy to a prices panel
+        :param prices_panel: dataframe of prices indexed by date with one column per isin
+        :param missing_data: "ffill": carry the last price forward and drop the dates before every isin is quoted,
+        "drop": drop the dates where any isin is not quoted, "pairwise": keep the missing prices, statistics are then
+        computed on pairwise-complete observations
+        :return: dataframe
+        """
+        if missing_data == 'ffill':
+            return prices_panel.ffill().dropna(how='any')
+        elif missing_data == 'drop':
+            return prices_panel.dropna(how='any')
+        elif missing_data == 'pairwise':
+            return prices_panel
+        else:
+            raise ValueError(f'missing data policy {missing_data} not valid')
+
     def get_price_from_mongo(self, isin, price_date):
         try:
             price = self.get_prices_from_mongo(isin, price_date, price_date + dt.timedelta(days=1))
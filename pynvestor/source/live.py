@@ -0,0 +1,239 @@
+import copy
+import queue
+import threading
+import numpy as np
+
+from collections import defaultdict
+from typing import Dict
+
+from pynvestor import logger
+from pynvestor.models.asset_type import AssetType
+from pynvestor.source import euronext, snapshot_cache
+from pynvestor.source.portfolio import Portfolio
+
+
+class LiveValuation:
+    """
+    Intraday valuation of a portfolio snapshot, updated incrementally from Euronext session data.
+    The cost of an update only depends on the number of lines, not on the ledger or net asset values history
+    """
+    def __init__(self, portfolio: Portfolio):
+        """
+        :param portfolio: live portfolio snapshot, it is not modified
+        """
+        self._holdings = copy.copy(portfolio.holdings)
+        self._mics = {position.isin: position.mic for position in portfolio.positions
+                      if position.asset_type is AssetType.EQUITY}
+        self._cash = portfolio.cash
+        self._portfolio_market_value = self._cash + self._holdings.market_value.sum()
+        self._previous_portfolio_market_value = self._cash + self._holdings.previous_market_value.sum()
+        # a line without performance since last close in the session data contributes nothing to the performance
+        self._perf_contributions = np.dot(np.nan_to_num(self._holdings.perf_since_last_close),
+                                          self._holdings.previous_market_value)
+        self._lock = threading.Lock()  # the poll thread updates the holdings while the stream routes read them
+
+    @property
+    def isins_mics(self):
+        return set(self._mics.items())
+
+    @staticmethod
+    def _parse_session(euronext_data: dict):
+        """
+        get last price, open price and performance since last close from euronext instrument details
+        :param euronext_data: instrument details
+        :return: tuple of floats
+        """
+        perf_since_last_close = np.nan
+        for perf in euronext_data['perf']:
+            if perf['perType'] == 'D':
+                perf_since_last_close = float(perf['var'])
+                break
+        return (float(euronext_data['currInstrSess']['lastPx']), float(euronext_data['currInstrSess']['openPx']),
+                perf_since_last_close)
+
+    def update(self, instruments_details: Dict[str, dict]) -> Dict:
+        """
+        update the valuation with new session data
+        :param instruments_details: euronext instrument details keyed by isin, may contain other instruments
+        :return: delta of the valuation, None if no price moved
+        """
+        with self._lock:
+            return self._update(instruments_details)
+
+    def _update(self, instruments_details: Dict[str, dict]) -> Dict:
+        holdings = self._holdings
+        locs = []
+        sessions = []
+        for loc, isin in enumerate(holdings.isins):
+            euronext_data = instruments_details.get(isin)
+            if euronext_data is None:
+                continue
+            session = self._parse_session(euronext_data)
+            if session[0] != holdings.price[loc] or session[1] != holdings.open_price[loc]:
+                locs.append(loc)
+                sessions.append(session)
+        if not locs:
+            return None
+
+        locs = np.array(locs, dtype=int)
+        prices, open_prices, perfs_since_last_close = np.array(sessions, dtype=np.float64).T
+
+        market_value_changes = holdings.quantity[locs] * prices - holdings.market_value[locs]
+        self._perf_contributions += np.dot(np.nan_to_num(perfs_since_last_close)
+                                           - np.nan_to_num(holdings.perf_since_last_close[locs]),
+                                           holdings.previous_market_value[locs])
+        self._portfolio_market_value += market_value_changes.sum()
+        holdings.price[locs] = prices
+        holdings.open_price[locs] = open_prices
+        holdings.perf_since_last_close[locs] = perfs_since_last_close
+        holdings.perf_since_open[locs] = prices / open_prices - 1
+        holdings.market_value[locs] += market_value_changes
+        np.divide(holdings.market_value, self._portfolio_market_value, out=holdings.weight)
+        return self._get_delta(locs)
+
+    def state(self) -> Dict:
+        """
+        full valuation in the same format as the deltas
+        :return: dictionary
+        """
+        with self._lock:
+            return self._get_delta(np.arange(len(self._holdings)))
+
+    def _get_delta(self, locs: np.ndarray) -> Dict:
+        holdings = self._holdings
+        lines = {holdings.isins[loc]: {'last_price': holdings.price[loc],
+                                       'market_value': holdings.market_value[loc],
+                                       'perf_since_open': holdings.perf_since_open[loc],
+                                       'perf_since_last_close': holdings.perf_since_last_close[loc]}
+                 for loc in locs}
+        return {'portfolio_market_value': self._portfolio_market_value,
+                'portfolio_perf': self.portfolio_perf,
+                'cash_weight': self._cash / self._portfolio_market_value,
+                'weights': holdings.to_dict('weight'),
+                'lines': lines}
+
+    @property
+    def portfolio_market_value(self):
+        return self._portfolio_market_value
+
+    @property
+    def portfolio_perf(self):
+        return self._perf_contributions / self._previous_portfolio_market_value
+
+    @property
+    def holdings(self):
+        return self._holdings
+
+
+class LiveValuationService:
+    """
+    Poll Euronext session data on a schedule for the union of the isins held by the streamed accounts, in one
+    batch per tick, and push the valuation deltas to the subscribers of each account
+    """
+    def __init__(self, interval: float = 5.0):
+        """
+        :param interval: seconds between two polls
+        """
+        self._interval = interval
+        self._valuations = {}
+        self._versions = {}
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, account_id: str = None) -> queue.Queue:
+        """
+        subscribe to the valuation deltas of an account, start polling if needed
+        :param account_id: id of the account
+        :return: queue receiving the deltas
+        """
+        subscription = queue.Queue()
+        loaded = None
+        while True:
+            with self._lock:
+                if account_id not in self._valuations and loaded is not None:
+                    self._versions[account_id], self._valuations[account_id] = loaded
+                # the last subscriber of the account may unsubscribe between two locks, it is then loaded again
+                if account_id in self._valuations:
+                    self._subscribers[account_id].append(subscription)
+                    if self._thread is None or not self._thread.is_alive():
+                        self._stop.clear()
+                        self._thread = threading.Thread(target=self._poll, name='live-valuation', daemon=True)
+                        self._thread.start()
+                    return subscription
+            loaded = self._load_valuation(account_id)
+
+    def unsubscribe(self, account_id: str, subscription: queue.Queue) -> bool:
+        """
+        stop pushing deltas to a subscriber, stop polling when there is no subscriber left
+        :param account_id: id of the account
+        :param subscription: queue returned by subscribe
+        :return: True
+        """
+        with self._lock:
+            self._subscribers[account_id].remove(subscription)
+            if not self._subscribers[account_id]:
+                del self._subscribers[account_id]
+                del self._valuations[account_id]
+                del self._versions[account_id]
+            if not self._subscribers:
+                self._stop.set()
+        return True
+
+    def get_valuation(self, account_id: str = None) -> LiveValuation:
+        with self._lock:
+            return self._valuations.get(account_id)
+
+    @staticmethod
+    def _load_valuation(account_id: str = None) -> tuple:
+        # Called without the lock: loading the snapshot reads Euronext and mongo, the caller swaps the result in
+        version = snapshot_cache.version(account_id)
+        return version, LiveValuation(Portfolio.cached(account_id=account_id))
+
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.log.warning(f'live valuation tick failed - {type(e)}: {e}')
+            self._stop.wait(self._interval)
+
+    def tick(self) -> bool:
+        """
+        fetch session data once for all the held instruments and push the deltas
+        :return: True
+        """
+        with self._lock:
+            versions = dict(self._versions)
+            stale_accounts = [account_id for account_id in self._valuations
+                              if snapshot_cache.version(account_id) != versions[account_id]]
+        reloaded_valuations = {account_id: self._load_valuation(account_id) for account_id in stale_accounts}
+
+        reloaded_accounts = set()
+        with self._lock:
+            for account_id, (version, valuation) in reloaded_valuations.items():
+                # the account may have been unsubscribed or reloaded by another caller meanwhile
+                if account_id in self._valuations and self._versions[account_id] == versions[account_id]:
+                    self._versions[account_id] = version
+                    self._valuations[account_id] = valuation
+                    reloaded_accounts.add(account_id)
+            valuations = dict(self._valuations)
+
+        isins_mics = set().union(*[valuation.isins_mics for valuation in valuations.values()])
+        instruments_details = {}
+        if isins_mics:
+            for instrument_details in euronext.get_instruments_details(list(isins_mics)):
+                instruments_details.update(instrument_details)
+
+        for account_id, valuation in valuations.items():
+            delta = valuation.update(instruments_details)
+            if account_id in reloaded_accounts:
+                delta = valuation.state()  # positions changed, push the whole valuation
+            if delta is None:
+                continue
+            with self._lock:
+                subscribers = list(self._subscribers.get(account_id, []))
+            for subscription in subscribers:
+                subscription.put(delta)
+        return True
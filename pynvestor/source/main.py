@@ -6,6 +6,9 @@ from pathlib import Path
 from requests.exceptions import HTTPError
 from pynvestor import logger
 from pynvestor.source import mongo, euronext, reuters
+from pynvestor.source.covariance import covariance_states, UniverseCovariance, FactorRiskModel
+from pynvestor.source.helpers import Helpers
+from pynvestor.source.ratios import update_ratios, update_market_ratios
 
 
 @logger
@@ -38,6 +41,63 @@ def check_quotes():
     assert len(quotes) == 0
 
 
+@logger
+def update_covariance_states(lookback_days: int = 500) -> True:
+    universe = [stock['isin'] for stock in euronext.all_stocks if stock['mic'] in ['XPAR', 'ALXP', 'XBRU']]
+
+    states = []
+    for state_class in covariance_states.values():
+        try:
+            state = state_class.load()
+            state.reindex(universe)
+        except FileNotFoundError:
+            state = state_class(universe)
+        states.append(state)
+
+    # One prices panel covering the dates missing from every state, a state is only updated with newer returns
+    last_dates = [state.last_date for state in states]
+    if None in last_dates:
+        prices_panel = Helpers().get_prices_panel(universe, window=lookback_days + 1)
+    else:
+        prices_panel = Helpers().get_prices_panel(universe, start_date=min(last_dates))
+    returns_panel = prices_panel.pct_change(fill_method=None).iloc[1:]
+
+    for state in states:
+        state.update_from_returns(returns_panel)
+        state.save()
+    return True
+
+
+@logger
+def update_universe_covariance(lookback_days: int = 500, processes: int = 4) -> True:
+    universe = [stock['isin'] for stock in euronext.all_stocks if stock['mic'] in ['XPAR', 'ALXP', 'XBRU']]
+    prices_panel = Helpers().get_prices_panel(universe, window=lookback_days + 1)
+    returns_panel = prices_panel.pct_change(fill_method=None).iloc[1:]
+    UniverseCovariance.compute(returns_panel, processes=processes)
+    return True
+
+
+@logger
+def update_factor_model(lookback_days: int = 500, n_factors: int = 10) -> True:
+    isins_mics = [(stock['isin'], stock['mic'])
+                  for stock in euronext.all_stocks if stock['mic'] in ['XPAR', 'ALXP', 'XBRU']]
+    universe = [isin for isin, _ in isins_mics]
+
+    sectors = {}
+    for instrument_details in euronext.get_instruments_details(isins_mics):
+        for isin, details in instrument_details.items():
+            if details is None or details.get('instrRel') is None:
+                continue
+            for elem in details['instrRel']:
+                if elem['instrLst'].get('lstType') == 'SEC' and elem['instrLst'].get('lstLvl') == '1':
+                    sectors[isin] = elem['instrLst']['lstLbl']
+
+    prices_panel = Helpers().get_prices_panel(universe, window=lookback_days + 1)
+    returns_panel = prices_panel.pct_change(fill_method=None).iloc[1:]
+    FactorRiskModel.fit(returns_panel, n_factors=n_factors, sectors=sectors).save()
+    return True
+
+
 @logger
 def update_fundamentals():
     app_path = Path(__file__).parents[1]
@@ -85,6 +145,11 @@ def update_fundamentals():
                                collection_name=statement,
                                documents=data_to_insert[statement])
 
+    # refresh the materialized ratios of the rics fetched
+    updated_rics = {data['ric'] for statement_data in data_to_insert.values() for data in statement_data}
+    if updated_rics:
+        update_ratios(list(updated_rics))
+
     return True
 
 
@@ -141,4 +206,8 @@ if __name__ == '__main__':
         thread.join()
 
     check_quotes()
+    update_market_ratios()
+    update_covariance_states()
+    update_universe_covariance()
+    update_factor_model()
 
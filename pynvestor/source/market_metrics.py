@@ -0,0 +1,105 @@
+import datetime as dt
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from collections import OrderedDict
+from typing import List
+
+from pynvestor.models.indices import CAC_40_ISIN
+from pynvestor.source.helpers import Helpers
+
+momentum_windows = {'momentum_1m': 21, 'momentum_3m': 63, 'momentum_6m': 126, 'momentum_12m': 252}
+market_metrics_names = ['beta', 'volatility'] + list(momentum_windows) + ['max_drawdown', 'average_volume']
+market_metrics_window = max(momentum_windows.values()) + 1  # number of daily quotes of the metrics
+
+
+def compute_market_metrics(prices_panel: pd.DataFrame, volumes_panel: pd.DataFrame, reference_isin: str = CAC_40_ISIN,
+                           lookback_days: int = 252, volume_days: int = 63, min_periods: int = 20) -> pd.DataFrame:
+    """
+    compute the market metrics of all the instruments of a prices panel at its last date, as array operations on
+    the whole panel
+    :param prices_panel: daily prices with one column per isin, including the reference
+    :param volumes_panel: daily traded volumes with the columns of the prices panel
+    :param reference_isin: isin of the reference index of the betas
+    :param lookback_days: number of daily returns of the beta, the volatility and the maximum drawdown
+    :param volume_days: number of days of the average volume
+    :param min_periods: minimum number of returns of the beta and the volatility
+    :return: dataframe indexed by isin with one column per metric, NaN when the history is too short
+    """
+    isins = [isin for isin in prices_panel.columns if isin != reference_isin]
+    prices = prices_panel[isins].values
+    filled_prices = prices_panel[isins].ffill().values
+    returns = prices[1:] / prices[:-1] - 1
+    returns = returns[-lookback_days:]
+    reference_returns = prices_panel[reference_isin].pct_change(fill_method=None).values[1:][-lookback_days:, None]
+
+    # pairwise-complete statistics of the returns with the reference
+    with np.errstate(invalid='ignore', divide='ignore'):
+        observed = ~np.isnan(returns)
+        counts = observed.sum(axis=0)
+        volatility = np.nanstd(returns, axis=0, ddof=1) * np.sqrt(252)
+
+        common = observed & ~np.isnan(reference_returns)
+        common_counts = common.sum(axis=0)
+        assets_returns = np.where(common, returns, 0.0)
+        proxy_returns = np.where(common, reference_returns, 0.0)
+        assets_means = assets_returns.sum(axis=0) / common_counts
+        proxy_means = proxy_returns.sum(axis=0) / common_counts
+        covariances = (assets_returns * proxy_returns).sum(axis=0) / common_counts - assets_means * proxy_means
+        reference_variances = (proxy_returns ** 2).sum(axis=0) / common_counts - proxy_means ** 2
+        beta = covariances / reference_variances
+
+        metrics = {'beta': np.where(common_counts >= min_periods, beta, np.nan),
+                   'volatility': np.where(counts >= min_periods, volatility, np.nan)}
+        for name, window in momentum_windows.items():
+            past_prices = filled_prices[-window - 1] if len(filled_prices) > window else np.full(len(isins), np.nan)
+            metrics[name] = filled_prices[-1] / past_prices - 1
+
+        window_prices = filled_prices[-lookback_days - 1:]
+        metrics['max_drawdown'] = np.nanmin(window_prices / np.fmax.accumulate(window_prices, axis=0) - 1, axis=0)
+        metrics['average_volume'] = np.nanmean(volumes_panel[isins].values[-volume_days:], axis=0)
+
+    return pd.DataFrame(metrics, index=isins, columns=market_metrics_names)
+
+
+_market_metrics = OrderedDict()
+_market_metrics_lock = threading.Lock()
+_market_metrics_max_size = 32
+
+
+def get_market_metrics(isins: List[str], as_of_date: dt.datetime = None, reference_isin: str = CAC_40_ISIN,
+                       helpers: Helpers = None) -> pd.DataFrame:
+    """
+    get the market metrics of a universe at a date, computed from the prices and volumes of quotes.equities once per
+    day and universe
+    :param isins: universe
+    :param as_of_date: date of the metrics, quotes of this day are included, today if None
+    :param reference_isin: isin of the reference index of the betas
+    :param helpers: Helpers object, created if None
+    :return: dataframe indexed by isin with one column per metric
+    """
+    as_of_date = dt.datetime.today() if as_of_date is None else as_of_date
+    as_of_day = dt.datetime(as_of_date.year, as_of_date.month, as_of_date.day)
+    isins = list(isins)
+    key = hashlib.sha1(repr((as_of_day, reference_isin, sorted(isins))).encode()).hexdigest()
+    with _market_metrics_lock:
+        if key in _market_metrics:
+            _market_metrics.move_to_end(key)
+            return _market_metrics[key]
+
+    helpers = helpers or Helpers()
+    universe = list(dict.fromkeys(isins + [reference_isin]))
+    end_date = as_of_day + dt.timedelta(days=1)
+    prices_panel = helpers.get_prices_panel(universe, end_date=end_date, window=market_metrics_window)
+    volumes_panel = helpers.get_prices_panel(universe, end_date=end_date, window=market_metrics_window,
+                                             field='volume')
+    volumes_panel = volumes_panel.reindex(index=prices_panel.index, columns=prices_panel.columns)
+    market_metrics = compute_market_metrics(prices_panel, volumes_panel, reference_isin).reindex(isins)
+
+    with _market_metrics_lock:
+        _market_metrics[key] = market_metrics
+        if len(_market_metrics) > _market_metrics_max_size:
+            _market_metrics.popitem(last=False)
+    return market_metrics
@@ -2,7 +2,7 @@ from os import environ
 
 from pynvestor import logger
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from pymongo.errors import BulkWriteError
 
 from typing import Generator
@@ -72,6 +72,25 @@ class MongoConnector:
                                f"{bulk_write_error.details['nInserted']} documents, encountered "
                                f"{len(bulk_write_error.details['writeErrors'])} write errors")
 
+    def upsert_documents(self, database_name: str, collection_name: str, documents: list, keys: list):
+        """
+        update the documents matching the keys of each document, insert them if they do not exist, in one bulk write
+        :param database_name: str
+        :param collection_name: str
+        :param documents: list of dict - the fields of every document are set, the other fields are kept
+        :param keys: list of str - fields identifying a document - ["field1", "field2"]
+        :return: number of documents updated and inserted
+        """
+        if not documents:
+            return 0
+        collection = getattr(getattr(self._mongo_client, database_name), collection_name)
+        requests = [UpdateOne({key: document[key] for key in keys}, {'$set': document}, upsert=True)
+                    for document in documents]
+        result = collection.bulk_write(requests, ordered=False)
+        logger.log.info(f"updated {result.modified_count} and inserted {result.upserted_count} documents in "
+                        f"{database_name}.{collection_name}")
+        return result.modified_count + result.upserted_count
+
     def aggregate_documents(self, database_name: str, collection_name: str, pipeline):
         collection = getattr(getattr(self._mongo_client, database_name), collection_name)
         result = collection.aggregate(pipeline)
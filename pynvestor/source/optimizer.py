@@ -1,44 +1,447 @@
+import hashlib
+import threading
 import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from scipy import optimize
 
-from pynvestor.source.helpers import Helpers
+from typing import Dict, List
+
+from pynvestor.models.constraints import PortfolioConstraints
+from pynvestor.source.covariance import CovarianceSource
+from pynvestor.source.portfolio import Portfolio
 from pynvestor.source.risk import PortfolioRiskManager
 
 
-class Optimizer(PortfolioRiskManager):
-    def __init__(self, risk_free_rate: float):
-        super().__init__(risk_free_rate)
+def _solve_long_only_minimum_variance(covariance_matrix: np.ndarray, budget: float = 1.0,
+                                      tolerance: float = 1e-12) -> np.ndarray:
+    """
+    long-only minimum variance portfolio: min w'Cw subject to sum(w) = budget and w >= 0. A singular covariance
+    matrix (e.g. fewer dates than assets) can keep the active set from converging, the problem is then solved again
+    with a small ridge on the diagonal, and by SLSQP as a last resort
+    :param covariance_matrix: covariance matrix
+    :param budget: sum of the weights
+    :param tolerance: tolerance of the optimality conditions
+    :return: optimal weights
+    """
+    weights = _solve_active_set(covariance_matrix, budget, tolerance)
+    if weights is None:
+        n_assets = len(covariance_matrix)
+        ridge = 1e-8 * max(np.trace(covariance_matrix) / n_assets, np.finfo(np.float64).tiny)
+        weights = _solve_active_set(covariance_matrix + ridge * np.eye(n_assets), budget, tolerance)
+    if weights is None:
+        weights, _ = _solve_minimum_variance(covariance_matrix, np.zeros(len(covariance_matrix)), 0.0, budget)
+    return weights
+
+
+def _solve_active_set(covariance_matrix: np.ndarray, budget: float, tolerance: float) -> np.ndarray:
+    """
+    primal active-set solver of min w'Cw subject to sum(w) = budget and w >= 0. Each iteration solves the
+    equality-constrained problem on the free assets with one linear system
+    :param covariance_matrix: covariance matrix
+    :param budget: sum of the weights
+    :param tolerance: tolerance of the optimality conditions
+    :return: optimal weights, None if the active set did not converge
+    """
+    n_assets = len(covariance_matrix)
+    weights = np.full(n_assets, budget / n_assets)
+    free = np.ones(n_assets, dtype=bool)
+
+    for _ in range(4 * n_assets + 10):
+        # minimum of the free assets with the others at 0: C_ff w_f = nu * 1
+        free_covariance = covariance_matrix[np.ix_(free, free)]
+        try:
+            direction = np.linalg.solve(free_covariance, np.ones(free.sum()))
+        except np.linalg.LinAlgError:
+            direction = np.linalg.lstsq(free_covariance, np.ones(free.sum()), rcond=None)[0]
+        candidate = np.zeros(n_assets)
+        candidate[free] = budget * direction / direction.sum()
+
+        step = candidate - weights
+        blocking = free & (step < -tolerance)
+        if blocking.any() and (candidate[blocking] < -tolerance).any():
+            # move toward the candidate until the first weight reaches 0, and fix it
+            ratios = np.full(n_assets, np.inf)
+            ratios[blocking] = -weights[blocking] / step[blocking]
+            blocking_asset = np.argmin(ratios)
+            weights = np.maximum(weights + ratios[blocking_asset] * step, 0.0)
+            weights[blocking_asset] = 0.0
+            free[blocking_asset] = False
+            continue
+
+        weights = np.maximum(candidate, 0.0)
+        gradient = covariance_matrix.dot(weights)
+        multipliers = gradient - gradient[free].mean()
+        if free.all() or multipliers[~free].min() >= -tolerance * np.abs(gradient).max():
+            return weights
+        # releasing the fixed asset with the most negative multiplier decreases the variance
+        released_asset = np.flatnonzero(~free)[np.argmin(multipliers[~free])]
+        free[released_asset] = True
+
+    return None
+
+
+def _solve_minimum_variance(covariance_matrix: np.ndarray, mean_returns: np.ndarray, target_return: float,
+                            budget: float, initial_weights: np.ndarray = None):
+    """
+    long-only minimum variance portfolio with an expected return greater than a target, solved by SLSQP with
+    analytic gradients
+    :param covariance_matrix: covariance matrix
+    :param mean_returns: expected returns
+    :param target_return: minimum expected return of the portfolio
+    :param budget: sum of the weights
+    :param initial_weights: starting point, e.g. the solution of a neighbouring target, equal weights if None
+    :return: optimal weights and variance
+    """
+    n_assets = len(covariance_matrix)
+    if initial_weights is None:
+        initial_weights = np.full(n_assets, budget / n_assets)
+
+    def func_to_minimize(w, cov_matrix):
+        # variance and its analytic gradient, the covariance matrix is computed once by the risk manager
+        cov_weights = cov_matrix.dot(w)
+        return w.dot(cov_weights), 2 * cov_weights
+
+    budget_jacobian = np.ones(n_assets)
+    constraints = (
+        # stock weights + cash weight must equal 1
+        {'type': 'eq', 'fun': lambda w: np.sum(w) - budget, 'jac': lambda w: budget_jacobian},
+        # portfolio expected return must equals or greater than a target return
+        {'type': 'ineq', 'fun': lambda w: np.dot(w, mean_returns) - target_return, 'jac': lambda w: mean_returns}
+    )
+    bounds = tuple((0.0, 1.0) for _ in range(n_assets))
+
+    result = optimize.minimize(func_to_minimize,
+                               initial_weights,
+                               args=(covariance_matrix,),
+                               jac=True,
+                               method='SLSQP',
+                               bounds=bounds,
+                               constraints=constraints)
+
+    assert result.status == 0, result.message
+    return result.x, result.fun
+
+
+def _trace_frontier_segment(covariance_matrix: np.ndarray, mean_returns: np.ndarray, target_returns: np.ndarray,
+                            budget: float, initial_weights: np.ndarray = None):
+    """
+    solve consecutive points of the efficient frontier, each one starting from the solution of the previous one
+    :param covariance_matrix: covariance matrix
+    :param mean_returns: expected returns
+    :param target_returns: increasing target returns of the segment
+    :param budget: sum of the weights
+    :param initial_weights: starting point of the first target
+    :return: list of optimal weights and variances
+    """
+    solutions = []
+    for target_return in target_returns:
+        initial_weights, variance = _solve_minimum_variance(covariance_matrix, mean_returns, target_return, budget,
+                                                            initial_weights)
+        solutions.append((initial_weights, variance))
+    return solutions
+
+
+def _negative_ratio(w, cov_matrix, numerator_vector, offset):
+    # -(w.a - offset) / sqrt(w'Cw) and its gradient: the opposite of the Sharpe or of the diversification ratio
+    cov_weights = cov_matrix.dot(w)
+    volatility = np.sqrt(w.dot(cov_weights))
+    numerator = w.dot(numerator_vector) - offset
+    return -numerator / volatility, -(numerator_vector / volatility - numerator * cov_weights / volatility ** 3)
+
+
+def _risk_parity_objective(w, cov_matrix):
+    # squared distances between the shares of the variance of each asset and an equal share, and the gradient
+    cov_weights = cov_matrix.dot(w)
+    variance = w.dot(cov_weights)
+    risk_contributions = w * cov_weights
+    distances = risk_contributions / variance - 1 / len(w)
+    gradient = 2 * ((cov_weights * distances + cov_matrix.dot(w * distances)) / variance
+                    - 2 * cov_weights * risk_contributions.dot(distances) / variance ** 2)
+    return distances.dot(distances), gradient
+
+
+def solve_portfolio(objective: str, covariance_matrix: np.ndarray, mean_returns: np.ndarray,
+                    risk_free_rate: float, isins: List[str], constraints: PortfolioConstraints,
+                    budget: float, initial_weights: np.ndarray = None) -> np.ndarray:
+    """
+    solve one portfolio, used by the batches of Optimizer and by WalkForwardOptimizer
+    :param objective: "minimum_variance", "max_sharpe", "risk_parity" or "max_diversification"
+    :param covariance_matrix: annualized covariance matrix
+    :param mean_returns: annualized expected returns
+    :param risk_free_rate: annual risk-free rate
+    :param isins: isins of the weights
+    :param constraints: PortfolioConstraints object
+    :param budget: sum of the weights
+    :param initial_weights: starting point (e.g. the previous solution), default starting point of the objective
+    if None
+    :return: optimal weights
+    """
+    n_assets = len(covariance_matrix)
+    if objective == 'minimum_variance':
+        if constraints.is_long_only:
+            return _solve_long_only_minimum_variance(covariance_matrix, budget)
+
+        def func_to_minimize(w, cov_matrix):
+            cov_weights = cov_matrix.dot(w)
+            return w.dot(cov_weights), 2 * cov_weights
+        args = (covariance_matrix,)
+        default_weights = np.full(n_assets, budget / n_assets)
+
+    elif objective == 'max_sharpe':
+        func_to_minimize = _negative_ratio
+        args = (covariance_matrix, mean_returns, risk_free_rate * budget)
+        default_weights = np.full(n_assets, budget / n_assets)
+
+    elif objective == 'max_diversification':
+        func_to_minimize = _negative_ratio
+        args = (covariance_matrix, np.sqrt(np.diag(covariance_matrix)), 0.0)
+        default_weights = np.full(n_assets, budget / n_assets)
+
+    elif objective == 'risk_parity':
+        func_to_minimize = _risk_parity_objective
+        args = (covariance_matrix,)
+        # inverse volatility weights are the risk parity portfolio of uncorrelated assets
+        inverse_volatilities = 1 / np.sqrt(np.diag(covariance_matrix))
+        default_weights = budget * inverse_volatilities / inverse_volatilities.sum()
+
+    else:
+        raise ValueError(f'objective {objective} not valid')
 
-    def minimum_variance_optimization(self, target_return: float = 0.0):
+    if initial_weights is None:
+        initial_weights = default_weights
 
-        initial_weights = np.array(len(self.stocks_weights) * [(1 - self.cash_weight) / len(self.stocks_weights)])
+    initial_weights = np.clip(initial_weights, constraints.min_weight, constraints.max_weight)
+    result = optimize.minimize(func_to_minimize,
+                               initial_weights,
+                               args=args,
+                               jac=True,
+                               method='SLSQP',
+                               bounds=constraints.get_bounds(n_assets),
+                               constraints=constraints.get_linear_constraints(isins, budget))
 
-        def func_to_minimize(w, r): return Helpers.compute_portfolio_variance(w, r)[0]
+    assert result.status == 0, f'{objective}: {result.message}'
+    return result.x
 
-        constraints = (
-            # stock weights + cash weight must equal 1
-            {'type': 'eq', 'fun': lambda w: np.sum(w) + self.cash_weight - 1},
-            # portfolio expected return must equals or greater than a target return
-            {'type': 'ineq', 'fun': lambda w: np.dot(w, self._mean_returns) - target_return}
-        )
-        bounds = tuple((0.0, 1.0) for _ in range(len(self.stocks_weights)))
 
-        result = optimize.minimize(func_to_minimize,
-                                   initial_weights,
-                                   args=(self._histo_returns,),
-                                   method='SLSQP',
-                                   bounds=bounds,
-                                   constraints=constraints)
+def _resample_frontiers(shared_returns_name: str, returns_shape: tuple, seed_sequence: np.random.SeedSequence,
+                        n_samples: int, method: str, n_points: int, budget: float):
+    """
+    solve the efficient frontiers of a chunk of resampled returns, the historical returns are read from shared
+    memory instead of being copied to every worker
+    :param shared_returns_name: name of the shared memory block of the daily returns
+    :param returns_shape: shape (dates, assets) of the daily returns
+    :param seed_sequence: seed of the chunk
+    :param n_samples: number of samples of the chunk
+    :param method: "bootstrap" to draw dates with replacement, "parametric" to draw normal returns
+    :param n_points: number of points of every frontier, points of the same rank are averaged
+    :param budget: sum of the weights
+    :return: sum of the weights of the frontiers by rank and number of frontiers solved
+    """
+    shared_returns = shared_memory.SharedMemory(name=shared_returns_name)
+    try:
+        returns = np.ndarray(returns_shape, dtype=np.float64, buffer=shared_returns.buf)
+        n_dates, n_assets = returns_shape
+        generator = np.random.default_rng(seed_sequence)
+        mean_returns = returns.mean(axis=0)
+        covariance_matrix = np.cov(returns, rowvar=False)
 
-        assert result.status == 0, result.message
-        optimal_weights = result.x
-        min_var = result.fun
+        weights_sum = np.zeros((n_points, n_assets))
+        n_frontiers = 0
+        for _ in range(n_samples):
+            if method == 'bootstrap':
+                sample_returns = returns[generator.integers(0, n_dates, n_dates)]
+            elif method == 'parametric':
+                sample_returns = generator.multivariate_normal(mean_returns, covariance_matrix, n_dates)
+            else:
+                raise ValueError(f'method {method} not valid')
+            sample_mean_returns = sample_returns.mean(axis=0)
+            sample_covariance_matrix = np.cov(sample_returns, rowvar=False) * 252
+
+            try:
+                gmv_weights = _solve_long_only_minimum_variance(sample_covariance_matrix, budget)
+                target_returns = np.linspace(gmv_weights.dot(sample_mean_returns),
+                                             sample_mean_returns.max() * budget, n_points)
+                solutions = _trace_frontier_segment(sample_covariance_matrix, sample_mean_returns, target_returns,
+                                                    budget, gmv_weights)
+            except (AssertionError, RuntimeError, ValueError, np.linalg.LinAlgError):
+                continue  # a sample whose frontier does not converge is left out of the average
+            weights_sum += np.array([weights for weights, _ in solutions])
+            n_frontiers += 1
+        returns = None
+        return weights_sum, n_frontiers
+    finally:
+        shared_returns.close()
+
+
+_frontiers = OrderedDict()
+_frontiers_lock = threading.Lock()
+_frontiers_max_size = 32
+
+
+def _get_frontier_key(*arrays) -> str:
+    return hashlib.sha1(b''.join(np.asarray(array).tobytes() for array in arrays)).hexdigest()
+
+
+def _get_cached_frontier(key: str):
+    with _frontiers_lock:
+        if key in _frontiers:
+            _frontiers.move_to_end(key)
+            return _frontiers[key]
+    return None
+
+
+def _cache_frontier(key: str, frontier: tuple) -> bool:
+    with _frontiers_lock:
+        _frontiers[key] = frontier
+        if len(_frontiers) > _frontiers_max_size:
+            _frontiers.popitem(last=False)
+    return True
+
+
+class Optimizer(PortfolioRiskManager):
+    def __init__(self, risk_free_rate: float, account_id: str = None, snapshot: Portfolio = None,
+                 covariance_source: CovarianceSource = None):
+        super().__init__(risk_free_rate, account_id=account_id, snapshot=snapshot,
+                         covariance_source=covariance_source)
+        self._risk_free_rate = risk_free_rate
+
+    def minimum_variance_optimization(self, target_return: float = 0.0, initial_weights: np.ndarray = None):
+
+        optimal_weights, min_var = _solve_minimum_variance(self._covariance_matrix, self._mean_returns, target_return,
+                                                           1 - self.cash_weight, initial_weights)
 
         ptf_mean_return = np.dot(optimal_weights, self._mean_returns)
 
         return optimal_weights, min_var, ptf_mean_return
 
+    def global_minimum_variance(self):
+        """
+        long-only global minimum variance portfolio, solved as a quadratic program by an active-set method
+        :return: optimal weights, annualized variance and daily mean return of the portfolio
+        """
+        optimal_weights = _solve_long_only_minimum_variance(self._covariance_matrix, 1 - self.cash_weight)
+        min_var = optimal_weights.dot(self._covariance_matrix).dot(optimal_weights)
+        ptf_mean_return = np.dot(optimal_weights, self._mean_returns)
+        return optimal_weights, min_var, ptf_mean_return
+
     def portfolio_optimization(self):
-        weights = np.array(list(self.stocks_weights.values()))
-        portfolio_expected_return = np.dot(weights, self._mean_returns)
+        portfolio_expected_return = np.dot(self._holdings.weight, self._mean_returns)
         return self.minimum_variance_optimization(target_return=float(portfolio_expected_return))
+
+    def efficient_frontier(self, n_points: int = 100, processes: int = None):
+        """
+        trace the efficient frontier between the global minimum variance portfolio and the efficient portfolio with
+        the return of the best stock. Each point starts from the solution of its neighbour, the targets are split in
+        contiguous segments solved in parallel if processes is given. Frontiers are cached by the hash of the
+        expected returns, the covariance matrix and the parameters
+        :param n_points: number of points of the frontier
+        :param processes: number of processes solving the segments, solved in the current process if None
+        :return: lists of optimal weights, annualized variances and expected returns
+        """
+        budget = 1 - self.cash_weight
+        key = _get_frontier_key(self._mean_returns, self._covariance_matrix, np.array([budget, n_points]))
+        frontier = _get_cached_frontier(key)
+        if frontier is not None:
+            return frontier
+
+        gmv_weights, _, gmv_return = self.global_minimum_variance()
+        max_return = max(self._mean_returns) * budget
+        target_returns = np.linspace(gmv_return, max_return, n_points)
+
+        n_segments = min(processes or 1, n_points)
+        segments = np.array_split(target_returns, n_segments)
+        # the first segment starts from the global minimum variance portfolio, the others from equal weights
+        segments_args = [[self._covariance_matrix, self._mean_returns, segment, budget,
+                          gmv_weights if i == 0 else None] for i, segment in enumerate(segments)]
+        if processes is None:
+            segments_solutions = [_trace_frontier_segment(*args) for args in segments_args]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                segments_solutions = list(executor.map(_trace_frontier_segment, *zip(*segments_args)))
+
+        efficient_weights, efficient_var = zip(*[solution for solutions in segments_solutions
+                                                 for solution in solutions])
+        efficient_returns = [np.dot(weights, self._mean_returns) for weights in efficient_weights]
+        frontier = list(efficient_weights), list(efficient_var), efficient_returns
+        _cache_frontier(key, frontier)
+        return frontier
+
+    def optimize_portfolios(self, objectives: List[str] = ('minimum_variance', 'max_sharpe', 'risk_parity',
+                                                           'max_diversification'),
+                            constraints: PortfolioConstraints = None, processes: int = None) -> Dict[str, tuple]:
+        """
+        solve several portfolios in one call, sharing the covariance matrix and the constraints
+        :param objectives: "minimum_variance", "max_sharpe" (tangency portfolio), "risk_parity" (equal risk
+        contributions) and "max_diversification"
+        :param constraints: PortfolioConstraints object, long-only with the current cash weight if None
+        :param processes: number of processes solving the portfolios, solved in the current process if None
+        :return: dictionary of optimal weights, annualized variance and daily mean return keyed by objective
+        """
+        constraints = constraints or PortfolioConstraints()
+        budget = 1 - (self.cash_weight if constraints.cash_weight is None else constraints.cash_weight)
+        portfolios_args = [[objective, self._covariance_matrix, self._annualized_mean_returns, self._risk_free_rate,
+                            self._holdings.isins.tolist(), constraints, budget] for objective in objectives]
+        if processes is None:
+            portfolios_weights = [solve_portfolio(*args) for args in portfolios_args]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                portfolios_weights = list(executor.map(solve_portfolio, *zip(*portfolios_args)))
+
+        return {objective: (weights, weights.dot(self._covariance_matrix).dot(weights),
+                            np.dot(weights, self._mean_returns))
+                for objective, weights in zip(objectives, portfolios_weights)}
+
+    def resampled_efficient_frontier(self, n_samples: int = 500, n_points: int = 20, method: str = 'bootstrap',
+                                     seed: int = None, processes: int = None, chunk_size: int = 25):
+        """
+        resampled (Michaud) efficient frontier: frontiers are solved on returns resampled from the historical
+        returns, the weights of the points of the same rank are averaged and evaluated with the historical estimates.
+        Resampled frontiers are cached with the efficient frontiers by the hash of the returns and the parameters, a
+        frontier without seed is drawn once per returns
+        :param n_samples: number of resampled frontiers
+        :param n_points: number of points of the frontier
+        :param method: "bootstrap" or "parametric"
+        :param seed: seed of the samples
+        :param processes: number of processes solving the samples, solved in the current process if None
+        :param chunk_size: number of samples per task
+        :return: lists of averaged weights, annualized variances and expected returns
+        """
+        returns = np.ascontiguousarray(self._returns_panel.dropna().values, dtype=np.float64)
+        budget = 1 - self.cash_weight
+        key = _get_frontier_key(returns, np.array(returns.shape), self._mean_returns, self._covariance_matrix,
+                                np.array([budget, n_samples, n_points, -1 if seed is None else seed]),
+                                np.frombuffer(method.encode(), dtype=np.uint8))
+        frontier = _get_cached_frontier(key)
+        if frontier is not None:
+            return frontier
+
+        chunks_sizes = [chunk_size] * (n_samples // chunk_size)
+        if n_samples % chunk_size:
+            chunks_sizes.append(n_samples % chunk_size)
+        seed_sequences = np.random.SeedSequence(seed).spawn(len(chunks_sizes))
+
+        shared_returns = shared_memory.SharedMemory(create=True, size=returns.nbytes)
+        try:
+            np.ndarray(returns.shape, dtype=np.float64, buffer=shared_returns.buf)[:] = returns
+            chunks_args = [[shared_returns.name, returns.shape, seed_sequence, size, method, n_points, budget]
+                           for seed_sequence, size in zip(seed_sequences, chunks_sizes)]
+            if processes is None:
+                chunks_results = [_resample_frontiers(*args) for args in chunks_args]
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    chunks_results = list(executor.map(_resample_frontiers, *zip(*chunks_args)))
+        finally:
+            shared_returns.close()
+            shared_returns.unlink()
+
+        weights_sums, n_frontiers = zip(*chunks_results)
+        assert sum(n_frontiers) > 0, f'none of the {n_samples} resampled frontiers converged'
+        resampled_weights = np.sum(weights_sums, axis=0) / sum(n_frontiers)
+        resampled_var = [weights.dot(self._covariance_matrix).dot(weights) for weights in resampled_weights]
+        resampled_returns = [np.dot(weights, self._mean_returns) for weights in resampled_weights]
+        frontier = list(resampled_weights), resampled_var, resampled_returns
+        _cache_frontier(key, frontier)
+        return frontier
@@ -64,8 +64,8 @@ class PerformanceAttribution:
         return self._df_benchmark.groupby(self.breakdown).sum()[['weight', 'contribution_b']]
 
     def _get_portfolio_groups(self):
-        ptf_0 = Portfolio(self._previous_trading_date)
-        ptf_1 = Portfolio()
+        ptf_0 = Portfolio.cached(self._previous_trading_date)
+        ptf_1 = Portfolio.cached()
         data = {}
         sector = None
         subsector = None
@@ -1,140 +1,239 @@
+import copy
 import datetime as dt
-from typing import List
+from collections import defaultdict
+from typing import Dict, List
 
-from pandas import DataFrame, Series
+import numpy as np
+from pandas import DataFrame
 
 from pynvestor.models.asset_type import AssetType
+from pynvestor.models.holdings import Holdings
 from pynvestor.models.position import Position
-from pynvestor.source import euronext, mongo
+from pynvestor.source import euronext, mongo, snapshot_cache
 from pynvestor.source.helpers import Helpers
 
 
 class Portfolio:
     """
-    Object representing a portfolio at a certain date
+    Object representing the portfolio of an account at a certain date
     """
-    def __init__(self, portfolio_date: dt.datetime = None):
+    def __init__(self, portfolio_date: dt.datetime = None, account_id: str = None, snapshot: 'Portfolio' = None):
         """
         Initialize portfolio at a certain date
         :param portfolio_date: datetime
+        :param account_id: id of the account, None for the documents stored without account id
+        :param snapshot: already loaded portfolio to build from instead of loading the data again
         """
+        if snapshot is not None:
+            self._restore_snapshot(snapshot)
+            return
+
         self._portfolio_date = portfolio_date
+        self._account_id = account_id
         self._helpers = Helpers()
         self._load_portfolio_positions()
         self._get_euronext_data()
         self._compute()
 
-    def _load_portfolio_positions(self) -> bool:
+    @staticmethod
+    def cached(portfolio_date: dt.datetime = None, account_id: str = None) -> 'Portfolio':
+        """
+        get the portfolio of an account at a certain date from the process-wide snapshot cache, load it if needed
+        :param portfolio_date: datetime
+        :param account_id: id of the account
+        :return: Portfolio object shared between callers, it must not be modified
+        """
+        return snapshot_cache.get(portfolio_date, Portfolio, account_id=account_id)
+
+    @classmethod
+    def value_portfolios(cls, account_ids: List[str], portfolio_date: dt.datetime = None) -> Dict[str, 'Portfolio']:
+        """
+        value several portfolios at once: positions, market data, transactions and net asset values are each
+        fetched once for all the accounts, market data for the union of their isins
+        :param account_ids: ids of the accounts
+        :param portfolio_date: datetime
+        :return: dictionary of Portfolio objects keyed by account id
+        """
+        account_ids = list(account_ids)
+        helpers = Helpers()
+        positions = cls.get_positions_as_of(account_ids, portfolio_date)
+
+        isins_mics = {(position.isin, position.mic) for account_positions in positions.values()
+                      for position in account_positions if position.asset_type is AssetType.EQUITY}
+        instruments_details = cls._get_instruments_details(isins_mics)
+        prices = cls._get_prices(instruments_details, portfolio_date, helpers)
+        transactions = cls._get_trades(account_ids, [isin for isin, _ in isins_mics], portfolio_date)
+        asset_values = cls._get_asset_values(account_ids)
+
+        portfolios = {}
+        for account_id in account_ids:
+            portfolio = cls.__new__(cls)
+            portfolio._portfolio_date = portfolio_date
+            portfolio._account_id = account_id
+            portfolio._helpers = helpers
+            portfolio._load_portfolio_positions(positions[account_id])
+            portfolio._get_euronext_data(instruments_details, prices)
+            portfolio._compute(transactions[account_id], asset_values[account_id])
+            portfolios[account_id] = portfolio
+        return portfolios
+
+    def _restore_snapshot(self, snapshot: 'Portfolio') -> bool:
+        """
+        copy the loaded state of a snapshot so that the cached snapshot is never modified through this object
+        :param snapshot: Portfolio object
+        :return: True
+        """
+        for attribute, value in vars(snapshot).items():
+            setattr(self, attribute, copy.copy(value))
+        return True
+
+    def _load_portfolio_positions(self, positions: List[Position] = None) -> bool:
         """
         method to load and store the portfolio positions
+        :param positions: positions already fetched, fetched from the transactions if None
         :return: True
         """
-        self._positions = self._get_portfolio_positions_as_of(at_date=self._portfolio_date)
+        if positions is None:
+            positions = self._get_portfolio_positions_as_of(at_date=self._portfolio_date)
+        self._positions = positions
 
-        quantities = {}
+        isins = []
+        quantities = []
         for position in self._positions:
             if position.asset_type is AssetType.CASH:
                 self._cash = position.quantity
             else:
-                quantities[position.isin] = int(position.quantity)
+                isins.append(position.isin)
+                quantities.append(int(position.quantity))
 
-        self._stocks_quantities = quantities
-        assert self._stocks_quantities is not None, 'Could not retrieve quantities'
+        self._holdings = Holdings(isins, quantities)
         return True
 
-    def _get_euronext_data(self) -> bool:
+    @staticmethod
+    def _get_instruments_details(isins_mics) -> Dict[str, dict]:
+        """
+        get euronext instrument details of several instruments in one batch
+        :param isins_mics: iterable of (isin, mic) tuples
+        :return: dictionary of instrument details keyed by isin
+        """
+        instruments_details = {}
+        if isins_mics:
+            for instrument_details in euronext.get_instruments_details(list(isins_mics)):
+                instruments_details.update(instrument_details)
+
+        missing_details = [isin for isin, details in instruments_details.items() if details is None]
+        assert not missing_details, f'Could not retrieve instrument details for {missing_details}'
+        return instruments_details
+
+    @staticmethod
+    def _get_prices(instruments_details: Dict[str, dict], portfolio_date: dt.datetime = None,
+                    helpers: Helpers = None) -> Dict[str, float]:
+        """
+        get the prices of the instruments: live prices from euronext, or last closing prices in mongo on a past date
+        :param instruments_details: dictionary of euronext instrument details keyed by isin
+        :param portfolio_date: datetime
+        :param helpers: Helpers object
+        :return: dictionary of prices keyed by isin
+        """
+        if portfolio_date is None:
+            return {isin: float(details['currInstrSess']['lastPx']) for isin, details in instruments_details.items()}
+
+        helpers = Helpers() if helpers is None else helpers
+        return helpers.get_last_prices(list(instruments_details), portfolio_date).to_dict()
+
+    def _get_euronext_data(self, instruments_details: Dict[str, dict] = None,
+                           prices: Dict[str, float] = None) -> bool:
         """
         method that will get and store market data from euronext
+        :param instruments_details: details already fetched, may contain other instruments than the holdings
+        :param prices: prices already fetched, may contain other instruments than the holdings
         :return: True
         """
-        instrument_details = {}
-        prices = {}
-        names = {}
-        perf_since_open = {}
-        perf_since_last_close = {}
-        prev_session_prices = {}
-        for position in self._positions:
-            if position.asset_type is not AssetType.CASH:
-                isin = position.isin
-                mic = position.mic
-                euronext_data = euronext.get_instrument_details(isin, mic)['instr']
-
-                # Get instrument details
-                instrument_details[isin] = euronext_data
-
-                # Get prices
-                if self._portfolio_date is None:
-                    price = float(euronext_data['currInstrSess']['lastPx'])
-                else:
-                    price = self._helpers.get_price_from_mongo(isin, self._portfolio_date)
-                prices[isin] = price
-
-                # Get names
-                names[isin] = euronext_data['longNm']
-
-                # Get perfs
-                for perf in euronext_data['perf']:
-                    if perf['perType'] == 'D':
-                        perf_since_last_close[isin] = float(perf['var'])
-                        break
-                price_open = float(euronext_data['currInstrSess']['openPx'])
-                prev_sess_close = float(euronext_data['prevInstrSess']['lastPx'])
-                prev_session_prices[isin] = prev_sess_close
-                perf_since_open[isin] = price / price_open - 1
-
-        self._stocks_details = instrument_details
-        self._stocks_prices = prices
-        self._previous_prices = prev_session_prices
-        self._stocks_names = names
-        self._stocks_perf_since_open = perf_since_open
-        self._stocks_perf_since_last_close = perf_since_last_close
+        holdings = self._holdings
+        if instruments_details is None:
+            instruments_details = self._get_instruments_details({(position.isin, position.mic)
+                                                                 for position in self._positions
+                                                                 if position.asset_type is AssetType.EQUITY})
+        if prices is None:
+            prices = self._get_prices(instruments_details, self._portfolio_date, self._helpers)
+
+        stocks_details = {}
+        for loc, isin in enumerate(holdings.isins):
+            euronext_data = instruments_details[isin]
+
+            # Get instrument details
+            stocks_details[isin] = euronext_data
+
+            # Get prices
+            holdings.price[loc] = prices[isin]
+
+            # Get names
+            holdings.names[loc] = euronext_data['longNm']
+
+            # Get perfs
+            for perf in euronext_data['perf']:
+                if perf['perType'] == 'D':
+                    holdings.perf_since_last_close[loc] = float(perf['var'])
+                    break
+            holdings.open_price[loc] = float(euronext_data['currInstrSess']['openPx'])
+            holdings.previous_price[loc] = float(euronext_data['prevInstrSess']['lastPx'])
+
+        holdings.perf_since_open = holdings.price / holdings.open_price - 1
+        self._stocks_details = stocks_details
         return True
 
     @staticmethod
-    def get_cash_balance_as_of(at_date: dt.datetime = None) -> Position:
+    def get_positions_as_of(account_ids: List[str], at_date: dt.datetime = None) -> Dict[str, List[Position]]:
         """
-        method to get the cash balance from transactions at a certain date
+        method to get equity and cash positions of several accounts at a certain date in one aggregation
+        :param account_ids: ids of the accounts
         :param at_date: datetime
-        :return: Position object
+        :return: dictionary of lists of Position objects keyed by account id, the cash position is the last one
         """
-
         if at_date is None:
             at_date = dt.datetime.today()
 
-        transactions = mongo.find_documents(database_name='transactions',
-                                            collection_name='transactions',
-                                            projection={'_id': 0, 'net_cashflow': 1},
-                                            **{'transaction_date': {'$lte': at_date}})
-        transactions = [list(transaction.values())[0] for transaction in transactions]
-        cash_balance = Series(transactions).sum()
-        return Position(**{'asset_type': 'CASH', 'quantity': cash_balance})
+        pipeline = [{"$match": {"account_id": {"$in": list(account_ids)}, "transaction_date": {"$lte": at_date}}},
+                    {"$group": {"_id": {"account_id": "$account_id", "isin": "$isin", "mic": "$mic"},
+                                "quantity": {"$sum": "$quantity"},
+                                "net_cashflow": {"$sum": "$net_cashflow"}}}]
+        results = mongo.aggregate_documents('transactions', 'transactions', pipeline)
+
+        equity_positions = defaultdict(list)
+        cash_balances = defaultdict(float)
+        for result in results:
+            account_id = result['_id'].get('account_id')
+            isin = result['_id'].get('isin')
+            cash_balances[account_id] += result['net_cashflow']
+            if isin is not None and result['quantity'] != 0.0:
+                equity_positions[account_id].append(Position(**{'asset_type': 'EQUITY',
+                                                                'quantity': result['quantity'],
+                                                                'isin': isin,
+                                                                'mic': result['_id'].get('mic')}))
+
+        return {account_id: equity_positions[account_id] + [Position(**{'asset_type': 'CASH',
+                                                                        'quantity': cash_balances[account_id]})]
+                for account_id in account_ids}
 
     @staticmethod
-    def get_equity_positions_as_of(at_date: dt.datetime = None) -> List[Position]:
+    def get_cash_balance_as_of(at_date: dt.datetime = None, account_id: str = None) -> Position:
+        """
+        method to get the cash balance from transactions at a certain date
+        :param at_date: datetime
+        :param account_id: id of the account
+        :return: Position object
+        """
+        return Portfolio.get_positions_as_of([account_id], at_date)[account_id][-1]
+
+    @staticmethod
+    def get_equity_positions_as_of(at_date: dt.datetime = None, account_id: str = None) -> List[Position]:
         """
         method to get equity positions at a certain date
         :param at_date: datetime
+        :param account_id: id of the account
         :return: list of equity position objects
         """
-        if at_date is None:
-            at_date = dt.datetime.today()
-
-        transactions_quantities = mongo.find_documents(database_name='transactions',
-                                                       collection_name='transactions',
-                                                       projection={'_id': 0, 'isin': 1, 'quantity': 1, 'mic': 1},
-                                                       **{'transaction_date': {'$lte': at_date},
-                                                          'isin': {'$ne': None}})
-        transactions_quantities = [transactions for transactions in transactions_quantities]
-        if transactions_quantities:
-            df = DataFrame(transactions_quantities).groupby(['isin', 'mic']).sum()
-            positions = df[df['quantity'] != 0.0]
-            positions['asset_type'] = 'EQUITY'
-            positions.reset_index(inplace=True)
-            result = [Position(**pos) for pos in positions.to_dict('records')]
-        else:
-            result = []
-
-        return result
+        return Portfolio.get_positions_as_of([account_id], at_date)[account_id][:-1]
 
     def _get_portfolio_positions_as_of(self, at_date: dt.datetime = None) -> List[Position]:
         """
@@ -142,67 +241,109 @@ class Portfolio:
         :param at_date: datetime
         :return: list of Position objects
         """
-        return self.get_equity_positions_as_of(at_date) + [self.get_cash_balance_as_of(at_date)]
+        return self.get_positions_as_of([self._account_id], at_date)[self._account_id]
 
     def _get_weights(self) -> bool:
         """
         method to get and store assets weights
         :return: True
         """
-        weights = {}
-        for isin, market_value in self._stocks_market_values.items():
-            weights[isin] = market_value / self._portfolio_market_value
-        self._stocks_weights = weights
-
+        np.divide(self._holdings.market_value, self._portfolio_market_value, out=self._holdings.weight)
         self._cash_weight = self._cash / self._portfolio_market_value
         return True
 
-    def _compute_positions_pnl(self) -> bool:
+    @staticmethod
+    def _get_trades(account_ids: List[str], isins: List[str],
+                    at_date: dt.datetime = None) -> Dict[str, Dict[str, List[dict]]]:
+        """
+        get the trades of several accounts on several isins in one query
+        :param account_ids: ids of the accounts
+        :param isins: list of isins
+        :param at_date: datetime
+        :return: dictionary keyed by account id of dictionaries keyed by isin of trades sorted by date
+        """
+        if at_date is None:
+            at_date = dt.datetime.today()
+
+        transactions = mongo.find_documents('transactions',
+                                            'transactions',
+                                            projection={"_id": 0},
+                                            sort=[('transaction_date', 1)],
+                                            **{'account_id': {"$in": list(account_ids)},
+                                               'isin': {"$in": list(isins)},
+                                               'transaction_date': {"$lte": at_date},
+                                               'transaction_type': {"$in": ['BUY', 'SELL', 'STOCK SPLIT']}})
+        trades = {account_id: defaultdict(list) for account_id in account_ids}
+        for trade in transactions:
+            trades[trade.get('account_id')][trade['isin']].append(trade)
+        return trades
+
+    @staticmethod
+    def _compute_average_cost(transactions: List[dict]) -> float:
+        """
+        weighted average price of the buys since the position was last closed
+        :param transactions: trades of an isin sorted by date
+        :return: float
+        """
+        cumulative_positions = []
+        cum_position = 0
+        for trade in transactions:
+            cum_position += trade['quantity']
+            cumulative_positions.append(cum_position)
+        buy_transactions = []
+        for i in range(len(transactions) - 1, -1, -1):
+            if cumulative_positions[i] == 0:
+                break
+            else:
+                if transactions[i]['transaction_type'] in ['BUY', 'STOCK SPLIT']:
+                    buy_transactions.append(transactions[i])
+
+        sum_quantity = sum(trade['quantity'] for trade in buy_transactions)
+        weighted_average_price = sum(trade['quantity'] * trade['price']
+                                     for trade in buy_transactions if trade['price'] is not None) / sum_quantity
+        return weighted_average_price
+
+    def _compute_positions_pnl(self, transactions: Dict[str, List[dict]] = None) -> bool:
         """
         Compute and store PnL from equity positions
+        :param transactions: trades of the account keyed by isin, fetched if None
         :return: True
         """
-        positions_pnl = {}
-        for position in self._positions:
-            if position.asset_type is AssetType.EQUITY:
-                isin = position.isin
-                transactions = list(mongo.find_documents('transactions',
-                                                         'transactions',
-                                                         projection={"_id": 0},
-                                                         sort=[('transaction_date', 1)],
-                                                         **{'isin': isin,
-                                                            'transaction_type':
-                                                                {"$in": ['BUY', 'SELL', 'STOCK SPLIT']}}))
-                cumulative_positions = []
-                cum_position = 0
-                for trade in transactions:
-                    cum_position += trade['quantity']
-                    cumulative_positions.append(cum_position)
-                buy_transactions = []
-                for i in range(len(transactions) - 1, -1, -1):
-                    if cumulative_positions[i] == 0:
-                        break
-                    else:
-                        if transactions[i]['transaction_type'] in ['BUY', 'STOCK SPLIT']:
-                            buy_transactions.append(transactions[i])
-
-                sum_quantity = sum(trade['quantity'] for trade in buy_transactions)
-                weighted_average_price = sum(trade['quantity'] * trade['price']
-                                             for trade in buy_transactions if trade['price'] is not None) / sum_quantity
-                positions_pnl[isin] = self._stocks_prices[isin] / weighted_average_price - 1
-
-        self._positions_pnl = positions_pnl
+        holdings = self._holdings
+        if transactions is None:
+            transactions = self._get_trades([self._account_id], holdings.isins.tolist(),
+                                            self._portfolio_date)[self._account_id]
+
+        for loc, isin in enumerate(holdings.isins):
+            holdings.pnl[loc] = holdings.price[loc] / self._compute_average_cost(transactions[isin]) - 1
+
         return True
 
-    def _compute_portfolio_navs(self) -> bool:
+    @staticmethod
+    def _get_asset_values(account_ids: List[str]) -> Dict[str, List[dict]]:
+        """
+        get the net asset values documents of several accounts in one query
+        :param account_ids: ids of the accounts
+        :return: dictionary of documents keyed by account id
+        """
+        documents = mongo.find_documents(database_name='net_asset_values', collection_name='net_asset_values',
+                                         projection={'_id': 0}, **{'account_id': {"$in": list(account_ids)}})
+        asset_values = {account_id: [] for account_id in account_ids}
+        for document in documents:
+            asset_values[document.get('account_id')].append(document)
+        return asset_values
+
+    def _compute_portfolio_navs(self, asset_values: List[dict] = None) -> bool:
         """
         method to compute the portfolio net asset values
+        :param asset_values: net asset values documents of the account, fetched if None
         :return: bool
         """
-        asset_values = mongo.find_documents(database_name='net_asset_values', collection_name='net_asset_values',
-                                            projection={'_id': 0})
+        if asset_values is None:
+            asset_values = self._get_asset_values([self._account_id])[self._account_id]
 
-        df_assets = DataFrame(asset_values).set_index('date')
+        df_assets = DataFrame(asset_values, columns=['date', 'assets', 'cashflows', 'shares']).set_index('date')
+        df_assets.sort_index(inplace=True)
         df_assets['navs'] = df_assets['assets'] / df_assets['shares']
         self._portfolio_navs = df_assets['navs']
         return True
@@ -212,13 +353,9 @@ class Portfolio:
         Compute and store portfolio performances
         :return: True
         """
-        perf = 0.0
-        for isin, mkt_value in self._stocks_market_values.items():
-            previous_price = self._previous_prices[isin]
-            weight = self.stocks_quantities[isin] * previous_price / self._previous_portfolio_market_value
-            perf += self._stocks_perf_since_last_close[isin] * weight
-
-        self._portfolio_perf = perf
+        holdings = self._holdings
+        perf = np.dot(holdings.perf_since_last_close, holdings.previous_market_value)
+        self._portfolio_perf = perf / self._previous_portfolio_market_value
         return True
 
     def _compute_portfolio_returns(self):
@@ -237,28 +374,40 @@ class Portfolio:
         :return: True
         """
         mongo.insert_documents(database_name='transactions', collection_name='transactions', documents=transaction)
+        # the snapshots of an account are only impacted from its own first inserted trade
+        from_dates = {}
+        for trade in transaction:
+            account_id = trade.get('account_id')
+            from_dates[account_id] = min(from_dates.get(account_id, trade['transaction_date']),
+                                         trade['transaction_date'])
+        for account_id, from_date in from_dates.items():
+            snapshot_cache.invalidate(from_date=from_date, account_ids=[account_id])
         return True
 
     def save_portfolio_nav(self, nav_date, shares=None, cashflows=0.0) -> bool:
         """
-        method to insert new net asset values in the mongo
+        method to insert new net asset values of the account in the mongo
         :param nav_date: date the net asset value
         :param shares: new total amount of shares, if no cashflows, leave it to None
         :param cashflows: amount of cashflows
         :return: True
         """
         if shares is None:
-            shares = mongo.find_document('net_asset_values', 'net_asset_values', [("date", -1)])['shares']
+            shares = mongo.find_document('net_asset_values', 'net_asset_values', [("date", -1)],
+                                         **{'account_id': self._account_id})['shares']
         if nav_date is None:
             nav_date = self._portfolio_date
 
         assets = self._portfolio_market_value
         data = {"date": nav_date,
+                "account_id": self._account_id,
                 "assets": assets,
                 "cashflows": cashflows,
                 "shares": shares}
 
         mongo.insert_documents('net_asset_values', 'net_asset_values', [data])
+        # every snapshot of the account holds its whole net asset values history
+        snapshot_cache.invalidate(account_ids=[self._account_id])
         return True
 
     def to_df(self) -> DataFrame:
@@ -266,37 +415,30 @@ class Portfolio:
         method to get a dataframe representation of the portfolio data
         :return: dataframe
         """
-        data = [self._stocks_names, self._stocks_quantities, self._stocks_weights, self._stocks_prices,
-                self._stocks_perf_since_open, self._stocks_perf_since_last_close, self._stocks_market_values,
-                self._positions_pnl]
-        columns = ['name', 'quantity', 'weight', 'last_price', 'perf_since open', 'perf_since_last_close',
-                   'market_value', 'pnl']
-        df = DataFrame(data).T
-        df.columns = columns
+        columns = {'name': 'name', 'quantity': 'quantity', 'weight': 'weight', 'price': 'last_price',
+                   'perf_since_open': 'perf_since open', 'perf_since_last_close': 'perf_since_last_close',
+                   'market_value': 'market_value', 'pnl': 'pnl'}
+        df = self._holdings.to_df()[list(columns)].rename(columns=columns)
+        df['quantity'] = df['quantity'].astype(int)
 
         return df
 
-    def _compute(self) -> bool:
+    def _compute(self, transactions: Dict[str, List[dict]] = None, asset_values: List[dict] = None) -> bool:
         """
         method to launch to get all the portfolio data
+        :param transactions: trades of the account keyed by isin, fetched if None
+        :param asset_values: net asset values documents of the account, fetched if None
         :return: True
         """
-        market_values = {}
-        previous_market_values = {}
-        self._portfolio_market_value = self._cash
-        self._previous_portfolio_market_value = self._cash
-        for isin, quantity in self._stocks_quantities.items():
-            price = self._stocks_prices[isin]
-            previous_price = self._previous_prices[isin]
-            market_values[isin] = price * quantity
-            previous_market_values[isin] = previous_price * quantity
-            self._portfolio_market_value += market_values[isin]
-            self._previous_portfolio_market_value += previous_market_values[isin]
-        self._stocks_market_values = market_values
+        holdings = self._holdings
+        np.multiply(holdings.quantity, holdings.price, out=holdings.market_value)
+        np.multiply(holdings.quantity, holdings.previous_price, out=holdings.previous_market_value)
+        self._portfolio_market_value = self._cash + holdings.market_value.sum()
+        self._previous_portfolio_market_value = self._cash + holdings.previous_market_value.sum()
 
         self._get_weights()
-        self._compute_positions_pnl()
-        self._compute_portfolio_navs()
+        self._compute_positions_pnl(transactions)
+        self._compute_portfolio_navs(asset_values)
         self._compute_portfolio_returns()
         self._compute_portfolio_performance()
         return True
@@ -305,13 +447,23 @@ class Portfolio:
     def portfolio_date(self):
         return self._portfolio_date
 
+    @property
+    def account_id(self):
+        return self._account_id
+
+    @property
+    def holdings(self):
+        return self._holdings
+
     @property
     def stocks_quantities(self):
-        return self._stocks_quantities
+        # the positions quantities are integers, the float64 table column is converted back for the consumers
+        return {isin: int(quantity) if quantity.is_integer() else quantity
+                for isin, quantity in self._holdings.to_dict('quantity').items()}
 
     @property
     def stocks_prices(self):
-        return self._stocks_prices
+        return self._holdings.to_dict('price')
 
     @property
     def cash(self):
@@ -323,7 +475,7 @@ class Portfolio:
 
     @property
     def stocks_weights(self):
-        return self._stocks_weights
+        return self._holdings.to_dict('weight')
 
     @property
     def cash_weight(self):
@@ -331,7 +483,7 @@ class Portfolio:
 
     @property
     def stocks_market_values(self):
-        return self._stocks_market_values
+        return self._holdings.to_dict('market_value')
 
     @property
     def portfolio_market_value(self):
@@ -339,7 +491,7 @@ class Portfolio:
 
     @property
     def stocks_names(self):
-        return self._stocks_names
+        return dict(zip(self._holdings.isins.tolist(), self._holdings.names.tolist()))
 
     @property
     def positions(self):
@@ -347,11 +499,11 @@ class Portfolio:
 
     @property
     def positions_pnl(self):
-        return self._positions_pnl
+        return self._holdings.to_dict('pnl')
 
     @property
     def stocks_perf_since_open(self):
-        return self._stocks_perf_since_open
+        return self._holdings.to_dict('perf_since_open')
 
     @property
     def portfolio_perf(self):
@@ -359,7 +511,7 @@ class Portfolio:
 
     @property
     def stocks_perf_since_last_close(self):
-        return self._stocks_perf_since_last_close
+        return self._holdings.to_dict('perf_since_last_close')
 
     @property
     def portfolio_navs(self):
@@ -0,0 +1,207 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from typing import List
+
+from pynvestor import logger
+from pynvestor.source import euronext, mongo
+from pynvestor.source.helpers import Helpers
+
+# report elements of the ratios, by statement
+ratios_report_elements = {'income': ['Net Income', 'Operating Income', 'Revenue'],
+                          'balance_sheet': ['Total Debt', 'Total Equity']}
+ratios_keys = ['ric', 'period', 'date']  # one point-in-time row per ric, period and report date
+market_fields = ['name', 'sector', 'subsector', 'shares_outstanding', 'price', 'price_date', 'eps', 'per']
+ratios_columns = (ratios_keys + ['isin', 'mic'] + [elem.lower().replace(' ', '_') for report_elems in
+                                                   ratios_report_elements.values() for elem in report_elems]
+                  + ['roe', 'gearing', 'operating_margin'] + market_fields)
+
+
+def _get_report_elements(statement: str, report_elems: List[str], rics: List[str] = None) -> pd.DataFrame:
+    """
+    get the report elements of every report in one aggregation, pivoted to one row per ric, period and report date
+    :param statement: "income", "balance_sheet", "cash_flow"
+    :param report_elems: names of the report elements in mongo
+    :param rics: rics of the reports, all the rics if None
+    :return: dataframe with the keys and one column per report element
+    """
+    match = {'report_elem': {'$in': report_elems}}
+    if rics is not None:
+        match['ric'] = {'$in': list(rics)}
+    pipeline = [{"$match": match},
+                {"$group": {"_id": {"ric": "$ric", "period": "$period", "date": "$date"},
+                            "values": {"$push": {"k": "$report_elem", "v": "$value"}}}},
+                {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$_id", {"$arrayToObject": "$values"}]}}}]
+    results = mongo.aggregate_documents('financials', statement, pipeline)
+    df = pd.DataFrame(list(results), columns=ratios_keys + report_elems)
+    df.columns = [column.lower().replace(' ', '_') for column in df.columns]
+    return df
+
+
+def _get_shares_outstanding(rics: List[str] = None) -> pd.DataFrame:
+    """
+    get the share counts persisted in financials.ratios by update_market_ratios
+    :param rics: rics of the rows, all the rics if None
+    :return: dataframe with the keys and the share count of every row
+    """
+    query_filter = {} if rics is None else {'ric': {'$in': list(rics)}}
+    projection = {'_id': 0, **{column: 1 for column in ratios_keys + ['shares_outstanding']}}
+    results = mongo.find_documents('financials', 'ratios', projection=projection, **query_filter)
+    shares_outstanding = pd.DataFrame(list(results), columns=ratios_keys + ['shares_outstanding'])
+    return shares_outstanding.astype({'date': 'datetime64[ns]', 'shares_outstanding': np.float64})
+
+
+def _set_earnings_per_share(ratios: pd.DataFrame) -> pd.DataFrame:
+    """
+    carry the last share count known at the date of every report, the reports older than the first count known
+    take it, and compute the earnings per share of every report
+    :param ratios: dataframe sorted by ric, period and report date
+    :return: dataframe
+    """
+    ratios['shares_outstanding'] = ratios.groupby(['ric', 'period'])['shares_outstanding'].ffill()
+    ratios['shares_outstanding'] = ratios.groupby(['ric', 'period'])['shares_outstanding'].bfill()
+    ratios['eps'] = (ratios['net_income'] * 1000000) / ratios['shares_outstanding']
+    return ratios
+
+
+def compute_fundamental_ratios(rics: List[str] = None) -> pd.DataFrame:
+    """
+    compute the accounting ratios of every report. The statements are not always reported on the same dates, every
+    row carries the last value known at its date of each report element and of the share count
+    :param rics: rics of the reports, all the rics if None
+    :return: dataframe with one row per ric, period and report date
+    """
+    ratios = None
+    for statement, report_elems in ratios_report_elements.items():
+        df_statement = _get_report_elements(statement, report_elems, rics)
+        ratios = df_statement if ratios is None else ratios.merge(df_statement, how='outer', on=ratios_keys)
+
+    ratios = ratios.sort_values(ratios_keys).reset_index(drop=True)
+    values_columns = [column for column in ratios.columns if column not in ratios_keys]
+    ratios[values_columns] = ratios.groupby(['ric', 'period'])[values_columns].ffill()
+
+    helpers = Helpers()
+    ratios['isin'] = [helpers.transco_isin_ric(ric=ric)[0] for ric in ratios['ric']]
+    ratios['mic'] = ratios['isin'].apply(euronext.get_mic_from_isin)
+    ratios['roe'] = ratios['net_income'] / ratios['total_equity']
+    ratios['gearing'] = ratios['total_debt'] / ratios['total_equity']
+    ratios['operating_margin'] = ratios['operating_income'] / ratios['revenue']
+
+    ratios = ratios.merge(_get_shares_outstanding(rics), how='left', on=ratios_keys)
+    return _set_earnings_per_share(ratios)
+
+
+def _to_documents(df: pd.DataFrame) -> List[dict]:
+    """
+    mongo documents of the rows of a dataframe, without NaN
+    :param df: dataframe
+    :return: list of dict
+    """
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient='records')
+
+
+@logger
+def update_ratios(rics: List[str] = None) -> True:
+    """
+    upsert the accounting ratios and the earnings per share of the reports in financials.ratios, the other market
+    fields of the rows are kept
+    :param rics: rics whose reports changed, all the rics if None
+    :return: True
+    """
+    ratios = compute_fundamental_ratios(rics)
+    mongo.upsert_documents('financials', 'ratios', _to_documents(ratios), keys=ratios_keys)
+    return True
+
+
+def get_ratios(period: str, as_of_date: dt.datetime = None, rics: List[str] = None) -> pd.DataFrame:
+    """
+    get the last ratios of every ric reported on or before a date
+    :param period: annual or interim
+    :param as_of_date: date of the ratios, today if None
+    :param rics: rics of the ratios, all the rics if None
+    :return: dataframe with one row per ric, NaN for the fields not computed yet
+    """
+    match = {'period': period}
+    if as_of_date is not None:
+        match['date'] = {'$lte': as_of_date}
+    if rics is not None:
+        match['ric'] = {'$in': list(rics)}
+    pipeline = [{"$match": match},
+                {"$sort": {"ric": 1, "date": -1}},
+                {"$group": {"_id": "$ric", "ratios": {"$first": "$$ROOT"}}},
+                {"$replaceRoot": {"newRoot": "$ratios"}},
+                {"$project": {"_id": 0}}]
+    results = mongo.aggregate_documents('financials', 'ratios', pipeline)
+    return pd.DataFrame(list(results), columns=ratios_columns)
+
+
+def get_ratios_history(period: str, rics: List[str] = None) -> pd.DataFrame:
+    """
+    get all the point-in-time rows of financials.ratios
+    :param period: annual or interim
+    :param rics: rics of the ratios, all the rics if None
+    :return: dataframe sorted by ric and report date
+    """
+    query_filter = {'period': period}
+    if rics is not None:
+        query_filter['ric'] = {'$in': list(rics)}
+    results = mongo.find_documents('financials', 'ratios', projection={'_id': 0}, **query_filter)
+    ratios = pd.DataFrame(list(results), columns=ratios_columns)
+    return ratios.sort_values(['ric', 'date']).reset_index(drop=True)
+
+
+@logger
+def update_market_ratios(rics: List[str] = None) -> True:
+    """
+    set the share counts, the last prices and the ratios depending on them on the last rows of financials.ratios.
+    The rows of the previous reports keep the share count of the last update before the following report, the rows
+    older than the first update take the first count known, and the earnings per share of every row are updated
+    :param rics: rics of the rows, all the rics if None
+    :return: True
+    """
+    ratios = pd.concat([get_ratios_history(period, rics=rics) for period in ('annual', 'interim')],
+                       ignore_index=True)
+    ratios = ratios.dropna(subset=['isin'])
+    if ratios.empty:
+        return True
+    ratios = ratios.sort_values(ratios_keys)
+    last_ratios = ratios.drop_duplicates(['ric', 'period'], keep='last')
+
+    isins_mics = last_ratios[['isin', 'mic']].drop_duplicates().dropna().values.tolist()
+    details = {}
+    for instrument_details in euronext.get_instruments_details(isins_mics):
+        for isin, instrument_detail in instrument_details.items():
+            if instrument_detail is None:
+                continue
+            sector, subsector = None, None
+            for elem in instrument_detail.get('instrRel') or []:
+                if elem['instrLst'].get('lstType') == 'SEC' and elem['instrLst'].get('lstLvl') == '1':
+                    sector = elem['instrLst']['lstLbl'].strip()
+                if elem['instrLst'].get('lstType') == 'SEC' and elem['instrLst'].get('lstLvl') == '2':
+                    subsector = elem['instrLst']['lstLbl'].strip()
+            details[isin] = {'name': instrument_detail.get('longNm'),
+                             'sector': sector,
+                             'subsector': subsector,
+                             'shares_outstanding': int(instrument_detail.get('nbShare') or 0) or np.nan}
+    details = pd.DataFrame.from_dict(details, orient='index', columns=market_fields[:4])
+
+    # today's share count of the last rows, carried to the rows without count
+    last_ratios = last_ratios.drop(columns=market_fields).join(details, on='isin')
+    shares_outstanding = last_ratios['shares_outstanding'].dropna()
+    ratios.loc[shares_outstanding.index, 'shares_outstanding'] = shares_outstanding
+    ratios = _set_earnings_per_share(ratios)
+
+    price_date = dt.datetime.today()
+    last_ratios = last_ratios.drop(columns=['shares_outstanding']).join(ratios[['shares_outstanding', 'eps']])
+    last_ratios['price'] = last_ratios['isin'].map(Helpers().get_last_prices(last_ratios['isin'].unique().tolist()))
+    last_ratios['price_date'] = dt.datetime(price_date.year, price_date.month, price_date.day)
+    # To avoid zero division error
+    last_ratios['per'] = last_ratios['price'] / last_ratios['eps'].where(last_ratios['eps'] != 0.0)
+
+    mongo.upsert_documents('financials', 'ratios', _to_documents(last_ratios[ratios_keys + market_fields]),
+                           keys=ratios_keys)
+    mongo.upsert_documents('financials', 'ratios', _to_documents(ratios[ratios_keys + ['shares_outstanding', 'eps']]),
+                           keys=ratios_keys)
+    return True
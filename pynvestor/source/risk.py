@@ -1,55 +1,166 @@
-import pandas as pd
 import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
 
+from pynvestor import logger
+from pynvestor.source.covariance import CovarianceSource
 from pynvestor.source.portfolio import Portfolio
 from pynvestor.source.helpers import Helpers
 
 
+def _simulate_returns_chunk(seed_sequence: np.random.SeedSequence, n_simulations: int,
+                            cholesky_factor: np.ndarray, mean_returns: np.ndarray) -> np.ndarray:
+    """
+    simulate correlated normal daily returns, the same seed gives the same scenarios
+    :param seed_sequence: seed of the chunk
+    :param n_simulations: number of scenarios of the chunk
+    :param cholesky_factor: Cholesky factor, or square root factor, of the daily covariance matrix
+    :param mean_returns: daily mean returns
+    :return: scenarios-by-assets array of returns
+    """
+    generator = np.random.default_rng(seed_sequence)
+    draws = generator.standard_normal((n_simulations, len(mean_returns)))
+    return draws.dot(cholesky_factor.T) + mean_returns
+
+
+def _simulate_losses_chunk(seed_sequence: np.random.SeedSequence, n_simulations: int,
+                           cholesky_factor: np.ndarray, mean_returns: np.ndarray,
+                           market_values: np.ndarray) -> np.ndarray:
+    """
+    simulate portfolio losses from correlated normal daily returns, memory is bounded by the chunk size
+    :param seed_sequence: seed of the chunk
+    :param n_simulations: number of scenarios of the chunk
+    :param cholesky_factor: Cholesky factor, or square root factor, of the daily covariance matrix
+    :param mean_returns: daily mean returns
+    :param market_values: market values of the positions
+    :return: array of simulated losses
+    """
+    simulated_returns = _simulate_returns_chunk(seed_sequence, n_simulations, cholesky_factor, mean_returns)
+    return simulated_returns.dot(market_values) * -1
+
+
+def _decompose_losses_chunk(seed_sequence: np.random.SeedSequence, n_simulations: int,
+                            cholesky_factor: np.ndarray, mean_returns: np.ndarray, market_values: np.ndarray,
+                            value_at_risk: float, neighbours_bounds: tuple, n_tail: int) -> tuple:
+    """
+    simulate again the scenarios of a chunk of _simulate_losses_chunk and accumulate the losses of every holding
+    in the tail and around the value at risk, and the largest losses of the portfolio without every holding
+    :param seed_sequence: seed of the chunk
+    :param n_simulations: number of scenarios of the chunk
+    :param cholesky_factor: Cholesky factor, or square root factor, of the daily covariance matrix
+    :param mean_returns: daily mean returns
+    :param market_values: market values of the positions
+    :param value_at_risk: simulated value at risk, the losses from it are the tail
+    :param neighbours_bounds: lowest and highest simulated losses around the value at risk
+    :param n_tail: number of scenarios in the tail
+    :return: sums of the losses of every holding in the tail and around the value at risk, number of scenarios
+    around the value at risk, and the n_tail largest losses of the chunk without every holding
+    """
+    simulated_returns = _simulate_returns_chunk(seed_sequence, n_simulations, cholesky_factor, mean_returns)
+    losses = simulated_returns.dot(market_values) * -1
+    assets_losses = simulated_returns * market_values * -1
+    tail = losses >= value_at_risk
+    neighbours = (losses >= neighbours_bounds[0]) & (losses <= neighbours_bounds[1])
+
+    losses_without = losses[:, None] - assets_losses
+    if len(losses_without) > n_tail:
+        losses_without = np.partition(losses_without, len(losses_without) - n_tail, axis=0)[-n_tail:]
+    return assets_losses[tail].sum(axis=0), assets_losses[neighbours].sum(axis=0), neighbours.sum(), losses_without
+
+
 class PortfolioRiskManager(Portfolio):
     """
     class to manage portfolio risks
     """
 
-    def __init__(self, risk_free_rate: float, lookback_days: int = 500):
-        super().__init__()
+    def __init__(self, risk_free_rate: float, lookback_days: int = 500, account_id: str = None,
+                 snapshot: Portfolio = None, var_method: str = "historical", missing_data: str = "ffill",
+                 covariance_source: CovarianceSource = None):
+        """
+        :param risk_free_rate: float
+        :param lookback_days: number of days of history used to compute the risk metrics
+        :param account_id: id of the account, ignored if a snapshot is given
+        :param snapshot: already loaded portfolio (e.g. Portfolio.cached()), the portfolio is loaded if None
+        :param var_method: "historical", "parametric" or "monte_carlo"
+        :param missing_data: missing prices policy, "ffill", "drop" or "pairwise" (see Helpers.align_prices)
+        :param covariance_source: precomputed covariance (e.g. EwmaCovariance.load(mmap_mode="r")), the sample
+        covariance of the prices panel is used if None
+        """
+        super().__init__(account_id=account_id, snapshot=snapshot)
 
         self._lookback_days = lookback_days
+        self._missing_data = missing_data
+        self._covariance_source = covariance_source
 
         self._compute_nav_volatility()
+        self._load_prices_panel()
         self._compute_assets_returns()
+        self._compute_covariance_matrix()
         self._compute_correlation_matrix()
         self._compute_portfolio_volatility()
         self._compute_portfolio_sharpe_ratio(risk_free_rate)
-        self._compute_portfolio_value_at_risk()
+        self._compute_historical_scenarios()
+        self._compute_portfolio_value_at_risk(method=var_method)
+
+    def _load_prices_panel(self):
+        """
+        Load the date-aligned prices of the holdings in one read, all risk metrics are derived from it
+        :return:
+        """
+        prices_panel = self._helpers.get_prices_panel(self._holdings.isins.tolist(), window=self._lookback_days + 1)
+        self._prices_panel = self._helpers.align_prices(prices_panel, self._missing_data)
+        return True
 
     def _compute_assets_returns(self):
         """
         Compute assets daily returns
         :return:
         """
-        returns = []
-        for isin, _ in self.stocks_weights.items():
-            returns.append(self._helpers.get_returns(isin=isin,
-                                                     sort=[("time", -1)],
-                                                     window=self._lookback_days).values)
+        self._returns_panel = self._prices_panel.pct_change(fill_method=None).iloc[1:]
+        self._histo_returns = self._returns_panel.values.T
+        return True
 
-        returns = np.stack(returns)
-        self._histo_returns = returns
+    def _compute_covariance_matrix(self):
+        """
+        Annualized covariance matrix of the holdings, sliced from the covariance source if any
+        :return:
+        """
+        if self._covariance_source is not None:
+            try:
+                cov_matrix = self._covariance_source.get_covariance(self._holdings.isins.tolist())
+                # pairs never observed together, e.g. isins added to the universe since its last update, are NaN
+                if not np.isfinite(cov_matrix).all():
+                    logger.log.warning(f'missing observations of the holdings in the {self._covariance_source.name} '
+                                       f'covariance, falling back to the sample covariance')
+                    self._covariance_source = None
+            except KeyError as key_error:
+                logger.log.warning(f'{key_error}, falling back to the sample covariance')
+                self._covariance_source = None
+        if self._covariance_source is None:
+            # pandas statistics are computed on pairwise-complete observations
+            cov_matrix = self._returns_panel.cov().values
+        self._covariance_matrix = cov_matrix * 252
         return True
 
     def _compute_correlation_matrix(self):
-        self._correlation_matrix = np.corrcoef(self._histo_returns)
+        if self._covariance_source is not None:
+            std = np.sqrt(np.diag(self._covariance_matrix))
+            self._correlation_matrix = self._covariance_matrix / np.outer(std, std)
+        else:
+            self._correlation_matrix = self._returns_panel.corr().values
 
     def _compute_portfolio_volatility(self):
         """
         compute portfolio volatility from the assets covariance matrix
         :return:
         """
-        weights = np.array(list(self.stocks_weights.values()))
+        weights = self._holdings.weight
 
-        portfolio_variance, cov_matrix = Helpers.compute_portfolio_variance(weights, self._histo_returns)
-        self._covariance_matrix = cov_matrix
-        self._assets_std = {list(self.stocks_weights.keys())[i]: cov_matrix[i][i] for i in range(len(weights))}
+        cov_matrix = self._covariance_matrix
+        portfolio_variance = weights.dot(cov_matrix).dot(weights)
+        self._assets_std = dict(zip(self._holdings.isins.tolist(), np.diag(cov_matrix).tolist()))
         self._annualized_portfolio_volatility = np.sqrt(portfolio_variance)
         return True
 
@@ -68,10 +179,11 @@ class PortfolioRiskManager(Portfolio):
         :return: series
         """
 
-        weights = np.array(list(self.stocks_weights.values()))
-        mean_returns = np.array([self._histo_returns[i].mean() for i in range(len(self._histo_returns))])
+        weights = self._holdings.weight
+        mean_returns = self._returns_panel.mean().values
         self._mean_returns = mean_returns
         annualized_mean_returns = (1 + mean_returns) ** 252 - 1
+        self._annualized_mean_returns = annualized_mean_returns
         annualized_portfolio_return = np.sum(weights * annualized_mean_returns)
 
         sharpe_ratio = Helpers.compute_sharpe_ratio(annualized_portfolio_return,
@@ -81,60 +193,266 @@ class PortfolioRiskManager(Portfolio):
 
         return True
 
+    def _compute_historical_scenarios(self):
+        """
+        Get historical daily price changes per share, scenarios are linear in the quantities held
+        :return:
+        """
+        self._histo_price_changes = self._prices_panel.diff().iloc[1:].fillna(0.0).values
+        return True
+
     def _compute_portfolio_value_at_risk(self,
                                          method: str = "historical",
-                                         percentile: int = 5):
+                                         percentile: int = 5,
+                                         n_simulations: int = 200000,
+                                         chunk_size: int = 100000,
+                                         seed: int = 0,
+                                         processes: int = None):
         """
         compute portfolio Value At Risk
-        :param method: method of computation for the value at risk
+        :param method: method of computation for the value at risk: "historical", "parametric" or "monte_carlo"
         :param percentile: confidence interval
+        :param n_simulations: number of scenarios of the monte carlo method
+        :param chunk_size: number of scenarios simulated at once by the monte carlo method
+        :param seed: seed of the monte carlo simulations, the value at risk of a portfolio does not change between
+        two loads with the same seed, random simulations if None
+        :param processes: number of processes running the monte carlo chunks, run in the current process if None
         :return:
         """
 
+        market_values = self._holdings.market_value
+        daily_covariance_matrix = self._covariance_matrix / 252
+
         if method == "historical":
 
-            # Get simulated historical portfolio value
-            df_assets_market_values = pd.DataFrame()
-            for isin, quantity in self.stocks_quantities.items():
-                prices_series = self._helpers.get_prices_from_mongo(isin=isin,
-                                                                    sort=[("time", -1)],
-                                                                    window=self._lookback_days + 1)
-                total_market_value = prices_series * quantity
-                df_assets_market_values[isin] = total_market_value
-
-            portfolio_market_values_series = df_assets_market_values.sum(axis=1)
-            portfolio_market_values_series.sort_index(inplace=True)
-            portfolio_changes_series = portfolio_market_values_series * portfolio_market_values_series.pct_change()
-            portfolio_changes_series.dropna(inplace=True)
-
-            losses = portfolio_changes_series.values * -1
+            # Simulated historical portfolio changes
+            losses = self._histo_price_changes.dot(self._holdings.quantity) * -1
             losses.sort()
             percentile_loc = int(round(percentile / 100 * len(losses), 0))
             values_at_risk = losses[-percentile_loc:]
             value_at_risk = values_at_risk[0]
 
         elif method == "parametric":
-            raise NotImplementedError
+
+            # Normal distribution of the portfolio daily changes, losses are its quantiles for the chart
+            mean_loss = -np.dot(market_values, self._mean_returns)
+            loss_std = np.sqrt(market_values.dot(daily_covariance_matrix).dot(market_values))
+            value_at_risk = mean_loss + stats.norm.ppf(1 - percentile / 100) * loss_std
+
+            n_quantiles = len(self._histo_price_changes)
+            losses = mean_loss + loss_std * stats.norm.ppf((np.arange(n_quantiles) + 0.5) / n_quantiles)
+            percentile_loc = int(round(percentile / 100 * len(losses), 0))
 
         elif method == "monte_carlo":
-            raise NotImplementedError
+
+            # Correlated normal daily returns simulated in chunks
+            try:
+                cholesky_factor = np.linalg.cholesky(daily_covariance_matrix)
+            except np.linalg.LinAlgError:
+                # pairwise covariance matrices can be indefinite, the negative eigenvalues are clipped to the nearest
+                # positive semi-definite matrix whose square root factor replaces the Cholesky factor
+                eigenvalues, eigenvectors = np.linalg.eigh(daily_covariance_matrix)
+                cholesky_factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+            chunks_sizes = [chunk_size] * (n_simulations // chunk_size)
+            if n_simulations % chunk_size:
+                chunks_sizes.append(n_simulations % chunk_size)
+            seed_sequences = np.random.SeedSequence(seed).spawn(len(chunks_sizes))
+            chunks_args = [[seed_sequence, size, cholesky_factor, self._mean_returns, market_values]
+                           for seed_sequence, size in zip(seed_sequences, chunks_sizes)]
+
+            if processes is None:
+                chunks_losses = [_simulate_losses_chunk(*args) for args in chunks_args]
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    chunks_losses = list(executor.map(_simulate_losses_chunk, *zip(*chunks_args)))
+            self._simulations = (chunks_args, processes)
+
+            losses = np.concatenate(chunks_losses)
+            losses.sort()
+            percentile_loc = int(round(percentile / 100 * len(losses), 0))
+            value_at_risk = losses[-percentile_loc]
 
         else:
             raise AttributeError
 
+        self._var_method = method
+        self._percentile = percentile
         self._simulated_losses = losses
         self._portfolio_values_at_risk = losses[-percentile_loc:]
         self._portfolio_value_at_risk = value_at_risk
+        self._compute_risk_decomposition()
+        return True
+
+    def _compute_risk_decomposition(self, n_neighbours: int = 2):
+        """
+        decompose the value at risk and the expected shortfall of the current method per holding, in one pass over
+        the scenarios
+        :param n_neighbours: number of scenarios on each side of the historical value at risk averaged to smooth
+        its component value at risk
+        :return:
+        """
+        market_values = self._holdings.market_value
+        alpha = self._percentile / 100
+
+        if self._var_method == "historical":
+
+            # Profit and loss of every holding in every scenario, losses without a holding are a column operation
+            assets_pnl = self._histo_price_changes * self._holdings.quantity
+            losses = assets_pnl.sum(axis=1) * -1
+            var_loc = len(losses) - int(round(alpha * len(losses), 0))
+            order = np.argsort(losses)
+
+            tail = order[var_loc:]
+            expected_shortfall = losses[tail].mean()
+            component_es = assets_pnl[tail].mean(axis=0) * -1
+
+            neighbours = order[max(var_loc - n_neighbours, 0):var_loc + n_neighbours + 1]
+            component_var = assets_pnl[neighbours].mean(axis=0) * -1
+            component_var *= self._portfolio_value_at_risk / component_var.sum()
+
+            values_at_risk_without = np.partition(losses[:, None] + assets_pnl, var_loc, axis=0)[var_loc]
+            incremental_var = self._portfolio_value_at_risk - values_at_risk_without
+
+        elif self._var_method == "monte_carlo":
+
+            expected_shortfall, component_var, incremental_var, component_es = self._decompose_simulated_losses(
+                n_neighbours)
+
+        else:
+
+            daily_covariance_matrix = self._covariance_matrix / 252
+            quantile = stats.norm.ppf(1 - alpha)
+            es_quantile = stats.norm.pdf(quantile) / alpha
+            covariance_market_values = daily_covariance_matrix.dot(market_values)
+            mean_loss = -np.dot(market_values, self._mean_returns)
+            loss_std = np.sqrt(market_values.dot(covariance_market_values))
+            value_at_risk = mean_loss + quantile * loss_std
+
+            expected_shortfall = mean_loss + es_quantile * loss_std
+            component_es = market_values * (es_quantile * covariance_market_values / loss_std - self._mean_returns)
+            component_var = market_values * (quantile * covariance_market_values / loss_std - self._mean_returns)
+
+            # variance without a holding removes its row and column from the quadratic form
+            loss_std_without = np.sqrt(np.maximum(loss_std ** 2 - 2 * market_values * covariance_market_values
+                                                  + market_values ** 2 * np.diag(daily_covariance_matrix), 0))
+            values_at_risk_without = mean_loss + market_values * self._mean_returns + quantile * loss_std_without
+            incremental_var = value_at_risk - values_at_risk_without
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            marginal_var = component_var / market_values
+
+        self._portfolio_expected_shortfall = expected_shortfall
+        self._risk_decomposition = pd.DataFrame({'name': self._holdings.names,
+                                                 'market_value': market_values,
+                                                 'marginal_var': marginal_var,
+                                                 'component_var': component_var,
+                                                 'incremental_var': incremental_var,
+                                                 'component_es': component_es},
+                                                index=self._holdings.isins)
         return True
 
+    def _decompose_simulated_losses(self, n_neighbours: int = 2) -> tuple:
+        """
+        decompose the monte carlo value at risk and expected shortfall from the losses of every holding in the
+        simulated scenarios, so that the components add up to them. The scenarios are simulated again chunk by chunk
+        from their seeds, memory is bounded by the chunk size and the number of scenarios in the tail
+        :param n_neighbours: minimum number of scenarios on each side of the value at risk averaged to smooth its
+        component value at risk, the neighbourhood grows with the number of scenarios
+        :return: expected shortfall, component, incremental value at risk and component expected shortfall
+        """
+        market_values = self._holdings.market_value
+        chunks_args, processes = self._simulations
+        losses = self._simulated_losses
+        n_tail = len(self._portfolio_values_at_risk)
+        var_loc = len(losses) - n_tail
+        n_neighbours = max(n_neighbours, len(losses) // 2000)
+        neighbours_bounds = (losses[max(var_loc - n_neighbours, 0)],
+                             losses[min(var_loc + n_neighbours, len(losses) - 1)])
+        decomposition_args = [args + [self._portfolio_value_at_risk, neighbours_bounds, n_tail]
+                              for args in chunks_args]
+
+        def merge(chunks_decompositions):
+            # only the n_tail largest losses without every holding are kept from one chunk to the next
+            tail_losses = np.zeros(len(market_values))
+            neighbours_losses = np.zeros(len(market_values))
+            n_neighbours_scenarios = 0
+            losses_without = np.empty((0, len(market_values)))
+            for chunk_tail_losses, chunk_neighbours_losses, chunk_n_neighbours, chunk_losses_without \
+                    in chunks_decompositions:
+                tail_losses += chunk_tail_losses
+                neighbours_losses += chunk_neighbours_losses
+                n_neighbours_scenarios += chunk_n_neighbours
+                losses_without = np.vstack([losses_without, chunk_losses_without])
+                losses_without = np.partition(losses_without, len(losses_without) - n_tail, axis=0)[-n_tail:]
+            return tail_losses, neighbours_losses, n_neighbours_scenarios, losses_without
+
+        if processes is None:
+            tail_losses, neighbours_losses, n_neighbours_scenarios, losses_without = merge(
+                _decompose_losses_chunk(*args) for args in decomposition_args)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                tail_losses, neighbours_losses, n_neighbours_scenarios, losses_without = merge(
+                    executor.map(_decompose_losses_chunk, *zip(*decomposition_args)))
+
+        expected_shortfall = self._portfolio_values_at_risk.mean()
+        component_es = tail_losses / n_tail
+        component_var = neighbours_losses / n_neighbours_scenarios
+        component_var *= self._portfolio_value_at_risk / component_var.sum()
+        incremental_var = self._portfolio_value_at_risk - losses_without.min(axis=0)
+        return expected_shortfall, component_var, incremental_var, component_es
+
+    def compute_value_at_risk(self, method: str = "historical", percentile: int = 5, **monte_carlo_parameters):
+        """
+        compute and store the portfolio value at risk with another method or confidence interval
+        :param method: "historical", "parametric" or "monte_carlo"
+        :param percentile: confidence interval
+        :param monte_carlo_parameters: n_simulations, chunk_size, seed and processes of the monte carlo method
+        :return: value at risk
+        """
+        self._compute_portfolio_value_at_risk(method, percentile, **monte_carlo_parameters)
+        return self._portfolio_value_at_risk
+
     @property
     def lookback_days(self):
         return self._lookback_days
 
+    @property
+    def prices_panel(self):
+        return self._prices_panel
+
+    @property
+    def returns_panel(self):
+        return self._returns_panel
+
     @property
     def mean_returns(self):
         return self._mean_returns
 
+    @property
+    def annualized_mean_returns(self):
+        return self._annualized_mean_returns
+
+    @property
+    def covariance_matrix(self):
+        return self._covariance_matrix
+
+    @property
+    def covariance_source(self):
+        return self._covariance_source
+
+    @property
+    def histo_price_changes(self):
+        return self._histo_price_changes
+
+    @property
+    def var_method(self):
+        return self._var_method
+
+    @property
+    def percentile(self):
+        return self._percentile
+
     @property
     def assets_std(self):
         return self._assets_std
@@ -163,6 +481,14 @@ class PortfolioRiskManager(Portfolio):
     def portfolio_values_at_risk(self):
         return self._portfolio_values_at_risk
 
+    @property
+    def portfolio_expected_shortfall(self):
+        return self._portfolio_expected_shortfall
+
+    @property
+    def risk_decomposition(self):
+        return self._risk_decomposition
+
     @property
     def simulated_losses(self):
         return self._simulated_losses
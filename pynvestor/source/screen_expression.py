@@ -0,0 +1,157 @@
+import ast
+import operator
+import numpy as np
+import pandas as pd
+
+from functools import reduce
+from typing import Callable, List
+
+
+def _rank(values: pd.Series, groups: pd.Series = None) -> pd.Series:
+    """
+    rank of the values in descending order, 1 for the largest value, within every group if any
+    """
+    if groups is None:
+        return values.rank(ascending=False, method='min')
+    return values.groupby(groups).rank(ascending=False, method='min')
+
+
+def _percentile(values: pd.Series, groups: pd.Series = None) -> pd.Series:
+    """
+    percentile rank of the values between 0 and 1, 1 for the largest value, within every group if any
+    """
+    if groups is None:
+        return values.rank(pct=True)
+    return values.groupby(groups).rank(pct=True)
+
+
+def _power(base, exponent):
+    """
+    power computed in floating point, a large exponent overflows to inf instead of computing a huge integer
+    """
+    with np.errstate(over='ignore'):
+        return np.float_power(base, exponent)
+
+
+def _compare(comparison: Callable, left, right):
+    """
+    comparison of metrics which is unknown (NA) when one of them is missing, so that "not" and "or" of it stay
+    unknown instead of becoming True
+    :param comparison: comparison operator
+    :param left: series or scalar
+    :param right: series or scalar
+    :return: nullable boolean series, or scalar
+    """
+    result = comparison(left, right)
+    missing = pd.isna(left) | pd.isna(right)
+    if not isinstance(result, pd.Series):
+        return pd.NA if missing else bool(result)
+    result = result.astype('boolean')
+    result[missing.values] = pd.NA
+    return result
+
+
+class ScreenExpression:
+    """
+    Filter expression over the metrics of a screen, e.g. "roe > 0.1 and (per < 15 or percentile(roe, sector) > 0.8)".
+    An expression is made of metric names, numbers, strings, arithmetic (+ - * / **), comparisons (< <= > >= == !=,
+    chained comparisons as "0 < per < 15"), "and", "or", "not" and the functions abs, log, rank and percentile. The
+    rank and the percentile of a metric are computed within the groups of their second argument if any (e.g. sector).
+    The expression is parsed and compiled once into a function of the metrics dataframe which returns one boolean
+    mask, metrics are columns of the dataframe. A comparison with a missing metric is unknown, as is "not" of it,
+    and a stock whose condition is unknown is not selected
+    """
+    _binary_operators = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                         ast.Div: operator.truediv, ast.Pow: _power,
+                         ast.BitAnd: operator.and_, ast.BitOr: operator.or_}
+    _comparison_operators = {ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+                             ast.Eq: operator.eq, ast.NotEq: operator.ne}
+    _functions = {'abs': np.abs, 'log': np.log, 'rank': _rank, 'percentile': _percentile}
+
+    def __init__(self, expression: str):
+        """
+        :param expression: filter expression
+        """
+        self._expression = expression
+        self._metrics = []
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as syntax_error:
+            raise ValueError(f'invalid screen expression "{expression}": {syntax_error.msg}')
+        self._evaluate = self._compile(tree.body)
+
+    def _compile(self, node: ast.AST) -> Callable:
+        """
+        compile a node of the syntax tree into a function of the metrics dataframe
+        :param node: node of the syntax tree
+        :return: function returning a series or a scalar
+        """
+        if isinstance(node, ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            bool_operator = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+            return lambda df: reduce(bool_operator, [operand(df) for operand in operands])
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return lambda df: ~operand(df)
+            if isinstance(node.op, ast.USub):
+                return lambda df: -operand(df)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+
+        if isinstance(node, ast.BinOp) and type(node.op) in self._binary_operators:
+            left, right = self._compile(node.left), self._compile(node.right)
+            binary_operator = self._binary_operators[type(node.op)]
+            return lambda df: binary_operator(left(df), right(df))
+
+        if isinstance(node, ast.Compare) and all(type(op) in self._comparison_operators for op in node.ops):
+            # a chained comparison "a < b < c" is "a < b and b < c"
+            operands = [self._compile(value) for value in [node.left] + node.comparators]
+            comparisons = [self._comparison_operators[type(op)] for op in node.ops]
+
+            def compare(df):
+                values = [operand(df) for operand in operands]
+                return reduce(operator.and_, [_compare(comparison, left, right) for comparison, left, right
+                                              in zip(comparisons, values[:-1], values[1:])])
+            return compare
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self._functions \
+                and not node.keywords and 1 <= len(node.args) <= 2:
+            function = self._functions[node.func.id]
+            arguments = [self._compile(argument) for argument in node.args]
+            return lambda df: function(*[argument(df) for argument in arguments])
+
+        if isinstance(node, ast.Name):
+            if node.id not in self._metrics:
+                self._metrics.append(node.id)
+            return lambda df: df[node.id]
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return lambda df: node.value
+
+        raise ValueError(f'"{ast.get_source_segment(self._expression.strip(), node) or type(node).__name__}" '
+                         f'not allowed in the screen expression "{self._expression}"')
+
+    def evaluate(self, df: pd.DataFrame) -> pd.Series:
+        """
+        evaluate the expression on the metrics, the stocks whose condition is unknown are not selected
+        :param df: dataframe with one column per metric of the expression
+        :return: boolean series with the index of the dataframe
+        """
+        mask = self._evaluate(df)
+        if not isinstance(mask, pd.Series):
+            mask = pd.Series(False if mask is pd.NA else mask, index=df.index)
+        if isinstance(mask.dtype, pd.BooleanDtype):
+            mask = mask.fillna(False).astype(bool)
+        if mask.dtype != bool:
+            raise ValueError(f'the screen expression "{self._expression}" is not a condition')
+        return mask
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @property
+    def metrics(self) -> List[str]:
+        return self._metrics
@@ -1,187 +1,200 @@
+import numpy as np
 import pandas as pd
 import datetime as dt
 
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Union
 
-from pynvestor.source import euronext, mongo
+from pynvestor.models.indices import CAC_40_ISIN
 from pynvestor.source.data_providers import ReutersClient
 from pynvestor.source.helpers import Helpers
+from pynvestor.source.market_metrics import (compute_market_metrics, get_market_metrics, market_metrics_names,
+                                             market_metrics_window)
+from pynvestor.source.ratios import get_ratios, get_ratios_history, ratios_columns
+from pynvestor.source.screen_expression import ScreenExpression
 from pynvestor import logger
 
 reuters = ReutersClient()
 helpers = Helpers()
 
+# metrics computed when a screen references them and they are not in the ratios: name -> (function, dependencies)
+screen_metrics = {}
+
+
+def register_metric(name: str, function: Callable[[pd.DataFrame, dt.datetime], pd.Series],
+                    dependencies: tuple = ()) -> bool:
+    """
+    make a metric available to the screens
+    :param name: name of the metric in the screen expressions
+    :param function: function of the screener dataframe and of the screening date (None for today) returning the
+    metric of every row
+    :param dependencies: metrics which must be computed before
+    :return: True
+    """
+    screen_metrics[name] = (function, tuple(dependencies))
+    return True
+
+
+register_metric('price', lambda df, as_of_date: df['isin'].map(
+    helpers.get_last_prices(df['isin'].dropna().unique().tolist(), as_of_date)))
+register_metric('per', lambda df, as_of_date: df['price'] / df['eps'].where(df['eps'] != 0.0), ('price',))
+register_metric('market_cap', lambda df, as_of_date: df['price'] * df['shares_outstanding'], ('price',))
+register_metric('earnings_yield', lambda df, as_of_date: df['eps'] / df['price'], ('price',))
+for market_metric in market_metrics_names:
+    register_metric(market_metric, lambda df, as_of_date, name=market_metric: df['isin'].map(
+        get_market_metrics(df['isin'].dropna().unique().tolist(), as_of_date, helpers=helpers)[name]))
+
+
+def _compute_metric(df: pd.DataFrame, metric: str, as_of_date: dt.datetime = None) -> bool:
+    """
+    Compute a metric and its dependencies if they are not columns of the screener dataframe
+    :param df: screener dataframe, the metrics are added as columns
+    :param metric: name of the metric
+    :param as_of_date: screening date, today if None
+    :return: True
+    """
+    if metric in df.columns:
+        return True
+    function, dependencies = screen_metrics[metric]
+    for dependency in dependencies:
+        _compute_metric(df, dependency, as_of_date)
+    df[metric] = function(df, as_of_date)
+    return True
+
+
+def _screen_dates(ratios: pd.DataFrame, prices_panel: pd.DataFrame, volumes_panel: pd.DataFrame,
+                  dates: List[dt.datetime], expression: str, publication_lag_days: int) -> np.ndarray:
+    """
+    screen the stocks at every date with the reports published and the quotes known at that date, the market
+    metrics of every date are computed from the quotes of the panels before it
+    :param ratios: point-in-time ratios sorted by report date
+    :param prices_panel: daily prices with one column per isin of the ratios and the market metrics reference
+    :param volumes_panel: daily traded volumes with the index and the columns of the prices panel, None if the
+    expression has no market metric
+    :param dates: screening dates
+    :param expression: screen expression
+    :param publication_lag_days: number of days between a report date and the publication of the report
+    :return: dates-by-isins boolean array, isins in their order of appearance in the ratios
+    """
+    screen_expression = ScreenExpression(expression)
+    expression_market_metrics = [metric for metric in screen_expression.metrics if metric in market_metrics_names]
+    publication_dates = ratios['date'] + dt.timedelta(days=publication_lag_days)
+    isins = pd.Index(ratios['isin'].unique())
+    membership = np.zeros((len(dates), len(isins)), dtype=bool)
+
+    for loc, screening_date in enumerate(dates):
+        # quotes of the screening day are known
+        end = prices_panel.index.searchsorted(pd.Timestamp(screening_date).normalize() + pd.Timedelta(days=1))
+        window_rows = slice(max(end - market_metrics_window, 0), end)
+        if end:
+            last_prices = prices_panel.iloc[window_rows].ffill().iloc[-1]
+        else:
+            last_prices = pd.Series(np.nan, index=prices_panel.columns)
+
+        df = ratios[publication_dates <= screening_date].drop_duplicates('ric', keep='last')
+        df = df.drop(columns=['price', 'price_date', 'per']).reset_index(drop=True)
+        df['price'] = df['isin'].map(last_prices).astype(np.float64)
+        if expression_market_metrics:
+            market_metrics = compute_market_metrics(prices_panel.iloc[window_rows], volumes_panel.iloc[window_rows],
+                                                    CAC_40_ISIN)
+            for metric in expression_market_metrics:
+                df[metric] = df['isin'].map(market_metrics[metric])
+        for metric in screen_expression.metrics:
+            _compute_metric(df, metric, screening_date)
+        membership[loc] = isins.isin(df.loc[screen_expression.evaluate(df), 'isin'])
+    return membership
+
 
 class Screener:
-    def __init__(self, screen_filters: Dict, period: str, as_of_date: dt.date = None):
+    def __init__(self, screen_filters: Union[Dict, str], period: str, as_of_date: dt.date = None):
         """
-        Class to screen stocks from fundamental data stored in the database
-        :param screen_filters: dictionary with metric name as key and 2 element list representing the upper
-        and lower limits
+        Class to screen stocks from the fundamental ratios materialized in the database
+        :param screen_filters: screen expression (see ScreenExpression), or dictionary with metric name as key and
+        2 element list representing the upper and lower limits
         :param period: interim or annual
         :param as_of_date: date of the metrics
         """
         self._period = period
         self._date = as_of_date
         self._df_screener = pd.DataFrame()
-        available_screen_filters = ('eps', 'per', 'roe', 'gearing', 'operating_margin')
-        for screen_filter in list(screen_filters.keys()):
+        if isinstance(screen_filters, dict):
+            screen_filters = ' and '.join(f'({lower_limit!r} < {screen_name} < {upper_limit!r})'
+                                          for screen_name, (lower_limit, upper_limit) in screen_filters.items())
+        self.screen_expression = ScreenExpression(screen_filters)
+
+        available_screen_filters = tuple(dict.fromkeys(ratios_columns + list(screen_metrics)))
+        for screen_filter in self.screen_expression.metrics:
             assert screen_filter in available_screen_filters, f'{screen_filter} must be in {available_screen_filters}'
-        self.screen_filters = screen_filters
 
-    @logger
-    def _get_data(self, statement: str, report_elem: str, period: str):
+    def _get_ratios(self):
         """
-        get financial data from mongo of all stocks
-        :param statement: "income", "balance_sheet", "cash_flow"
-        :param report_elem: name of the report element in mongo
-        :param period: annual or interim
-        :return: dataframe
+        get the last materialized ratios of every ric, the prices and the ratios depending on them are computed
+        again when they are used for a past date
+        :return:
         """
-        report_date = dt.datetime.today() if self._date is None else self._date
-        pipeline = [{"$match": {"report_elem": report_elem, "period": period, "date": {"$lte": report_date}}},
-                    {"$sort": {"ric": 1, "date": -1}},
-                    {"$group": {"_id": {"ric": "$ric", "report_elem": "$report_elem"},
-                                "ric": {"$first": "$ric"},
-                                "date": {"$first": "$date"},
-                                report_elem.lower().replace(' ', '_'): {"$first": "$value"}}},
-                    {"$project": {"_id": 0}}]
-        results = mongo.aggregate_documents('financials', statement, pipeline)
-        df = pd.DataFrame(results)
-        return df
-
-    def _get_isin_and_mic(self):
-        if 'isin' not in self._df_screener.columns or 'ric' not in self._df_screener.columns:
-            rics = list(self._df_screener.groupby('ric').groups.keys())
-            isins = {ric: helpers.transco_isin_ric(ric=ric)[0] for ric in rics}
-            df_isin = pd.DataFrame.from_dict(isins, orient='index').reset_index()
-            df_isin.columns = ['ric', 'isin']
-            df_isin['mic'] = df_isin['isin'].apply(lambda x: euronext.get_mic_from_isin(x))
-            self._df_screener = self._df_screener.merge(df_isin, how='left', on='ric')
-        return True
-
-    def _get_shares_details(self):
-        if 'shares_outstanding' not in self._df_screener.columns:
-            isins_mics = self._df_screener[['isin', 'mic']].values.tolist()
-            instr_details = euronext.get_instruments_details(isins_mics)
-            shares_outstanding = {}
-            names = {}
-            subsectors = {}
-            for instrument_details in instr_details:
-                for isin, details in instrument_details.items():
-                    if details is not None:
-                        shares_outstanding[isin] = int(details.get('nbShare'))
-                        names[isin] = details.get('longNm')
-                        if details.get('instrRel') is not None:
-                            subsectors[isin] = details.get('instrRel')[3].get('instrLst').get('lstLbl').strip()
-                        else:
-                            subsectors[isin] = None
-
-            df_shares_details = pd.DataFrame([shares_outstanding, names, subsectors]).T.reset_index()
-            df_shares_details.columns = ['isin', 'shares_outstanding', 'names', 'subsectors']
-            self._df_screener = self._df_screener.merge(df_shares_details, how='left', on='isin')
-        return True
-
-    def _get_prices(self):
-        if 'price' not in self._df_screener.columns:
-            if self._date is None:
-                self._df_screener['price'] = self._df_screener['isin'].apply(
-                    lambda x: helpers.get_last_price_in_mongo(x))
-            else:
-                self._df_screener['price'] = self._df_screener['isin'].apply(
-                    lambda x: helpers.get_price_from_mongo(x, self._date))
-
-    @logger
-    def _compute_eps(self):
-        if 'net_income' not in self._df_screener.columns:
-            # Get net incomes
-            self._df_screener = self._get_data('income', 'Net Income', self._period)
-        if 'isin' not in self._df_screener.columns:
-            # Get transco isin from rics
-            self._get_isin_and_mic()
-
-        if 'shares_outstanding' not in self._df_screener.columns:
-            # Get shares outstanding
-            self._get_shares_details()
-
-        if 'price' not in self._df_screener.columns:
-            # Get last prices
-            self._get_prices()
-
-        # Compute EPS
-        self._df_screener['eps'] = (self._df_screener['net_income'] * 1000000) / self._df_screener['shares_outstanding']
-
-        return True
-
-    @logger
-    def _compute_per(self):
-        if 'eps' not in self._df_screener.columns:
-            self._compute_eps()
-
-        # Compute PER
-        self._df_screener['eps'].replace(0.0, None, inplace=True)  # To avoir zero division error
-        self._df_screener['per'] = self._df_screener['price'] / self._df_screener['eps']
-        return True
-
-    @logger
-    def _compute_roe(self):
-        if 'total_equity' not in self._df_screener.columns:
-            df_total_equity = self._get_data('balance_sheet', 'Total Equity', self._period)
-            self._df_screener = self._df_screener.merge(df_total_equity[['ric', 'total_equity']],
-                                                        how='left', left_on='ric', right_on='ric')
-        if 'net_income' not in self._df_screener.columns:
-            df_net_income = self._get_data('income', 'Net Income', self._period)
-            self._df_screener = self._df_screener.merge(df_net_income['ric', 'net_income'],
-                                                        how='left', left_on='ric', right_on='ric')
-
-        # Compute ROE
-        self._df_screener['roe'] = self._df_screener['net_income'] / self._df_screener['total_equity']
+        self._df_screener = get_ratios(self._period, self._date)
+        if self._date is not None:
+            self._df_screener = self._df_screener.drop(columns=['price', 'price_date', 'per'])
         return True
 
     @logger
-    def _compute_gearing(self):
-        if 'total_debt' not in self._df_screener.columns:
-            df_total_debt = self._get_data('balance_sheet', 'Total Debt', self._period)
-            self._df_screener = self._df_screener.merge(df_total_debt[['ric', 'total_debt']],
-                                                        how='left', left_on='ric', right_on='ric')
-        if 'total_equity' not in self._df_screener.columns:
-            df_total_equity = self._get_data('balance_sheet', 'Total Equity', self._period)
-            self._df_screener = self._df_screener.merge(df_total_equity[['ric', 'total_equity']],
-                                                        how='left', left_on='ric', right_on='ric')
-
-        # Compute gearing
-        self._df_screener['gearing'] = self._df_screener['total_debt'] / self._df_screener['total_equity']
-        return True
+    def run(self):
+        self._get_ratios()
+        for metric in self.screen_expression.metrics:
+            _compute_metric(self._df_screener, metric, self._date)
 
-    @logger
-    def _compute_operating_margin(self):
-        if 'operating_income' not in self._df_screener.columns:
-            df_operating_income = self._get_data('income', 'Operating Income', self._period)
-            self._df_screener = self._df_screener.merge(df_operating_income[['ric', 'operating_income']],
-                                                        how='left', left_on='ric', right_on='ric')
-
-        if 'revenue' not in self._df_screener.columns:
-            df_revenue = self._get_data('income', 'Revenue', self._period)
-            self._df_screener = self._df_screener.merge(df_revenue[['ric', 'revenue']],
-                                                        how='left', left_on='ric', right_on='ric')
-
-        # Compute operating margin
-        self._df_screener['operating_margin'] = self._df_screener['operating_income'] / self._df_screener['revenue']
-        return True
+        conditions = self.screen_expression.evaluate(self._df_screener)
+        result = self._df_screener[conditions]
+        return result
 
     @logger
-    def run(self):
-        results_df = {}
-        for screen_name, (lower_limit, upper_limit) in list(self.screen_filters.items()):
-            # Get required data
-            get_metrics = self.__getattribute__(f'_compute_{screen_name}')
-            get_metrics()
-
-            # Apply filter
-            conditions = (self._df_screener[screen_name] > lower_limit) & (self._df_screener[screen_name] < upper_limit)
-            results_df[screen_name] = self._df_screener[conditions]
-
-        frames = list(results_df.values())
-        result = pd.concat(frames, axis=1, join='inner')
-        result = result.loc[:, ~result.columns.duplicated()]
-        return result
+    def run_history(self, dates: List[dt.datetime], publication_lag_days: int = 90, n_chunks: int = 1,
+                    processes: int = None) -> pd.DataFrame:
+        """
+        screen the stocks at several dates without look-ahead: at every date only the reports published and the
+        quotes known at that date are used. The ratios, the prices and the volumes of all the dates are read once and
+        the market metrics of every date are computed from them, the dates are split in chunks which can be screened
+        in parallel without database access
+        :param dates: screening dates, e.g. month ends
+        :param publication_lag_days: number of days between a report date and the publication of the report
+        :param n_chunks: number of chunks of dates
+        :param processes: number of processes screening the chunks, screened in the current process if None
+        :return: boolean dataframe of membership indexed by date with one column per isin
+        """
+        dates = pd.DatetimeIndex(sorted(dates))
+        ratios = get_ratios_history(self._period).dropna(subset=['isin'])
+        ratios = ratios.sort_values('date', kind='mergesort').reset_index(drop=True)
+        isins = ratios['isin'].unique().tolist()
+
+        # the quotes of all the dates are read once: the last price of every date, and the history of the market
+        # metrics if the expression has any
+        market_metrics = any(metric in market_metrics_names for metric in self.screen_expression.metrics)
+        history_days = int(market_metrics_window * 7 / 5) + 15 if market_metrics else 15
+        universe = isins + [CAC_40_ISIN] if market_metrics else isins
+        start_date = dates[0].to_pydatetime() - dt.timedelta(days=history_days)
+        end_date = dates[-1].to_pydatetime() + dt.timedelta(days=1)
+        prices_panel = helpers.get_prices_panel(universe, start_date=start_date, end_date=end_date)
+        volumes_panel = None
+        if market_metrics:
+            volumes_panel = helpers.get_prices_panel(universe, start_date=start_date, end_date=end_date,
+                                                     field='volume')
+            volumes_panel = volumes_panel.reindex(index=prices_panel.index, columns=prices_panel.columns)
+
+        chunks = [chunk for chunk in np.array_split(np.arange(len(dates)), n_chunks) if len(chunk)]
+        chunks_args = []
+        for chunk in chunks:
+            # quotes of the chunk dates and of the window before the first one
+            first_row = prices_panel.index.searchsorted(dates[chunk[0]].normalize() + pd.Timedelta(days=1))
+            last_row = prices_panel.index.searchsorted(dates[chunk[-1]].normalize() + pd.Timedelta(days=1))
+            rows = slice(max(first_row - market_metrics_window, 0), last_row)
+            chunks_args.append([ratios, prices_panel.iloc[rows],
+                                volumes_panel.iloc[rows] if volumes_panel is not None else None,
+                                dates[chunk].to_pydatetime().tolist(), self.screen_expression.expression,
+                                publication_lag_days])
+        if processes is None:
+            chunks_membership = [_screen_dates(*args) for args in chunks_args]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunks_membership = list(executor.map(_screen_dates, *zip(*chunks_args)))
+
+        return pd.DataFrame(np.vstack(chunks_membership), index=dates, columns=isins)
@@ -0,0 +1,164 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Tuple
+
+from pynvestor import logger
+from pynvestor.models.indices import CAC_40_ISIN
+from pynvestor.source.helpers import Helpers
+from pynvestor.source.portfolio import Portfolio
+
+historical_windows = {'Financial crisis 2008': (dt.datetime(2008, 9, 12), dt.datetime(2008, 11, 20)),
+                      'Euro debt crisis 2011': (dt.datetime(2011, 7, 7), dt.datetime(2011, 9, 22)),
+                      'Covid crash 2020': (dt.datetime(2020, 2, 19), dt.datetime(2020, 3, 18))}
+
+
+class StressTester:
+    """
+    Apply historical windows and user-defined shocks to the current holdings of a portfolio. Every scenario is a
+    row of a scenario-by-isin matrix of returns, the profits and losses of all the scenarios are one matrix product.
+    An instrument without prices in a window, or without a user-defined shock, moves with its proxy scaled by its beta
+    """
+    def __init__(self, portfolio: Portfolio, proxy_isin: str = CAC_40_ISIN, proxies: Dict[str, str] = None,
+                 lookback_days: int = 500, windows: Dict[str, Tuple[dt.datetime, dt.datetime]] = None,
+                 helpers: Helpers = None):
+        """
+        :param portfolio: portfolio snapshot, it is not modified
+        :param proxy_isin: default proxy of the holdings
+        :param proxies: proxy of some holdings (e.g. a sector index), keyed by isin
+        :param lookback_days: number of days of history used to estimate the betas to the proxies
+        :param windows: historical windows (start date, end date) keyed by scenario name, historical_windows if None
+        :param helpers: Helpers object, created if None
+        """
+        self._holdings = portfolio.holdings
+        self._portfolio_market_value = portfolio.portfolio_market_value
+        self._helpers = helpers or Helpers()
+        self._isins = self._holdings.isins.tolist()
+        self._proxies_isins = [(proxies or {}).get(isin, proxy_isin) for isin in self._isins]
+        self._lookback_days = lookback_days
+        self._windows = dict(historical_windows if windows is None else windows)
+        self._shocks = {}
+        self._compute_betas()
+
+    def _get_prices_panel(self, **kwargs) -> pd.DataFrame:
+        """
+        prices of the holdings and of their proxies in one read
+        :param kwargs: arguments of Helpers.get_prices_panel
+        :return: dataframe with one column per isin
+        """
+        isins = list(dict.fromkeys(self._isins + self._proxies_isins))
+        return self._helpers.get_prices_panel(isins, **kwargs)
+
+    def _compute_betas(self, min_periods: int = 20):
+        """
+        Betas of the holdings to their proxies on pairwise-complete daily returns, 1 if the history is too short
+        :param min_periods: minimum number of common returns
+        :return:
+        """
+        returns_panel = self._get_prices_panel(window=self._lookback_days + 1).pct_change(fill_method=None).iloc[1:]
+        assets_returns = returns_panel[self._isins].values
+        proxies_returns = returns_panel[self._proxies_isins].values
+
+        observed = ~np.isnan(assets_returns) & ~np.isnan(proxies_returns)
+        counts = observed.sum(axis=0)
+        assets_returns = np.where(observed, assets_returns, 0.0)
+        proxies_returns = np.where(observed, proxies_returns, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            assets_means = assets_returns.sum(axis=0) / counts
+            proxies_means = proxies_returns.sum(axis=0) / counts
+            covariances = (assets_returns * proxies_returns).sum(axis=0) / counts - assets_means * proxies_means
+            proxies_variances = (proxies_returns ** 2).sum(axis=0) / counts - proxies_means ** 2
+            betas = covariances / proxies_variances
+
+        self._betas = np.where((counts >= min_periods) & (proxies_variances > 0), betas, 1.0)
+        return True
+
+    def add_window(self, name: str, start_date: dt.datetime, end_date: dt.datetime) -> bool:
+        """
+        add a historical scenario, the holdings move as they did between two dates
+        :param name: name of the scenario
+        :param start_date: first date of the window
+        :param end_date: last date of the window
+        :return: True
+        """
+        self._windows[name] = (start_date, end_date)
+        return True
+
+    def add_shock(self, name: str, shocks: Dict[str, float]) -> bool:
+        """
+        add a user-defined scenario
+        :param name: name of the scenario
+        :param shocks: returns keyed by isin, a shock of a proxy (e.g. {"FR0003500008": -0.2}) moves the holdings
+        without their own shock through their betas
+        :return: True
+        """
+        self._shocks[name] = shocks
+        return True
+
+    def _compute_windows_returns(self) -> np.ndarray:
+        """
+        Returns of the holdings over every historical window, from one prices panel covering all the windows
+        :return: windows-by-isins array
+        """
+        if not self._windows:
+            return np.empty((0, len(self._isins)))
+        starts, ends = (pd.DatetimeIndex(dates) for dates in zip(*self._windows.values()))
+        prices_panel = self._get_prices_panel(start_date=starts.min().to_pydatetime() - dt.timedelta(days=10),
+                                              end_date=ends.max().to_pydatetime() + dt.timedelta(days=1))
+
+        # last quote on or before each date, an instrument not quoted yet at the start of a window has no return
+        prices_panel = prices_panel.ffill()
+        start_prices = prices_panel.reindex(starts.normalize(), method='ffill')
+        end_prices = prices_panel.reindex(ends.normalize(), method='ffill')
+        windows_returns = (end_prices.values / start_prices.values) - 1
+        windows_returns = pd.DataFrame(windows_returns, columns=prices_panel.columns)
+
+        assets_returns = windows_returns[self._isins].values
+        proxies_returns = windows_returns[self._proxies_isins].values * self._betas
+        return np.where(np.isnan(assets_returns), proxies_returns, assets_returns)
+
+    def _compute_shocks_returns(self) -> np.ndarray:
+        """
+        Returns of the holdings in every user-defined scenario
+        :return: shocks-by-isins array
+        """
+        n_isins = len(self._isins)
+        shocks_returns = np.array([[shocks.get(isin, np.nan) for isin in self._isins]
+                                   for shocks in self._shocks.values()], dtype=np.float64).reshape(-1, n_isins)
+        proxies_shocks = np.array([[shocks.get(proxy_isin, np.nan) for proxy_isin in self._proxies_isins]
+                                   for shocks in self._shocks.values()], dtype=np.float64).reshape(-1, n_isins)
+        shocks_returns = np.where(np.isnan(shocks_returns), proxies_shocks * self._betas, shocks_returns)
+        return np.nan_to_num(shocks_returns)
+
+    def run(self) -> pd.DataFrame:
+        """
+        apply every scenario to the current holdings
+        :return: dataframe indexed by scenario with the profit and loss and the return of the portfolio
+        """
+        scenarios_returns = np.vstack([self._compute_windows_returns(), self._compute_shocks_returns()])
+        scenarios = list(self._windows) + list(self._shocks)
+
+        missing = np.isnan(scenarios_returns)
+        if missing.any():
+            missing_isins = sorted({self._isins[loc] for loc in np.nonzero(missing)[1]})
+            logger.log.warning(f'{missing_isins}: no price for the instrument nor its proxy in some scenarios, '
+                               f'their returns are set to 0')
+            scenarios_returns[missing] = 0.0
+
+        pnl = scenarios_returns.dot(self._holdings.market_value)
+        self._scenarios_returns = pd.DataFrame(scenarios_returns, index=scenarios, columns=self._isins)
+        self._results = pd.DataFrame({'pnl': pnl, 'return': pnl / self._portfolio_market_value}, index=scenarios)
+        return self._results
+
+    @property
+    def betas(self):
+        return dict(zip(self._isins, self._betas.tolist()))
+
+    @property
+    def scenarios_returns(self):
+        return self._scenarios_returns
+
+    @property
+    def results(self):
+        return self._results
@@ -0,0 +1,151 @@
+import bisect
+import numpy as np
+import pandas as pd
+
+from collections import deque
+from scipy import stats
+from scipy.special import xlogy
+
+
+def get_periods_per_year(index: pd.DatetimeIndex) -> int:
+    """
+    number of periods per year of a series of values, from the median interval between two dates
+    :param index: dates of the values
+    :return: 252 for daily values, 52 for weekly values...
+    """
+    if len(index) < 2:
+        return 252
+    median_days = np.median(np.diff(index.values).astype('timedelta64[D]').astype(int))
+    if median_days <= 3:  # trading days, the weekends are not periods
+        return 252
+    return max(int(round(365.25 / median_days)), 1)
+
+
+class ValueAtRiskBacktest:
+    """
+    Backtest of the historical value at risk on the values of a portfolio (e.g. the daily values of its current
+    holdings, or its net asset values): the value at risk of every date is computed on the returns of the preceding
+    window and compared with the realized return. The window is kept sorted and updated with one insertion and one
+    removal per date instead of being sorted again
+    """
+    def __init__(self, navs: pd.Series, window: int = None, percentile: int = 5, min_observations: int = 100):
+        """
+        :param navs: values indexed by date, the value at risk horizon is the period between two values
+        :param window: number of past returns of each value at risk, one year of periods of the values if None
+        :param percentile: confidence interval
+        :param min_observations: minimum number of backtested dates of the tests, the history is insufficient below
+        """
+        navs = navs.sort_index().dropna()
+        self._returns = navs.pct_change().dropna()
+        self._window = window or get_periods_per_year(navs.index)
+        self._percentile = percentile
+        self._sufficient_history = len(self._returns) - self._window >= min_observations
+
+        self._compute_rolling_value_at_risk()
+        self._compute_kupiec_test()
+        self._compute_christoffersen_test()
+
+    def _compute_rolling_value_at_risk(self):
+        """
+        Compute the value at risk of every date with enough history, as a loss in percentage of the net asset value
+        :return:
+        """
+        returns = self._returns.values
+        percentile_loc = max(int(round(self._percentile / 100 * self._window, 0)), 1)
+
+        window_returns = deque()
+        sorted_returns = []
+        values_at_risk = np.full(len(returns), np.nan)
+        for loc, daily_return in enumerate(returns):
+            if len(window_returns) == self._window:
+                values_at_risk[loc] = -sorted_returns[percentile_loc - 1]
+                del sorted_returns[bisect.bisect_left(sorted_returns, window_returns.popleft())]
+            window_returns.append(daily_return)
+            bisect.insort(sorted_returns, daily_return)
+
+        backtest = pd.DataFrame({'return': returns, 'value_at_risk': values_at_risk}, index=self._returns.index)
+        backtest = backtest.dropna()
+        backtest['exception'] = backtest['return'] < -backtest['value_at_risk']
+        self._backtest = backtest
+        return True
+
+    def _compute_kupiec_test(self):
+        """
+        Kupiec proportion of failures test: is the exception rate equal to the percentile, no p-value when the
+        history is insufficient
+        :return:
+        """
+        n_observations = len(self._backtest)
+        n_exceptions = int(self._backtest['exception'].sum())
+        expected_rate = self._percentile / 100
+        exception_rate = n_exceptions / n_observations if n_observations else np.nan
+
+        log_likelihood_null = xlogy(n_observations - n_exceptions, 1 - expected_rate) + \
+            xlogy(n_exceptions, expected_rate)
+        log_likelihood = xlogy(n_observations - n_exceptions, 1 - exception_rate) + xlogy(n_exceptions, exception_rate)
+        statistic = -2 * (log_likelihood_null - log_likelihood)
+
+        self._kupiec_test = {'n_observations': n_observations,
+                             'n_exceptions': n_exceptions,
+                             'exception_rate': exception_rate,
+                             'statistic': statistic,
+                             'p_value': stats.chi2.sf(statistic, df=1) if self._sufficient_history else None}
+        return True
+
+    def _compute_christoffersen_test(self):
+        """
+        Christoffersen tests: independence of the exceptions, and conditional coverage which adds the Kupiec test, no
+        p-values when the history is insufficient
+        :return:
+        """
+        exceptions = self._backtest['exception'].values.astype(int)
+        transitions = np.zeros((2, 2))
+        np.add.at(transitions, (exceptions[:-1], exceptions[1:]), 1)
+        (n_00, n_01), (n_10, n_11) = transitions
+
+        # the rate of a state never visited has no weight in the likelihood
+        rate_after_no_exception = n_01 / (n_00 + n_01) if n_00 + n_01 else 0.0
+        rate_after_exception = n_11 / (n_10 + n_11) if n_10 + n_11 else 0.0
+        rate = (n_01 + n_11) / transitions.sum() if transitions.sum() else 0.0
+
+        log_likelihood_null = xlogy(n_00 + n_10, 1 - rate) + xlogy(n_01 + n_11, rate)
+        log_likelihood = (xlogy(n_00, 1 - rate_after_no_exception) + xlogy(n_01, rate_after_no_exception)
+                          + xlogy(n_10, 1 - rate_after_exception) + xlogy(n_11, rate_after_exception))
+        independence_statistic = -2 * (log_likelihood_null - log_likelihood)
+        conditional_coverage_statistic = independence_statistic + self._kupiec_test['statistic']
+
+        if not self._sufficient_history:
+            independence_p_value, conditional_coverage_p_value = None, None
+        else:
+            independence_p_value = stats.chi2.sf(independence_statistic, df=1)
+            conditional_coverage_p_value = stats.chi2.sf(conditional_coverage_statistic, df=2)
+
+        self._christoffersen_test = {'independence_statistic': independence_statistic,
+                                     'independence_p_value': independence_p_value,
+                                     'conditional_coverage_statistic': conditional_coverage_statistic,
+                                     'conditional_coverage_p_value': conditional_coverage_p_value}
+        return True
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def percentile(self):
+        return self._percentile
+
+    @property
+    def sufficient_history(self):
+        return self._sufficient_history
+
+    @property
+    def backtest(self):
+        return self._backtest
+
+    @property
+    def kupiec_test(self):
+        return self._kupiec_test
+
+    @property
+    def christoffersen_test(self):
+        return self._christoffersen_test
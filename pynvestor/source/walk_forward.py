@@ -0,0 +1,142 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from pynvestor import logger
+from pynvestor.models.constraints import PortfolioConstraints
+from pynvestor.source.covariance import RollingCovariance
+from pynvestor.source.helpers import Helpers
+from pynvestor.source.optimizer import solve_portfolio
+
+
+def _walk_forward_segment(returns: np.ndarray, dates: List[dt.datetime], isins: List[str], rebalance_locs: List[int],
+                          lookback_days: int, objective: str, constraints: PortfolioConstraints,
+                          risk_free_rate: float, budget: float, min_periods: int, n_warm_up: int = 0) -> np.ndarray:
+    """
+    solve the portfolios of consecutive rebalancing dates. The rolling estimates are updated with the returns
+    between two dates only, each portfolio starts from the previous one
+    :param returns: daily returns, NaN for missing quotes
+    :param dates: dates of the returns
+    :param isins: isins of the columns of the returns
+    :param rebalance_locs: increasing positions of the rebalancing dates in the returns
+    :param lookback_days: number of daily returns of the estimates
+    :param objective: objective of Optimizer.optimize_portfolios
+    :param constraints: PortfolioConstraints object
+    :param risk_free_rate: annual risk-free rate
+    :param budget: sum of the weights
+    :param min_periods: minimum number of returns in the window for an isin to be invested
+    :param n_warm_up: number of first rebalancing dates only solved as starting points of the next ones
+    :return: weights of every rebalancing date after the warm-up dates
+    """
+    rolling_estimates = RollingCovariance(isins, window=lookback_days)
+    position = max(rebalance_locs[0] - lookback_days + 1, 0)
+    weights = np.zeros(len(isins))
+    segment_weights = np.zeros((len(rebalance_locs), len(isins)))
+
+    for i, loc in enumerate(rebalance_locs):
+        for returns_date, daily_returns in zip(dates[position:loc + 1], returns[position:loc + 1]):
+            rolling_estimates.update(daily_returns, returns_date)
+        position = loc + 1
+
+        eligible = rolling_estimates.get_counts(isins) >= min_periods
+        if eligible.any():
+            eligible_isins = [isin for isin, is_eligible in zip(isins, eligible) if is_eligible]
+            covariance_matrix = np.nan_to_num(rolling_estimates.get_covariance(eligible_isins)) * 252
+            mean_returns = (1 + rolling_estimates.get_mean_returns(eligible_isins)) ** 252 - 1
+            initial_weights = weights[eligible]
+            initial_weights = budget * initial_weights / initial_weights.sum() if initial_weights.sum() > 0 else None
+            weights = np.zeros(len(isins))
+            try:
+                weights[eligible] = solve_portfolio(objective, covariance_matrix, mean_returns, risk_free_rate,
+                                                    eligible_isins, constraints, budget, initial_weights)
+            except AssertionError as assertion_error:
+                logger.log.warning(f'{dates[loc]}: {assertion_error}, previous weights kept')
+                weights[eligible] = initial_weights if initial_weights is not None else budget / eligible.sum()
+        segment_weights[i] = weights
+    return segment_weights[n_warm_up:]
+
+
+class WalkForwardOptimizer:
+    """
+    Roll the estimation window of an optimization through history: at every rebalancing date the portfolio is
+    optimized on the returns of the preceding window, starting from the previous portfolio. The rebalancing dates
+    are split in contiguous segments which can be solved in parallel, each one warming up its own rolling estimates
+    and its starting portfolio on the last rebalancing dates of the previous segment
+    """
+    def __init__(self, isins: List[str], start_date: dt.datetime, end_date: dt.datetime = None,
+                 objective: str = 'minimum_variance', lookback_days: int = 500, frequency: str = 'W-FRI',
+                 risk_free_rate: float = 0.01, constraints: PortfolioConstraints = None, min_periods: int = 60,
+                 helpers: Helpers = None):
+        """
+        :param isins: universe of the portfolios
+        :param start_date: first rebalancing date
+        :param end_date: last date of the prices, today if None
+        :param objective: "minimum_variance", "max_sharpe", "risk_parity" or "max_diversification"
+        :param lookback_days: number of daily returns of the estimates
+        :param frequency: pandas frequency of the rebalancing, the last trading date of every period is used
+        :param risk_free_rate: annual risk-free rate
+        :param constraints: PortfolioConstraints object, long-only and fully invested if None
+        :param min_periods: minimum number of returns in the window for an isin to be invested
+        :param helpers: Helpers object, created if None
+        """
+        self._isins = list(isins)
+        self._objective = objective
+        self._lookback_days = lookback_days
+        self._risk_free_rate = risk_free_rate
+        self._constraints = constraints or PortfolioConstraints()
+        self._min_periods = min_periods
+        self._helpers = helpers or Helpers()
+
+        history_start_date = start_date - dt.timedelta(days=int(lookback_days * 7 / 5) + 15)
+        prices_panel = self._helpers.get_prices_panel(self._isins, start_date=history_start_date, end_date=end_date)
+        self._returns_panel = prices_panel.pct_change(fill_method=None).iloc[1:]
+
+        trading_dates = self._returns_panel.index.to_series()
+        trading_dates = trading_dates[trading_dates >= start_date]
+        self._rebalance_dates = pd.DatetimeIndex(trading_dates.resample(frequency).last().dropna().values)
+
+    def run(self, n_segments: int = 1, processes: int = None, n_warm_up: int = 4) -> pd.DataFrame:
+        """
+        solve the portfolios of all the rebalancing dates. The minimum variance portfolios do not depend on their
+        starting point, the solutions of the other objectives are the same for any number of segments up to the
+        tolerance of the solver once the warm-up dates have reached the previous segment path
+        :param n_segments: number of contiguous segments of rebalancing dates
+        :param processes: number of processes solving the segments, solved in the current process if None
+        :param n_warm_up: number of rebalancing dates of the previous segment solved again by a segment to start
+        from the previous portfolio
+        :return: dataframe of target weights indexed by rebalancing date with one column per isin
+        """
+        budget = 1 - (self._constraints.cash_weight or 0.0)
+        rebalance_locs = self._returns_panel.index.get_indexer(self._rebalance_dates)
+        segments_bounds = [(segment[0], segment[-1] + 1) for segment in
+                           np.array_split(np.arange(len(rebalance_locs)), n_segments) if len(segment)]
+
+        returns = self._returns_panel.values
+        dates = self._returns_panel.index.to_pydatetime().tolist()
+        segments_args = [[returns, dates, self._isins, rebalance_locs[max(start - n_warm_up, 0):end].tolist(),
+                          self._lookback_days, self._objective, self._constraints, self._risk_free_rate, budget,
+                          self._min_periods, start - max(start - n_warm_up, 0)]
+                         for start, end in segments_bounds]
+        if processes is None:
+            segments_weights = [_walk_forward_segment(*args) for args in segments_args]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                segments_weights = list(executor.map(_walk_forward_segment, *zip(*segments_args)))
+
+        self._weights = pd.DataFrame(np.vstack(segments_weights), index=self._rebalance_dates, columns=self._isins)
+        return self._weights
+
+    @property
+    def rebalance_dates(self):
+        return self._rebalance_dates
+
+    @property
+    def returns_panel(self):
+        return self._returns_panel
+
+    @property
+    def weights(self):
+        return self._weights
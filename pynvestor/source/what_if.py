@@ -0,0 +1,289 @@
+import copy
+import datetime as dt
+import threading
+import numpy as np
+import pandas as pd
+
+from typing import Dict, List
+
+from pynvestor import logger
+from pynvestor.models.transaction import TRANSACTION_TAX_RATE
+from pynvestor.source.covariance import load_covariance_source
+from pynvestor.source.helpers import Helpers
+from pynvestor.source.portfolio import Portfolio
+from pynvestor.source.risk import PortfolioRiskManager
+
+_simulators = {}
+_simulators_lock = threading.Lock()
+
+
+class WhatIfSimulator:
+    """
+    Score hypothetical trades on an in-memory snapshot of a PortfolioRiskManager. The covariance matrix and the
+    historical scenarios of the risk manager are reused: a trade only updates the terms of the assets it touches.
+    An asset not held is added with a zero quantity, its prices are read on the dates of the risk manager and its
+    covariances come from the covariance source of the risk manager when the source has them
+    """
+    def __init__(self, risk_manager: PortfolioRiskManager, risk_free_rate: float, helpers: Helpers = None):
+        """
+        :param risk_manager: PortfolioRiskManager computed with the historical value at risk method
+        :param risk_free_rate: float
+        :param helpers: Helpers object reading the prices of the assets not held, created if None
+        """
+        holdings = risk_manager.holdings
+        self._helpers = helpers
+        self._lock = threading.RLock()
+        self._prices_panel = risk_manager.prices_panel
+        self._returns_panel = risk_manager.returns_panel
+        self._risk_free_rate = risk_free_rate
+        self._percentile = risk_manager.percentile
+        self._isins = holdings.isins
+        self._index = {isin: loc for loc, isin in enumerate(self._isins)}
+        self._prices = holdings.price.copy()
+        self._covariance_matrix = risk_manager.covariance_matrix
+        self._covariance_source = risk_manager.covariance_source
+        self._annualized_mean_returns = risk_manager.annualized_mean_returns
+        self._price_changes = risk_manager.histo_price_changes
+
+        self._quantities = holdings.quantity.copy()
+        self._market_values = self._quantities * self._prices
+        self._cash = risk_manager.cash
+        self._covariance_market_values = self._covariance_matrix.dot(self._market_values)
+        self._market_value_variance = self._market_values.dot(self._covariance_market_values)
+        self._expected_return_amount = self._market_values.dot(self._annualized_mean_returns)
+        self._scenarios_pnl = self._price_changes.dot(self._quantities)
+
+    @staticmethod
+    def cached(account_id: str = None, risk_free_rate: float = 0.01, covariance: str = 'ewma') -> 'WhatIfSimulator':
+        """
+        get a simulator built on the cached portfolio snapshot of an account, the simulator is rebuilt when the
+        portfolio snapshot is reloaded
+        :param account_id: id of the account
+        :param risk_free_rate: float
+        :param covariance: name of the covariance source (see load_covariance_source)
+        :return: WhatIfSimulator object shared between callers, only score trades with it
+        """
+        snapshot = Portfolio.cached(account_id=account_id)
+        key = (account_id, risk_free_rate, covariance)
+        with _simulators_lock:
+            simulator, simulator_snapshot = _simulators.get(key, (None, None))
+            if simulator_snapshot is not snapshot:
+                risk_manager = PortfolioRiskManager(risk_free_rate, snapshot=snapshot,
+                                                    covariance_source=load_covariance_source(covariance))
+                simulator = WhatIfSimulator(risk_manager, risk_free_rate)
+                _simulators[key] = (simulator, snapshot)
+        return simulator
+
+    def _get_new_covariances(self, isins: List[str], returns_panel: pd.DataFrame) -> np.ndarray:
+        """
+        annualized covariances of new assets with all the assets, from the covariance source of the risk manager if
+        it observed them, from the pairwise sample covariance of the returns otherwise
+        :param isins: isins not in the simulator
+        :param returns_panel: daily returns of the assets of the simulator followed by the new assets
+        :return: all-assets-by-new-assets array
+        """
+        n_assets = len(self._isins)
+        if self._covariance_source is not None:
+            try:
+                new_covariances = self._covariance_source.get_covariance(self._isins.tolist() + isins)[:, n_assets:]
+                if np.isfinite(new_covariances).all():
+                    return new_covariances * 252
+                logger.log.warning(f'{isins}: not observed in the {self._covariance_source.name} covariance, '
+                                   f'falling back to the sample covariance')
+            except KeyError as key_error:
+                logger.log.warning(f'{key_error}, falling back to the sample covariance')
+        return returns_panel.cov().values[:, n_assets:] * 252
+
+    def _add_isins(self, isins: List[str]):
+        """
+        Add assets not held with a zero quantity: their price changes on the dates of the historical scenarios, their
+        covariances with the other assets, and their mean returns. Covariances of different estimators spliced
+        together may be indefinite, the negative eigenvalues are then clipped
+        :param isins: isins not in the simulator
+        :return:
+        """
+        dates = self._prices_panel.index
+        helpers = self._helpers or Helpers()
+        prices_panel = helpers.get_prices_panel(isins, start_date=dates[0].to_pydatetime(),
+                                                end_date=dates[-1].to_pydatetime() + dt.timedelta(days=1))
+        prices_panel = prices_panel.reindex(index=dates, columns=isins).ffill()
+        missing_isins = [isin for isin in isins if prices_panel[isin].isna().all()]
+        if missing_isins:
+            raise KeyError(f'{missing_isins}: no prices in mongo, no risk data available')
+
+        returns_panel = prices_panel.pct_change(fill_method=None).iloc[1:]
+        returns_panel = pd.concat([self._returns_panel, returns_panel], axis=1)
+        n_assets, n_new_assets = len(self._isins), len(isins)
+        new_covariances = self._get_new_covariances(isins, returns_panel)
+
+        covariance_matrix = np.zeros((n_assets + n_new_assets, n_assets + n_new_assets))
+        covariance_matrix[:n_assets, :n_assets] = self._covariance_matrix
+        covariance_matrix[:, n_assets:] = new_covariances
+        covariance_matrix[n_assets:, :n_assets] = new_covariances[:n_assets].T
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
+        if eigenvalues[0] < -1e-10 * max(eigenvalues[-1], 0.0):
+            logger.log.warning(f'{isins}: indefinite covariance matrix, negative eigenvalues clipped')
+            covariance_matrix = (eigenvectors * np.clip(eigenvalues, 0.0, None)).dot(eigenvectors.T)
+        self._annualized_mean_returns = np.append(self._annualized_mean_returns,
+                                                  (1 + returns_panel.iloc[:, n_assets:].mean().values) ** 252 - 1)
+        self._price_changes = np.hstack([self._price_changes, prices_panel.diff().iloc[1:].fillna(0.0).values])
+        self._prices = np.append(self._prices, prices_panel.iloc[-1].values)
+        self._quantities = np.append(self._quantities, np.zeros(n_new_assets))
+        self._market_values = np.append(self._market_values, np.zeros(n_new_assets))
+        self._covariance_matrix = covariance_matrix
+        self._covariance_market_values = covariance_matrix.dot(self._market_values)
+        self._market_value_variance = self._market_values.dot(self._covariance_market_values)
+        self._prices_panel = pd.concat([self._prices_panel, prices_panel], axis=1)
+        self._returns_panel = returns_panel
+        self._isins = np.append(self._isins, isins)
+        self._index.update({isin: n_assets + loc for loc, isin in enumerate(isins)})
+        return True
+
+    def _get_new_isins(self, trades: List[Dict]) -> List[str]:
+        return list(dict.fromkeys(trade['isin'] for trade in trades if trade['isin'] not in self._index))
+
+    def _extend(self, isins: List[str]) -> 'WhatIfSimulator':
+        """
+        temporary copy of the simulator with new assets, the arrays of the simulator are not modified
+        :param isins: isins not in the simulator
+        :return: WhatIfSimulator object
+        """
+        simulator = copy.copy(self)
+        simulator._index = dict(self._index)
+        simulator._add_isins(isins)
+        return simulator
+
+    def _get_trades_deltas(self, trades: List[Dict]):
+        """
+        aggregate trades per asset
+        :param trades: list of trades {'isin': str, 'quantity': float, 'price': float, 'fee': float}, the price
+        defaults to the last price and the fee to 0
+        :return: positions of the assets traded, quantity changes, market value changes and cash change
+        """
+        deltas = {}
+        cash_change = 0.0
+        for trade in trades:
+            loc = self._index[trade['isin']]
+            quantity = trade['quantity']
+            price = trade.get('price') or self._prices[loc]
+            gross_amount = quantity * price
+            transaction_tax = TRANSACTION_TAX_RATE * gross_amount if quantity > 0 else 0.0
+            cash_change -= gross_amount + transaction_tax + trade.get('fee', 0.0)
+            deltas[loc] = deltas.get(loc, 0.0) + quantity
+
+        locs = np.array(list(deltas.keys()), dtype=int)
+        quantity_changes = np.array(list(deltas.values()), dtype=np.float64)
+        return locs, quantity_changes, quantity_changes * self._prices[locs], cash_change
+
+    def _get_value_at_risk(self, scenarios_pnl: np.ndarray) -> float:
+        """
+        historical value at risk from the simulated portfolio changes, selected in linear time
+        :param scenarios_pnl: simulated portfolio changes
+        :return: float
+        """
+        losses = scenarios_pnl * -1
+        percentile_loc = int(round(self._percentile / 100 * len(losses), 0))
+        return np.partition(losses, len(losses) - percentile_loc)[len(losses) - percentile_loc]
+
+    def _get_metrics(self, market_values_total, market_value_variance, expected_return_amount, scenarios_pnl,
+                     weights=None):
+        volatility = np.sqrt(market_value_variance) / market_values_total
+        expected_return = expected_return_amount / market_values_total
+        return {'portfolio_market_value': market_values_total,
+                'weights': weights,
+                'annualized_portfolio_volatility': volatility,
+                'portfolio_sharpe_ratio': Helpers.compute_sharpe_ratio(expected_return, volatility,
+                                                                       self._risk_free_rate),
+                'portfolio_value_at_risk': self._get_value_at_risk(scenarios_pnl)}
+
+    def score(self, trades: List[Dict], with_weights: bool = False) -> Dict:
+        """
+        compute the risk metrics of the portfolio after hypothetical trades, the simulator is not modified: assets
+        not held are scored on a temporary extension of it
+        :param trades: list of trades {'isin': str, 'quantity': float, 'price': float, 'fee': float}
+        :param with_weights: also return the stocks weights after the trades
+        :return: dictionary of metrics
+        """
+        with self._lock:
+            return self._score(trades, with_weights)
+
+    def _score(self, trades: List[Dict], with_weights: bool = False) -> Dict:
+        new_isins = self._get_new_isins(trades)
+        if new_isins:
+            return self._extend(new_isins)._score(trades, with_weights)
+
+        locs, quantity_changes, market_value_changes, cash_change = self._get_trades_deltas(trades)
+
+        market_values_total = self._cash + cash_change + self._market_values.sum() + market_value_changes.sum()
+        market_value_variance = (self._market_value_variance
+                                 + 2 * market_value_changes.dot(self._covariance_market_values[locs])
+                                 + market_value_changes.dot(self._covariance_matrix[np.ix_(locs, locs)])
+                                 .dot(market_value_changes))
+        expected_return_amount = (self._expected_return_amount
+                                  + market_value_changes.dot(self._annualized_mean_returns[locs]))
+        scenarios_pnl = self._scenarios_pnl + self._price_changes[:, locs].dot(quantity_changes)
+
+        weights = None
+        if with_weights:
+            market_values = self._market_values.copy()
+            market_values[locs] += market_value_changes
+            weights = dict(zip(self._isins.tolist(), (market_values / market_values_total).tolist()))
+
+        return self._get_metrics(market_values_total, market_value_variance, expected_return_amount,
+                                 scenarios_pnl, weights)
+
+    def score_many(self, candidates: List[List[Dict]]) -> List[Dict]:
+        """
+        score several candidate sets of trades independently
+        :param candidates: list of lists of trades
+        :return: list of dictionaries of metrics
+        """
+        return [self.score(trades) for trades in candidates]
+
+    def apply(self, trades: List[Dict]) -> Dict:
+        """
+        apply hypothetical trades to the simulator state, following scores are computed from the new state, the
+        assets not held are added to the simulator
+        :param trades: list of trades {'isin': str, 'quantity': float, 'price': float, 'fee': float}
+        :return: dictionary of metrics after the trades
+        """
+        with self._lock:
+            return self._apply(trades)
+
+    def _apply(self, trades: List[Dict]) -> Dict:
+        new_isins = self._get_new_isins(trades)
+        if new_isins:
+            self._add_isins(new_isins)
+
+        locs, quantity_changes, market_value_changes, cash_change = self._get_trades_deltas(trades)
+
+        self._market_value_variance += (2 * market_value_changes.dot(self._covariance_market_values[locs])
+                                        + market_value_changes.dot(self._covariance_matrix[np.ix_(locs, locs)])
+                                        .dot(market_value_changes))
+        self._covariance_market_values += self._covariance_matrix[:, locs].dot(market_value_changes)
+        self._expected_return_amount += market_value_changes.dot(self._annualized_mean_returns[locs])
+        self._scenarios_pnl += self._price_changes[:, locs].dot(quantity_changes)
+        self._quantities[locs] += quantity_changes
+        self._market_values[locs] += market_value_changes
+        self._cash += cash_change
+
+        return self._get_current_metrics()
+
+    @property
+    def metrics(self) -> Dict:
+        with self._lock:
+            return self._get_current_metrics()
+
+    def _get_current_metrics(self) -> Dict:
+        market_values_total = self._cash + self._market_values.sum()
+        weights = dict(zip(self._isins.tolist(), (self._market_values / market_values_total).tolist()))
+        return self._get_metrics(market_values_total, self._market_value_variance, self._expected_return_amount,
+                                 self._scenarios_pnl, weights)
+
+    @property
+    def quantities(self):
+        return dict(zip(self._isins.tolist(), self._quantities.tolist()))
+
+    @property
+    def cash(self):
+        return self._cash
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from ..source.helpers import Helpers
+
+
+class PanelHelpers:
+    """
+    Helpers reading the quotes from in-memory panels instead of mongo, with the signatures of Helpers
+    """
+    align_prices = staticmethod(Helpers.align_prices)
+
+    def __init__(self, prices_panel: pd.DataFrame, volumes_panel: pd.DataFrame = None):
+        """
+        :param prices_panel: dataframe of prices indexed by date with one column per isin
+        :param volumes_panel: dataframe of volumes indexed by date with one column per isin
+        """
+        self._panels = {'price': prices_panel, 'volume': volumes_panel}
+
+    def get_prices_panel(self, isins, start_date=None, end_date=None, window=None, field='price'):
+        panel = self._panels[field].reindex(columns=list(isins))
+        if start_date is not None:
+            panel = panel[panel.index >= start_date]
+        if end_date is not None:
+            panel = panel[panel.index < end_date]
+        return panel.iloc[-window:] if window is not None else panel
+
+    def get_last_prices(self, isins, as_of_date=None, field='price', lookback_days=30):
+        panel = self._panels[field].reindex(columns=list(isins))
+        if as_of_date is not None:
+            panel = panel[panel.index <= as_of_date]
+        return panel.ffill().iloc[-1]
+
+
+@pytest.fixture
+def panel_helpers():
+    """
+    build the Helpers of the tests from their prices and volumes panels
+    """
+    return PanelHelpers
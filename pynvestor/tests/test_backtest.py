@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from ..models.transaction import TRANSACTION_TAX_RATE
+from ..source.backtest import PortfolioBacktest
+
+
+def test_portfolio_backtest():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', '2020-12-31')
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0, 0.01, (len(dates), 3)), axis=0), index=dates,
+                                columns=['ISIN0', 'ISIN1', 'ISIN2'])
+    buy_and_hold = pd.DataFrame([[0.5, 0.5, 0.0]], index=dates[:1], columns=prices_panel.columns)
+    rebalance_dates = dates[::20]
+    monthly = pd.DataFrame(np.tile([1 / 3, 1 / 3, 1 / 3], (len(rebalance_dates), 1)), index=rebalance_dates,
+                           columns=prices_panel.columns)
+
+    backtest = PortfolioBacktest({'buy_and_hold': buy_and_hold, 'monthly': monthly}, initial_capital=1000.0,
+                                 fee=1.0, prices_panel=prices_panel)
+    invested = (1000.0 - 2.0) / (1 + TRANSACTION_TAX_RATE)
+    quantities = 0.5 * invested / prices_panel.iloc[0, :2]
+    expected_navs = prices_panel.iloc[:, :2].dot(quantities) + 1000.0 - 2.0 - invested * (1 + TRANSACTION_TAX_RATE)
+    assert np.allclose(backtest.navs['buy_and_hold'], expected_navs, rtol=1e-6)
+    assert np.allclose(backtest.costs['buy_and_hold'].sum(), 1000.0 - invested, rtol=1e-6)
+
+    holdings = backtest.holdings['monthly']
+    assert np.allclose((holdings * prices_panel.loc[rebalance_dates]).std(axis=1), 0.0)
+    assert (backtest.turnover['monthly'].iloc[1:] > 0).all() and backtest.statistics.loc['monthly', 'total_costs'] > 3
@@ -0,0 +1,42 @@
+import datetime as dt
+
+from ..source.cache import SnapshotCache
+
+
+def test_snapshot_cache():
+    loaded_dates = []
+
+    def loader(portfolio_date, account_id):
+        loaded_dates.append(portfolio_date)
+        return object()
+
+    past_date = dt.datetime(2020, 10, 29)
+    cache = SnapshotCache(live_ttl=0.0)
+
+    past_snapshot = cache.get(past_date, loader)
+    live_snapshot = cache.get(None, loader)
+    assert cache.get(past_date, loader) is past_snapshot
+    assert cache.get(None, loader) is not live_snapshot  # live snapshot expired
+    assert loaded_dates == [past_date, None, None]
+
+    cache.invalidate(from_date=dt.datetime(2020, 10, 30))
+    assert cache.get(past_date, loader) is past_snapshot
+    cache.invalidate(from_date=past_date)
+    assert cache.get(past_date, loader) is not past_snapshot
+    assert len(cache) == 1
+
+    other_account_snapshot = cache.get(past_date, loader, account_id='ACCOUNT_2')
+    assert other_account_snapshot is not cache.get(past_date, loader)
+    cache.invalidate(account_ids=['ACCOUNT_2'])
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_snapshot_cache_key_locks_bounded():
+    cache = SnapshotCache(n_key_locks=4)
+    for day in range(1, 29):
+        cache.get(dt.datetime(2020, 2, day), lambda portfolio_date, account_id: object())
+    cache.invalidate()
+    assert len(cache) == 0
+    assert len(cache._key_locks) == 4
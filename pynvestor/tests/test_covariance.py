@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from ..source.covariance import EwmaCovariance, RollingCovariance, UniverseCovariance, FactorRiskModel
+
+
+def _get_returns_panel():
+    generator = np.random.default_rng(0)
+    returns = pd.DataFrame(generator.normal(0, 0.01, (60, 3)), columns=['A', 'B', 'C'],
+                           index=pd.bdate_range('2021-01-01', periods=60))
+    returns.iloc[5:9, 1] = np.nan
+    return returns
+
+
+def test_rolling_covariance(tmp_path):
+    returns = _get_returns_panel()
+    state = RollingCovariance(['A', 'B'], window=20)
+    state.update_from_returns(returns.iloc[:30])
+    state.save(tmp_path)
+
+    state = RollingCovariance.load(tmp_path)
+    state.reindex(['A', 'B', 'C'])
+    state.update_from_returns(returns)
+
+    expected = returns.iloc[-20:][['C', 'A']].cov().values
+    assert np.allclose(state.get_covariance(['C', 'A']), expected)
+
+
+def test_ewma_covariance(tmp_path):
+    returns = _get_returns_panel()
+    state = EwmaCovariance(['A', 'B', 'C'], decay=0.94)
+    state.update_from_returns(returns)
+    state.save(tmp_path)
+
+    state = EwmaCovariance.load(tmp_path, mmap_mode='r')
+    cross_products = returns['A'] * returns['B']
+    expected = cross_products.ewm(alpha=0.06).mean().iloc[-1]
+    assert np.isclose(state.get_covariance(['A', 'B'])[0, 1], expected)
+
+    # saving a new state does not modify the files memory-mapped by the readers
+    EwmaCovariance(['A', 'B', 'C'], decay=0.94).save(tmp_path)
+    assert np.isclose(state.get_covariance(['A', 'B'])[0, 1], expected)
+    assert sorted(path.name for path in (tmp_path / 'ewma').iterdir()) == ['cross_products.npy', 'metadata.json',
+                                                                           'weights.npy']
+
+
+def test_universe_covariance(tmp_path):
+    returns = _get_returns_panel()
+    universe_covariance = UniverseCovariance.compute(returns, tmp_path, block_size=2, shrinkage=False)
+    assert np.allclose(universe_covariance.get_covariance(['C', 'B']), returns[['C', 'B']].cov().values)
+
+    previous_covariance = universe_covariance
+    universe_covariance = UniverseCovariance.compute(returns, tmp_path, block_size=2, processes=2)
+    shrunk_covariance = universe_covariance.get_covariance(['A', 'B', 'C'])
+    # the readers of the previous matrix are not affected by the new computation
+    assert np.allclose(previous_covariance.get_covariance(['C', 'B']), returns[['C', 'B']].cov().values)
+    assert 0 < universe_covariance.shrinkage <= 1
+    assert np.allclose(np.diag(shrunk_covariance), returns.var().values)
+    assert np.allclose(shrunk_covariance[0, 2], returns.cov().values[0, 2] * (1 - universe_covariance.shrinkage))
+
+
+def test_factor_risk_model(tmp_path):
+    returns = _get_returns_panel()
+    model = FactorRiskModel.fit(returns, n_factors=1, sectors={'A': 'Energy', 'B': 'Energy', 'C': 'Utilities'})
+    model.save(tmp_path)
+    model = FactorRiskModel.load(tmp_path)
+    assert model.factors == ['Energy', 'Utilities', 'PC1']
+
+    isins = ['C', 'A']
+    weights = np.array([0.3, 0.5])
+    variance = weights.dot(model.get_covariance(isins)).dot(weights)
+    assert np.isclose(model.portfolio_variance(weights, isins), variance)
+    assert np.isclose(model.component_risk(weights, isins).sum(), np.sqrt(variance))
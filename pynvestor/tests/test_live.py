@@ -0,0 +1,61 @@
+import numpy as np
+
+from ..models.holdings import Holdings
+from ..models.position import Position
+from ..source.live import LiveValuation
+
+
+class PortfolioSnapshot:
+    def __init__(self, isins, quantities, prices, previous_prices, open_prices, perfs_since_last_close, cash):
+        self.holdings = Holdings(isins, quantities)
+        self.holdings.price = prices
+        self.holdings.previous_price = previous_prices
+        self.holdings.open_price = open_prices
+        self.holdings.perf_since_last_close = perfs_since_last_close
+        self.holdings.perf_since_open = self.holdings.price / self.holdings.open_price - 1
+        self.holdings.market_value = self.holdings.quantity * self.holdings.price
+        self.holdings.previous_market_value = self.holdings.quantity * self.holdings.previous_price
+        self.holdings.weight = self.holdings.market_value / (cash + self.holdings.market_value.sum())
+        self.positions = [Position('EQUITY', quantity, isin, 'XPAR') for isin, quantity in zip(isins, quantities)]
+        self.cash = cash
+
+
+def _session(price, open_price, perf_since_last_close=None):
+    perfs = [{'perType': 'D', 'var': str(perf_since_last_close)}] if perf_since_last_close is not None else []
+    return {'perf': [{'perType': 'Y', 'var': '0.3'}] + perfs,
+            'currInstrSess': {'lastPx': str(price), 'openPx': str(open_price)}}
+
+
+def test_live_valuation():
+    rng = np.random.default_rng(0)
+    isins = [f'ISIN{i}' for i in range(6)]
+    quantities = rng.integers(1, 100, len(isins))
+    previous_prices = rng.uniform(10.0, 100.0, len(isins))
+    open_prices = previous_prices * rng.uniform(0.98, 1.02, len(isins))
+    prices = open_prices * rng.uniform(0.98, 1.02, len(isins))
+    valuation = LiveValuation(PortfolioSnapshot(isins, quantities, prices, previous_prices, open_prices,
+                                                prices / previous_prices - 1, cash=500.0))
+
+    for _ in range(5):
+        moved = rng.choice(len(isins), 3, replace=False)
+        prices[moved] *= rng.uniform(0.98, 1.02, len(moved))
+        perfs = prices / previous_prices - 1
+        perfs[moved[0]] = np.nan  # missing performance since last close in the session data
+        delta = valuation.update({isins[loc]: _session(prices[loc], open_prices[loc],
+                                                       None if np.isnan(perfs[loc]) else perfs[loc])
+                                  for loc in moved})
+        assert sorted(delta['lines']) == sorted(isins[loc] for loc in moved)
+
+        # full revaluation of the current prices
+        expected = LiveValuation(PortfolioSnapshot(isins, quantities, prices, previous_prices, open_prices,
+                                                   np.where(np.isnan(valuation.holdings.perf_since_last_close), np.nan,
+                                                            perfs), cash=500.0)).state()
+        state = valuation.state()
+        for metric in ('portfolio_market_value', 'portfolio_perf', 'cash_weight'):
+            assert np.isclose(state[metric], expected[metric])
+        assert np.allclose(list(state['weights'].values()), list(expected['weights'].values()))
+        for isin, line in state['lines'].items():
+            assert np.allclose(list(line.values()), list(expected['lines'][isin].values()), equal_nan=True)
+
+    assert valuation.update({isin: _session(price, open_price) for isin, price, open_price in
+                             zip(isins, prices, open_prices)}) is None  # no price moved
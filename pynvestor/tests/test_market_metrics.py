@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from ..source.market_metrics import compute_market_metrics
+
+
+def test_compute_market_metrics():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', periods=300)
+    index_returns = rng.normal(0.0, 0.01, len(dates))
+    returns = 1.5 * index_returns[:, None] + rng.normal(0.0, 0.01, (len(dates), 3))
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + np.column_stack([returns, index_returns]), axis=0), index=dates,
+                                columns=['ISIN0', 'ISIN1', 'ISIN2', 'INDEX'])
+    prices_panel.iloc[:250, 2] = np.nan  # listed recently
+    prices_panel.iloc[100, 1] = np.nan  # missing quote
+    volumes_panel = pd.DataFrame(rng.integers(1000, 2000, prices_panel.shape), index=dates,
+                                 columns=prices_panel.columns)
+
+    metrics = compute_market_metrics(prices_panel, volumes_panel, reference_isin='INDEX', lookback_days=252)
+    window_returns = prices_panel.pct_change(fill_method=None).iloc[-252:]
+    expected_betas = window_returns.cov()['INDEX'] / window_returns['INDEX'].var()
+    assert np.allclose(metrics.loc[['ISIN0', 'ISIN1'], 'beta'], expected_betas[['ISIN0', 'ISIN1']], rtol=1e-2)
+    assert np.allclose(metrics['volatility'], window_returns.std().iloc[:3] * np.sqrt(252))
+
+    window_prices = prices_panel['ISIN0'].iloc[-253:]
+    assert np.isclose(metrics.loc['ISIN0', 'max_drawdown'], (window_prices / window_prices.cummax() - 1).min())
+    assert np.isclose(metrics.loc['ISIN0', 'momentum_3m'], window_prices.iloc[-1] / window_prices.iloc[-64] - 1)
+    assert np.isnan(metrics.loc['ISIN2', 'momentum_3m']) and not np.isnan(metrics.loc['ISIN2', 'momentum_1m'])
+    assert np.allclose(metrics['average_volume'], volumes_panel.iloc[-63:, :3].mean())
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from scipy import optimize
+
+from ..models.holdings import Holdings
+from ..source import optimizer
+from ..source.optimizer import Optimizer, _solve_long_only_minimum_variance
+
+
+def test_long_only_minimum_variance():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0, 0.01, (300, 12)) * rng.uniform(0.5, 3.0, 12) + \
+        rng.normal(0.0, 0.01, (300, 1)) * rng.uniform(-1.0, 2.0, 12)
+    covariance_matrix = np.cov(returns, rowvar=False) * 252
+    budget = 0.9
+
+    weights = _solve_long_only_minimum_variance(covariance_matrix, budget)
+    result = optimize.minimize(lambda w: w.dot(covariance_matrix).dot(w), np.full(12, budget / 12),
+                               method='SLSQP', bounds=[(0.0, 1.0)] * 12,
+                               constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - budget}],
+                               options={'ftol': 1e-14})
+    assert weights.min() >= 0 and np.isclose(weights.sum(), budget)
+    assert weights.dot(covariance_matrix).dot(weights) <= result.fun * (1 + 1e-6)
+    assert (weights == 0).any()
+
+
+def test_long_only_minimum_variance_singular_covariance():
+    # fewer dates than assets, the covariance matrix is singular
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0, 0.01, (3, 18)) * rng.uniform(0.5, 3.0, 18) + \
+        rng.normal(0.0, 0.01, (3, 1)) * rng.uniform(-1.0, 2.0, 18)
+    covariance_matrix = np.cov(returns, rowvar=False) * 252
+
+    weights = _solve_long_only_minimum_variance(covariance_matrix, 1.0)
+    assert weights.min() >= 0 and np.isclose(weights.sum(), 1.0)
+    assert weights.dot(covariance_matrix).dot(weights) <= np.diag(covariance_matrix).min() + 1e-12
+
+
+def test_resampled_efficient_frontier(monkeypatch):
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0005, 0.01, (250, 6)) * rng.uniform(0.5, 2.0, 6) + rng.normal(0.0, 0.01, (250, 1))
+    resampled_optimizer = Optimizer.__new__(Optimizer)
+    resampled_optimizer._holdings = Holdings([f'ISIN{i}' for i in range(6)], np.ones(6))
+    resampled_optimizer._returns_panel = pd.DataFrame(returns)
+    resampled_optimizer._mean_returns = returns.mean(axis=0)
+    resampled_optimizer._covariance_matrix = np.cov(returns, rowvar=False) * 252
+    resampled_optimizer._cash_weight = 0.1
+
+    # the samples whose frontier raises a solver error are left out of the average
+    trace_frontier_segment = optimizer._trace_frontier_segment
+    n_calls = []
+
+    def failing_trace_frontier_segment(*args):
+        n_calls.append(1)
+        if len(n_calls) % 3 == 0:
+            raise np.linalg.LinAlgError('singular matrix')
+        return trace_frontier_segment(*args)
+
+    monkeypatch.setattr(optimizer, '_trace_frontier_segment', failing_trace_frontier_segment)
+    weights, variances, expected_returns = resampled_optimizer.resampled_efficient_frontier(n_samples=12, n_points=5,
+                                                                                            seed=0, chunk_size=4)
+    assert len(n_calls) == 12 and len(weights) == 5
+    assert np.allclose(np.sum(weights, axis=1), 0.9)
+
+    # the frontier is read from the cache until the returns change
+    frontier = resampled_optimizer.resampled_efficient_frontier(n_samples=12, n_points=5, seed=0, chunk_size=4)
+    assert len(n_calls) == 12 and np.allclose(frontier[0], weights)
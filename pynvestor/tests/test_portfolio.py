@@ -0,0 +1,141 @@
+import datetime as dt
+import pandas as pd
+
+from ..models.asset_type import AssetType
+from ..models.holdings import Holdings
+from ..source import portfolio
+from ..source.cache import SnapshotCache
+from ..source.portfolio import Portfolio
+
+
+def test_stocks_quantities():
+    portfolio = Portfolio.__new__(Portfolio)
+    portfolio._holdings = Holdings(['ISIN0', 'ISIN1'], [100, 25])
+    quantities = portfolio.stocks_quantities
+    assert quantities == {'ISIN0': 100, 'ISIN1': 25}
+    assert all(isinstance(quantity, int) for quantity in quantities.values())
+
+
+class FakeMongo:
+    """
+    in-memory collections answering the queries of the portfolio, a missing field matches a None value like in mongo
+    """
+    def __init__(self, collections):
+        self.collections = collections
+        self.queries = []
+
+    @staticmethod
+    def _matches(document, query):
+        for field, condition in query.items():
+            value = document.get(field)
+            if '$in' in condition and value not in condition['$in']:
+                return False
+            if '$lte' in condition and not value <= condition['$lte']:
+                return False
+        return True
+
+    def find_documents(self, database_name, collection_name, projection=None, sort=None, limit=0, **fields):
+        self.queries.append(collection_name)
+        documents = [document for document in self.collections[collection_name] if self._matches(document, fields)]
+        for field, direction in sort or []:
+            documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return iter(documents)
+
+    def aggregate_documents(self, database_name, collection_name, pipeline):
+        self.queries.append(collection_name)
+        match, group = pipeline[0]['$match'], pipeline[1]['$group']
+        results = {}
+        for document in self.collections[collection_name]:
+            if not self._matches(document, match):
+                continue
+            key = {name: document[field[1:]] for name, field in group['_id'].items() if field[1:] in document}
+            result = results.setdefault(tuple(sorted(key.items())), {'_id': key, 'quantity': 0.0, 'net_cashflow': 0.0})
+            result['quantity'] += document.get('quantity') or 0.0
+            result['net_cashflow'] += document['net_cashflow']
+        return iter(results.values())
+
+    def insert_documents(self, database_name, collection_name, documents):
+        self.collections[collection_name].extend(documents)
+
+
+class FakeEuronext:
+    def __init__(self, prices):
+        self._prices = prices
+
+    def get_instruments_details(self, isins_mics):
+        return [{isin: {'longNm': isin, 'perf': [{'perType': 'D', 'var': '0.01'}],
+                        'currInstrSess': {'lastPx': str(self._prices[isin]), 'openPx': '10.0'},
+                        'prevInstrSess': {'lastPx': '9.0'}}} for isin, mic in isins_mics]
+
+
+def _trade(isin, quantity, price, date, account_id=None):
+    trade = {'isin': isin, 'mic': 'XPAR', 'quantity': quantity, 'price': price, 'net_cashflow': -quantity * price,
+             'transaction_type': 'BUY' if quantity > 0 else 'SELL', 'transaction_date': date}
+    if account_id is not None:
+        trade['account_id'] = account_id
+    return trade
+
+
+def _set_accounts(monkeypatch, panel_helpers):
+    date = dt.datetime(2020, 1, 6)
+    transactions = [{'net_cashflow': 10000.0, 'transaction_type': 'DEPOSIT', 'transaction_date': date},
+                    _trade('ISIN0', 100, 10.0, date),
+                    _trade('ISIN1', 50, 20.0, date + dt.timedelta(days=1)),
+                    {'net_cashflow': 5000.0, 'transaction_type': 'DEPOSIT', 'transaction_date': date,
+                     'account_id': 'ACCOUNT_2'},
+                    _trade('ISIN1', 30, 18.0, date, 'ACCOUNT_2'),
+                    _trade('ISIN1', -10, 19.0, date + dt.timedelta(days=2), 'ACCOUNT_2'),
+                    _trade('ISIN2', 20, 40.0, date + dt.timedelta(days=3), 'ACCOUNT_2')]
+    asset_values = [{'date': date, 'assets': 10000.0, 'cashflows': 10000.0, 'shares': 100.0},
+                    {'date': date, 'assets': 5000.0, 'cashflows': 5000.0, 'shares': 50.0, 'account_id': 'ACCOUNT_2'}]
+    fake_mongo = FakeMongo({'transactions': transactions, 'net_asset_values': asset_values})
+    monkeypatch.setattr(portfolio, 'mongo', fake_mongo)
+    prices = {'ISIN0': 12.0, 'ISIN1': 21.0, 'ISIN2': 38.0}
+    monkeypatch.setattr(portfolio, 'euronext', FakeEuronext(prices))
+    monkeypatch.setattr(portfolio, 'Helpers', lambda: panel_helpers(pd.DataFrame(prices, index=[date])))
+    monkeypatch.setattr(portfolio, 'snapshot_cache', SnapshotCache())
+    return fake_mongo
+
+
+def test_get_positions_as_of(monkeypatch, panel_helpers):
+    _set_accounts(monkeypatch, panel_helpers)
+    positions = Portfolio.get_positions_as_of([None, 'ACCOUNT_2', 'ACCOUNT_3'], dt.datetime(2020, 1, 8))
+
+    # documents without account id belong to the None account
+    assert {(position.isin, position.quantity) for position in positions[None]} == {('ISIN0', 100), ('ISIN1', 50),
+                                                                                   (None, 8000.0)}
+    assert positions[None][-1].asset_type is AssetType.CASH
+    assert [(position.isin, position.quantity) for position in positions['ACCOUNT_2']] == [('ISIN1', 20),
+                                                                                          (None, 4650.0)]
+    assert [position.quantity for position in positions['ACCOUNT_3']] == [0.0]
+
+
+def test_value_portfolios(monkeypatch, panel_helpers):
+    fake_mongo = _set_accounts(monkeypatch, panel_helpers)
+    portfolios = Portfolio.value_portfolios([None, 'ACCOUNT_2'])
+    assert fake_mongo.queries == ['transactions', 'transactions', 'net_asset_values']
+
+    for account_id, batch_portfolio in portfolios.items():
+        single_portfolio = Portfolio(account_id=account_id)
+        assert batch_portfolio.account_id == account_id
+        assert batch_portfolio.stocks_quantities == single_portfolio.stocks_quantities
+        assert batch_portfolio.cash == single_portfolio.cash
+        assert batch_portfolio.to_df().equals(single_portfolio.to_df())
+    assert portfolios['ACCOUNT_2'].stocks_quantities == {'ISIN1': 20, 'ISIN2': 20}
+    assert portfolios[None].to_df().loc['ISIN1', 'pnl'] == 21.0 / 20.0 - 1
+
+
+def test_add_transaction_invalidation(monkeypatch, panel_helpers):
+    _set_accounts(monkeypatch, panel_helpers)
+    dates = [dt.datetime(2020, 1, day) for day in (6, 8, 10)]
+    snapshots = {(account_id, date): Portfolio.cached(date, account_id)
+                 for account_id in (None, 'ACCOUNT_2') for date in dates}
+
+    Portfolio.add_transaction([_trade('ISIN0', 10, 11.0, dt.datetime(2020, 1, 10)),
+                               _trade('ISIN2', 5, 39.0, dt.datetime(2020, 1, 8), 'ACCOUNT_2')])
+
+    # each account is invalidated from its own first inserted trade
+    for (account_id, date), snapshot in snapshots.items():
+        invalidated = date >= (dt.datetime(2020, 1, 10) if account_id is None else dt.datetime(2020, 1, 8))
+        assert (Portfolio.cached(date, account_id) is not snapshot) == invalidated
+    assert Portfolio.cached(dates[-1]).stocks_quantities['ISIN0'] == 110
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from ..models.holdings import Holdings
+from ..source.covariance import EwmaCovariance
+from ..source.portfolio import Portfolio
+from ..source.risk import PortfolioRiskManager
+
+
+def test_risk_manager_covariance_source_missing_observations(panel_helpers):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2019-01-01', periods=300)
+    isins = [f'ISIN{i}' for i in range(3)]
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0, 0.01, (len(dates), 3)), axis=0), index=dates,
+                                columns=isins)
+    covariance_source = EwmaCovariance(isins[:2])
+    covariance_source.update_from_returns(prices_panel.pct_change().iloc[1:])
+    covariance_source.reindex(isins)  # ISIN2 has no observations in the state yet
+
+    holdings = Holdings(isins, [10, 20, 30])
+    holdings.price = prices_panel.iloc[-1].values
+    holdings.market_value = holdings.quantity * holdings.price
+    holdings.weight = holdings.market_value / (1000.0 + holdings.market_value.sum())
+    snapshot = Portfolio.__new__(Portfolio)
+    snapshot._holdings = holdings
+    snapshot._cash = 1000.0
+    snapshot._nav_weekly_returns = pd.Series(rng.normal(0.0, 0.02, 50))
+    snapshot._helpers = panel_helpers(prices_panel)
+
+    risk_manager = PortfolioRiskManager(0.01, snapshot=snapshot, covariance_source=covariance_source)
+    assert risk_manager.covariance_source is None
+    assert np.allclose(risk_manager.covariance_matrix, prices_panel.iloc[-301:].pct_change().cov().values * 252)
+    assert np.isfinite(risk_manager.annualized_portfolio_volatility)
+    assert np.isfinite(risk_manager.portfolio_value_at_risk)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..source.screen_expression import ScreenExpression
+
+
+def test_screen_expression():
+    df = pd.DataFrame({'roe': [0.05, 0.12, 0.20, 0.30, np.nan],
+                       'per': [10.0, 25.0, 12.0, 8.0, 9.0],
+                       'eps': [1.0, 2.0, 3.0, 4.0, 5.0],
+                       'sector': ['Energy', 'Energy', 'Technology', 'Technology', 'Technology']})
+
+    screen_expression = ScreenExpression('roe > 0.1 and (0 < per < 15 or not eps * 10 < 25)')
+    assert screen_expression.metrics == ['roe', 'per', 'eps']
+    assert screen_expression.evaluate(df).tolist() == [False, False, True, True, False]
+
+    percentile = ScreenExpression('(percentile(roe, sector) == 1) & (sector != "Energy")').evaluate(df)
+    assert percentile.tolist() == [False, False, False, True, False]
+    assert ScreenExpression('rank(-per) <= 2').evaluate(df).tolist() == [False, False, False, True, True]
+
+    # a condition on a missing metric is unknown, its negation too
+    assert ScreenExpression('not (roe > 0.1)').evaluate(df).tolist() == [True, False, False, False, False]
+    assert ScreenExpression('roe > 0.1 or per < 10').evaluate(df).tolist() == [False, True, True, True, True]
+    assert ScreenExpression('9 ** 9 ** 9 > 0').evaluate(df).all()
+
+    for invalid_expression in ('roe >', '__import__("os")', 'roe.mean() > 0', 'roe + 1'):
+        with pytest.raises(ValueError):
+            ScreenExpression(invalid_expression).evaluate(df)
@@ -0,0 +1,44 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from ..models.indices import CAC_40_ISIN
+from ..source import screener
+from ..source.market_metrics import compute_market_metrics
+from ..source.ratios import ratios_columns
+
+
+def test_run_history(monkeypatch, panel_helpers):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2018-06-01', '2021-12-31')
+    prices_panel = pd.DataFrame({'FRA': np.linspace(10.0, 20.0, len(dates)), 'FRB': np.linspace(30.0, 10.0, len(dates)),
+                                 CAC_40_ISIN: 5000 * np.cumprod(1 + rng.normal(0.0, 0.01, len(dates)))}, index=dates)
+    volumes_panel = pd.DataFrame(1000.0, index=dates, columns=prices_panel.columns)
+    ratios = pd.DataFrame([{'ric': 'A.PA', 'period': 'annual', 'date': dt.datetime(2018, 12, 31), 'isin': 'FRA',
+                            'roe': 0.05, 'eps': 1.0},
+                           {'ric': 'A.PA', 'period': 'annual', 'date': dt.datetime(2019, 12, 31), 'isin': 'FRA',
+                            'roe': 0.2, 'eps': 2.0},
+                           {'ric': 'B.PA', 'period': 'annual', 'date': dt.datetime(2018, 12, 31), 'isin': 'FRB',
+                            'roe': 0.3, 'eps': 2.0}], columns=ratios_columns)
+    monkeypatch.setattr(screener, 'helpers', panel_helpers(prices_panel, volumes_panel))
+    monkeypatch.setattr(screener, 'get_ratios_history', lambda period: ratios)
+
+    screening_dates = [dt.datetime(2019 + month // 12, month % 12 + 1, 28) for month in range(30)]
+    screen = screener.Screener('roe > 0.1 and per < 12 and momentum_1m > 0', 'annual')
+    membership = screen.run_history(screening_dates, publication_lag_days=90)
+    assert membership.columns.tolist() == ['FRA', 'FRB']
+
+    # the 2019 report of FRA is published 90 days after its date, FRB has a negative momentum
+    assert membership['FRA'].tolist() == [date >= dt.datetime(2020, 3, 30) for date in screening_dates]
+    assert not membership['FRB'].any()
+    assert membership.equals(screen.run_history(screening_dates, publication_lag_days=90, n_chunks=4))
+
+    # the momentum of a date only uses the quotes known at that date
+    screen = screener.Screener('momentum_1m < -0.02', 'annual')
+    membership = screen.run_history(screening_dates, publication_lag_days=90)
+    for screening_date, members in membership.iterrows():
+        known_prices = prices_panel[prices_panel.index <= screening_date]
+        momentum = compute_market_metrics(known_prices.iloc[-253:], volumes_panel.loc[known_prices.index[-253:]],
+                                          CAC_40_ISIN)['momentum_1m']
+        published = screening_date >= dt.datetime(2019, 3, 31)
+        assert members.tolist() == [published and momentum[isin] < -0.02 for isin in ['FRA', 'FRB']]
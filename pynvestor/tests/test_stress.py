@@ -0,0 +1,39 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from ..models.holdings import Holdings
+from ..models.indices import CAC_40_ISIN
+from ..source.stress import StressTester
+
+
+class PortfolioSnapshot:
+    def __init__(self, holdings, portfolio_market_value):
+        self.holdings = holdings
+        self.portfolio_market_value = portfolio_market_value
+
+
+def test_stress_tester(panel_helpers):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2019-01-01', '2020-12-31')
+    index_returns = rng.normal(0.0, 0.01, len(dates))
+    prices_panel = pd.DataFrame({CAC_40_ISIN: 5000 * np.cumprod(1 + index_returns),
+                                 'ISIN0': 10 * np.cumprod(1 + 2 * index_returns),
+                                 'ISIN1': 20 * np.cumprod(1 + rng.normal(0.0, 0.01, len(dates)))}, index=dates)
+    prices_panel.loc[:'2020-06-30', 'ISIN1'] = np.nan  # listed after the covid window
+
+    holdings = Holdings(['ISIN0', 'ISIN1'], [100, 50])
+    holdings.market_value = holdings.quantity * prices_panel.iloc[-1][['ISIN0', 'ISIN1']].values
+    stress_tester = StressTester(PortfolioSnapshot(holdings, holdings.market_value.sum() + 500.0),
+                                 windows={'Covid': (dt.datetime(2020, 2, 19), dt.datetime(2020, 3, 18))},
+                                 helpers=panel_helpers(prices_panel))
+    stress_tester.add_shock('Market -20%', {CAC_40_ISIN: -0.2})
+    results = stress_tester.run()
+
+    window_prices = prices_panel.loc[['2020-02-19', '2020-03-18']]
+    index_return, asset_return = (window_prices.iloc[1] / window_prices.iloc[0] - 1)[[CAC_40_ISIN, 'ISIN0']]
+    betas = stress_tester.betas
+    assert np.isclose(betas['ISIN0'], 2.0)
+    assert np.isclose(results.loc['Covid', 'pnl'],
+                      holdings.market_value.dot([asset_return, betas['ISIN1'] * index_return]))
+    assert np.isclose(results.loc['Market -20%', 'pnl'], holdings.market_value.dot([-0.4, -0.2 * betas['ISIN1']]))
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from ..source.var_backtest import ValueAtRiskBacktest
+
+
+def test_value_at_risk_backtest():
+    rng = np.random.default_rng(0)
+    navs = pd.Series(100 * np.cumprod(1 + rng.standard_t(4, 1200) * 0.01), index=pd.bdate_range('2016-01-01',
+                                                                                                periods=1200))
+    var_backtest = ValueAtRiskBacktest(navs, window=250, percentile=5)
+
+    returns = navs.pct_change().dropna()
+    expected_values_at_risk = -returns.rolling(250).apply(lambda x: np.sort(x)[11], raw=True).shift(1).dropna()
+    assert np.allclose(var_backtest.backtest['value_at_risk'].values, expected_values_at_risk.values)
+    assert var_backtest.kupiec_test['n_observations'] == len(returns) - 250
+    assert var_backtest.kupiec_test['p_value'] > 0.01
+    assert 0 <= var_backtest.christoffersen_test['conditional_coverage_p_value'] <= 1
+
+
+def test_value_at_risk_backtest_weekly_navs():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2019-01-04', periods=400, freq='7D')
+    navs = pd.Series(100 * np.cumprod(1 + rng.standard_t(4, 400) * 0.02), index=dates)
+
+    # one year of weekly returns per value at risk
+    var_backtest = ValueAtRiskBacktest(navs, percentile=5)
+    assert var_backtest.window == 52
+    assert var_backtest.kupiec_test['n_observations'] == 399 - 52
+    assert var_backtest.sufficient_history
+    assert 0 <= var_backtest.kupiec_test['p_value'] <= 1
+
+    var_backtest = ValueAtRiskBacktest(navs.iloc[:150], percentile=5)
+    assert not var_backtest.sufficient_history
+    assert var_backtest.kupiec_test['p_value'] is None
+    assert var_backtest.christoffersen_test['conditional_coverage_p_value'] is None
@@ -0,0 +1,33 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from ..source.optimizer import _solve_long_only_minimum_variance
+from ..source.walk_forward import WalkForwardOptimizer
+
+
+def test_walk_forward_optimizer(panel_helpers):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2019-01-01', '2020-12-31')
+    returns = rng.normal(0.0, 0.01, (len(dates), 6)) * rng.uniform(0.5, 2.0, 6) + rng.normal(0.0, 0.01, (len(dates), 1))
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates,
+                                columns=[f'ISIN{i}' for i in range(6)])
+    prices_panel.loc[:'2020-03-31', 'ISIN5'] = np.nan  # listed during the walk-forward
+
+    walk_forward = WalkForwardOptimizer(prices_panel.columns.tolist(), dt.datetime(2020, 1, 1), lookback_days=120,
+                                        frequency='W-FRI', min_periods=40, helpers=panel_helpers(prices_panel))
+    weights = walk_forward.run()
+    assert np.allclose(weights.sum(axis=1), 1.0)
+    assert (weights.loc[:'2020-04-30', 'ISIN5'] == 0).all() and (weights.loc['2020-06-30':, 'ISIN5'] > 0).any()
+    assert np.allclose(walk_forward.run(n_segments=4), weights)
+
+    last_date = weights.index[-1]
+    window_returns = walk_forward.returns_panel.loc[:last_date].iloc[-120:]
+    expected_weights = _solve_long_only_minimum_variance(window_returns.cov().values * 252)
+    assert np.allclose(weights.loc[last_date].values, expected_weights)
+
+    # the segments of the other objectives start from the portfolio reached by their warm-up dates
+    for objective in ('max_sharpe', 'risk_parity'):
+        walk_forward = WalkForwardOptimizer(prices_panel.columns.tolist(), dt.datetime(2020, 1, 1), objective=objective,
+                                            lookback_days=120, min_periods=40, helpers=panel_helpers(prices_panel))
+        assert np.allclose(walk_forward.run(n_segments=4), walk_forward.run(), atol=1e-6)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from ..models.holdings import Holdings
+from ..models.transaction import TRANSACTION_TAX_RATE
+from ..source.covariance import EwmaCovariance
+from ..source.what_if import WhatIfSimulator
+
+
+class RiskManagerSnapshot:
+    def __init__(self, prices_panel, quantities, covariance_source=None):
+        returns_panel = prices_panel.pct_change().iloc[1:]
+        self.holdings = Holdings(prices_panel.columns.tolist(), quantities)
+        self.holdings.price = prices_panel.iloc[-1].values
+        self.percentile = 5
+        self.prices_panel = prices_panel
+        self.returns_panel = returns_panel
+        self.covariance_source = covariance_source
+        if covariance_source is not None:
+            self.covariance_matrix = covariance_source.get_covariance(prices_panel.columns.tolist()) * 252
+        else:
+            self.covariance_matrix = returns_panel.cov().values * 252
+        self.annualized_mean_returns = (1 + returns_panel.mean().values) ** 252 - 1
+        self.histo_price_changes = prices_panel.diff().iloc[1:].values
+        self.cash = 1000.0
+
+
+def test_what_if_simulator():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', periods=301)
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0, 0.01, (len(dates), 5)), axis=0), index=dates,
+                                columns=[f'ISIN{i}' for i in range(5)])
+    risk_manager = RiskManagerSnapshot(prices_panel, rng.integers(1, 100, 5))
+    prices = risk_manager.holdings.price
+    simulator = WhatIfSimulator(risk_manager, risk_free_rate=0.01)
+    trades = [{'isin': 'ISIN1', 'quantity': 10},
+              {'isin': 'ISIN3', 'quantity': -5, 'price': 50.0, 'fee': 1.0},
+              {'isin': 'ISIN1', 'quantity': 3}]
+
+    # Full recomputation after the trades
+    quantities = risk_manager.holdings.quantity.copy()
+    quantities[1] += 13
+    quantities[3] -= 5
+    cash = risk_manager.cash - 13 * prices[1] * (1 + TRANSACTION_TAX_RATE) + 5 * 50.0 - 1.0
+    market_values = quantities * prices
+    weights = market_values / (cash + market_values.sum())
+    volatility = np.sqrt(weights.dot(risk_manager.covariance_matrix).dot(weights))
+    losses = np.sort(risk_manager.histo_price_changes.dot(quantities) * -1)
+    value_at_risk = losses[-15]
+
+    score = simulator.score(trades)
+    assert np.isclose(score['portfolio_market_value'], cash + market_values.sum())
+    assert np.isclose(score['annualized_portfolio_volatility'], volatility)
+    assert np.isclose(score['portfolio_value_at_risk'], value_at_risk)
+    assert simulator.cash == risk_manager.cash  # scoring does not modify the simulator
+
+    simulator.apply(trades)
+    assert np.isclose(simulator.metrics['annualized_portfolio_volatility'], volatility)
+    assert np.isclose(simulator.score([])['portfolio_value_at_risk'], value_at_risk)
+
+
+def test_what_if_new_isin(panel_helpers):
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range('2020-01-01', periods=300)
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0, 0.01, (len(dates), 4)), axis=0), index=dates,
+                                columns=[f'ISIN{i}' for i in range(4)])
+    quantities = np.array([10.0, 20.0, 30.0])
+    simulator = WhatIfSimulator(RiskManagerSnapshot(prices_panel.iloc[:, :3], quantities), risk_free_rate=0.01,
+                                helpers=panel_helpers(prices_panel))
+    expected_simulator = WhatIfSimulator(RiskManagerSnapshot(prices_panel, np.append(quantities, 0.0)),
+                                         risk_free_rate=0.01)
+
+    trades = [{'isin': 'ISIN3', 'quantity': 15}, {'isin': 'ISIN0', 'quantity': -5}]
+    score, expected_score = simulator.score(trades), expected_simulator.score(trades)
+    for metric in ('portfolio_market_value', 'annualized_portfolio_volatility', 'portfolio_sharpe_ratio',
+                   'portfolio_value_at_risk'):
+        assert np.isclose(score[metric], expected_score[metric])
+    assert 'ISIN3' not in simulator.quantities  # scored on a temporary extension of the simulator
+    assert simulator.score(trades, with_weights=True)['weights'].keys() == {f'ISIN{i}' for i in range(4)}
+
+    simulator.apply(trades)
+    assert simulator.quantities['ISIN3'] == 15.0
+
+
+def test_what_if_new_isin_covariance_source(panel_helpers):
+    rng = np.random.default_rng(2)
+    dates = pd.bdate_range('2020-01-01', periods=300)
+    prices_panel = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0, 0.01, (len(dates), 5)), axis=0), index=dates,
+                                columns=[f'ISIN{i}' for i in range(5)])
+    covariance_source = EwmaCovariance(prices_panel.columns[:4].tolist())
+    covariance_source.update_from_returns(prices_panel.pct_change().iloc[1:])
+    covariance_source.reindex(prices_panel.columns.tolist())  # ISIN4 is not observed by the source
+    quantities = np.array([10.0, 20.0, 30.0])
+    simulator = WhatIfSimulator(RiskManagerSnapshot(prices_panel.iloc[:, :3], quantities, covariance_source),
+                                risk_free_rate=0.01, helpers=panel_helpers(prices_panel))
+
+    # the covariances of an isin observed by the source are read from it
+    expected_simulator = WhatIfSimulator(RiskManagerSnapshot(prices_panel.iloc[:, :4], np.append(quantities, 0.0),
+                                                                  covariance_source), risk_free_rate=0.01)
+    trades = [{'isin': 'ISIN3', 'quantity': 15}]
+    assert np.isclose(simulator.score(trades)['annualized_portfolio_volatility'],
+                      expected_simulator.score(trades)['annualized_portfolio_volatility'])
+
+    # the others fall back to the sample covariance, the spliced matrix stays positive semi-definite
+    simulator.apply([{'isin': 'ISIN4', 'quantity': 15}])
+    assert np.isfinite(simulator.metrics['annualized_portfolio_volatility'])
+    assert np.linalg.eigvalsh(simulator._covariance_matrix)[0] > -1e-12